@@ -0,0 +1,81 @@
+"""
+订单状态批量更新: 逐条 update_order_status vs 按分表分批的 update_orders_status, 每秒更新的订单数
+
+用法(在项目根目录下执行, 需要可用的 MySQL 与 Redis):
+    python -m benchmark.bench_order_status [--orders 20000] [--chunk-size 500]
+
+测试订单写入各分表后在结束时删除, user_id 使用不存在的用户, 不影响真实数据
+"""
+import argparse
+import time
+from typing import List
+
+from service.order_service import OrderService
+
+BENCH_USER_ID_START = 900000000
+BENCH_SALE_ID = 900000000
+
+
+def insert_orders(service: OrderService, count: int) -> List[str]:
+    """按分表批量写入测试订单, 返回订单ID"""
+    shard_rows = {}
+    for i, snowflake_id in enumerate(service.id_generator.next_ids(count)):
+        user_id = BENCH_USER_ID_START + i
+        slot = service.partitioning.get_slot(user_id, 1, BENCH_SALE_ID)
+        table_name = service.partitioning.get_table_name_by_index(service.partitioning.get_table_index_by_slot(slot))
+        shard_rows.setdefault(table_name, []).append(
+            (service._format_order_id(snowflake_id, slot), user_id, 1, BENCH_SALE_ID, 'PENDING')
+        )
+
+    order_ids = []
+    for table_name, rows in shard_rows.items():
+        for start in range(0, len(rows), 1000):
+            chunk = rows[start:start + 1000]
+            service.db.execute_sql(
+                f'INSERT INTO {table_name} (order_id, user_id, product_id, sale_id, order_status) VALUES '
+                + ', '.join(['(%s, %s, %s, %s, %s)'] * len(chunk)),
+                tuple(value for row in chunk for value in row)
+            )
+        order_ids.extend(row[0] for row in rows)
+    return order_ids
+
+
+def delete_orders(service: OrderService):
+    for table_name in service.partitioning.get_table_names():
+        service.db.execute_sql(f'DELETE FROM {table_name} WHERE sale_id = %s', (BENCH_SALE_ID,))
+
+
+def bench(name: str, service: OrderService, update, count: int) -> dict:
+    order_ids = insert_orders(service, count)
+    try:
+        start = time.perf_counter()
+        updated = update(order_ids)
+        elapsed = time.perf_counter() - start
+    finally:
+        delete_orders(service)
+    return {'path': name, 'orders_per_sec': count / elapsed, 'updated': updated}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--orders', type=int, default=20000)
+    parser.add_argument('--chunk-size', type=int, default=500)
+    args = parser.parse_args()
+
+    service = OrderService()
+    delete_orders(service)
+    candidates = [
+        ('single', lambda order_ids: sum(service.update_order_status(order_id, 'COMPLETED') for order_id in order_ids)),
+        ('bulk', lambda order_ids: list(
+            service.update_orders_status(order_ids, 'COMPLETED', chunk_size=args.chunk_size).values()
+        ).count(OrderService.UPDATED)),
+    ]
+
+    print(f"{'path':<10}{'orders/s':>14}{'updated':>10}")
+    for name, update in candidates:
+        result = bench(name, service, update, args.orders)
+        print(f"{result['path']:<10}{result['orders_per_sec']:>14.0f}{result['updated']:>10}")
+
+
+if __name__ == '__main__':
+    main()
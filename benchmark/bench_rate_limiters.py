@@ -0,0 +1,74 @@
+"""
+限流算法对比: 每次 acquire 的 Redis 命令数、吞吐与每个键占用的内存
+
+用法(在项目根目录下执行, 需要可用的 Redis):
+    python -m benchmark.bench_rate_limiters [--keys 10000] [--requests 50000]
+"""
+import argparse
+import random
+import time
+
+from util.token_bucket import LIMITER_ENGINES
+
+NAMESPACE = 'bench_rate_limiters'
+
+
+def _command_calls(client) -> int:
+    """Redis 启动以来执行的命令总数(包含脚本内部执行的命令)"""
+    return sum(stat['calls'] for stat in client.info('commandstats').values())
+
+
+def _clean(client):
+    keys = client.keys(f'{NAMESPACE}:*')
+    for i in range(0, len(keys), 1000):
+        client.delete(*keys[i:i + 1000])
+
+
+def bench_engine(algorithm: str, num_keys: int, num_requests: int) -> dict:
+    limiter = LIMITER_ENGINES[algorithm](rate=10, capacity=20, namespace=NAMESPACE)
+    client = limiter.redis_client
+    _clean(client)
+
+    # 每个键先访问一次, 使所有键都已创建
+    for key in range(num_keys):
+        limiter.acquire(key=key)
+
+    calls_before = _command_calls(client)
+    start = time.perf_counter()
+    for _ in range(num_requests):
+        limiter.acquire(key=random.randrange(num_keys))
+    elapsed = time.perf_counter() - start
+    # 减去 INFO 命令本身
+    calls = _command_calls(client) - calls_before - 1
+
+    sample = random.sample(range(num_keys), min(num_keys, 200))
+    memory = [client.memory_usage(limiter._get_bucket_keys(key)[0], samples=0) or 0 for key in sample]
+
+    _clean(client)
+    return {
+        'algorithm': algorithm,
+        'commands_per_acquire': calls / num_requests,
+        'acquire_per_sec': num_requests / elapsed,
+        'bytes_per_key': sum(memory) / len(memory),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--keys', type=int, default=10000)
+    parser.add_argument('--requests', type=int, default=50000)
+    args = parser.parse_args()
+
+    print(f"{'algorithm':<16}{'cmds/acquire':>14}{'acquire/s':>12}{'bytes/key':>12}")
+    for algorithm in LIMITER_ENGINES:
+        result = bench_engine(algorithm, args.keys, args.requests)
+        print(
+            f"{result['algorithm']:<16}"
+            f"{result['commands_per_acquire']:>14.2f}"
+            f"{result['acquire_per_sec']:>12.0f}"
+            f"{result['bytes_per_key']:>12.1f}"
+        )
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,73 @@
+"""
+商品列表响应的 JSON 编码耗时: Flask jsonify / 标准库编码器 / orjson 编码器
+
+用法(在项目根目录下执行):
+    python -m benchmark.bench_response_encoding [--items 10000] [--rounds 20]
+"""
+import argparse
+import time
+from datetime import datetime, timedelta
+from decimal import Decimal
+
+from flask import Flask, jsonify
+
+from util.response_util import OrjsonEncoder, ResponseUtil, StdlibEncoder, orjson
+
+
+def build_products(num_items: int) -> list:
+    created_at = datetime(2024, 1, 1)
+    return [
+        {
+            'id': i,
+            'name': f'商品{i}',
+            'description': '秒杀商品描述' * 4,
+            'price': Decimal('99.90') + i,
+            'stock': 1000 - i % 1000,
+            'created_at': created_at + timedelta(seconds=i)
+        } for i in range(num_items)
+    ]
+
+
+def bench(name: str, render, rounds: int) -> dict:
+    size = len(render())
+    start = time.perf_counter()
+    for _ in range(rounds):
+        render()
+    elapsed = (time.perf_counter() - start) / rounds
+    return {'encoder': name, 'ms_per_response': elapsed * 1000, 'bytes': size}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--items', type=int, default=10000)
+    parser.add_argument('--rounds', type=int, default=20)
+    args = parser.parse_args()
+
+    products = build_products(args.items)
+    app = Flask(__name__)
+
+    def render_jsonify():
+        # 改造前的 success 路径
+        return jsonify({'status': 'success', 'message': 'List product success', 'data': {'products': products}}).get_data()
+
+    def render_with(encoder):
+        def render():
+            ResponseUtil.set_encoder(encoder)
+            return ResponseUtil.success(message='List product success', data={'products': products}).get_data()
+        return render
+
+    candidates = [('jsonify', render_jsonify), ('json', render_with(StdlibEncoder))]
+    if orjson is not None:
+        candidates.append(('orjson', render_with(OrjsonEncoder)))
+
+    default_encoder = ResponseUtil.encoder
+    print(f"{'encoder':<10}{'ms/response':>14}{'bytes':>12}")
+    with app.app_context():
+        for name, render in candidates:
+            result = bench(name, render, args.rounds)
+            print(f"{result['encoder']:<10}{result['ms_per_response']:>14.2f}{result['bytes']:>12}")
+    ResponseUtil.set_encoder(default_encoder)
+
+
+if __name__ == '__main__':
+    main()
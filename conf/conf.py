@@ -11,35 +11,73 @@ class FlaskConfig:
 
 
 class LimiterConfig:
-    def __init__(self, namespace, rate, cap):
+    def __init__(self, namespace, rate, cap, key=None, lease=False, algorithm='token_bucket'):
         self.namespace = namespace
         self.rate = rate
         self.cap = cap
+        self.key = key
+        self.lease = lease
+        self.algorithm = algorithm
 
 
 class MySQLConfig:
-    def __init__(self, host, port, user, password, database):
+    def __init__(self, host, port, user, password, database, max_connections=32, stale_timeout=300, wait_timeout=10):
         self.host = host
         self.port = port
         self.user = user
         self.password = password
         self.database = database
+        self.max_connections = max_connections
+        self.stale_timeout = stale_timeout
+        self.wait_timeout = wait_timeout
 
 
 class RedisConfig:
-    def __init__(self, host, port, db, password):
+    def __init__(self, host, port, db, password, max_connections=50, socket_timeout=5, health_check_interval=30):
         self.host = host
         self.port = port
         self.db = db
         self.password = password
+        self.max_connections = max_connections
+        self.socket_timeout = socket_timeout
+        self.health_check_interval = health_check_interval
 
 
 class RabbitMQConfig:
-    def __init__(self, host, port, user, password):
+    def __init__(self, host, port, user, password, pool_size=8):
         self.host = host
         self.port = port
         self.user = user
         self.password = password
+        self.pool_size = pool_size
+
+
+class ShardingConfig:
+    def __init__(self, shards, virtual_nodes=160, previous_shards=None):
+        self.shards = shards
+        self.virtual_nodes = virtual_nodes
+        self.previous_shards = previous_shards
+
+
+class IdGeneratorConfig:
+    def __init__(self, node_id=None, allocate_node_id=True, pid_node_id=False, max_backward_ms=1000):
+        self.node_id = node_id
+        self.allocate_node_id = allocate_node_id
+        self.pid_node_id = pid_node_id
+        self.max_backward_ms = max_backward_ms
+
+
+class StockLedgerConfig:
+    def __init__(self, shards=1):
+        self.shards = shards
+
+
+class OrderTimeoutConfig:
+    def __init__(self, payment_timeout=900, batch_size=500, interval=1.0, lease=60):
+        self.payment_timeout = payment_timeout
+        self.batch_size = batch_size
+        self.interval = interval
+        self.lease = lease
 
 
 class EmailConfig:
@@ -70,6 +108,10 @@ class Conf:
         self.mysql = MySQLConfig(**config_data['database']['mysql'])
         self.redis = RedisConfig(**config_data['database']['redis'])
         self.rabbitmq = RabbitMQConfig(**config_data['messaging']['rabbitmq'])
+        self.order_sharding = ShardingConfig(**config_data['sharding']['orders'])
+        self.id_generator = IdGeneratorConfig(**config_data.get('id_generator', {}))
+        self.order_timeout = OrderTimeoutConfig(**config_data.get('order_timeout', {}))
+        self.stock_ledger = StockLedgerConfig(**config_data.get('stock_ledger', {}))
         self.email = EmailConfig(**config_data['email'])
 
 
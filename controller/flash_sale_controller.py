@@ -0,0 +1,186 @@
+import math
+from datetime import datetime
+
+from cerberus import Validator
+from flask import Blueprint, request
+
+from service.flash_sale_service import FlashSaleService
+from service.order_service import OrderService
+from service.product_service import ProductService
+from util.jwt_redis import JWTRedis
+from util.response_util import ResponseUtil
+from util.sold_out_flags import sold_out_flags
+from util.stock_ledger import StockLedger
+from util.token_bucket import multi_limiter
+
+
+def _parse_datetime(value):
+    return datetime.strptime(value, '%Y-%m-%d %H:%M:%S')
+
+
+class FlashSaleController:
+    def __init__(self):
+        self.flash_sale_service = FlashSaleService()
+        self.order_service = OrderService()
+        self.product_service = ProductService()
+        self.jwt_redis = JWTRedis()
+        self.flash_sale_bp = Blueprint('flash_sale_controller', __name__)
+        self.setup_routes()
+
+    def setup_routes(self):
+        self.flash_sale_bp.add_url_rule('/create', 'flash_sale_create', self.create_sale, methods=['POST'])
+        self.flash_sale_bp.add_url_rule('/warm_up', 'flash_sale_warm_up', self.warm_up, methods=['POST'])
+        self.flash_sale_bp.add_url_rule('/increase_stock', 'flash_sale_increase_stock', self.increase_stock, methods=['POST'])
+        self.flash_sale_bp.add_url_rule('/info', 'flash_sale_info', self.sale_info, methods=['GET'])
+        self.flash_sale_bp.add_url_rule('/buy', 'flash_sale_buy', self.buy, methods=['POST'])
+
+    def create_sale(self):
+        json_data = request.get_json()
+
+        v = Validator({
+            'product_id': {'type': 'integer', 'min': 1, 'required': True, 'empty': False},
+            'start_time': {'type': 'datetime', 'required': True, 'coerce': _parse_datetime},
+            'end_time': {'type': 'datetime', 'required': True, 'coerce': _parse_datetime},
+            'total_stock': {'type': 'integer', 'min': 1, 'required': True, 'empty': False},
+        })
+        if not v.validate(json_data):
+            return ResponseUtil.error(message=v.errors)
+        sale_data = v.document
+
+        if sale_data['start_time'] >= sale_data['end_time']:
+            return ResponseUtil.error(message='start_time must be earlier than end_time')
+
+        product = self.product_service.get_product_by_id(sale_data['product_id'])
+        if product is None:
+            return ResponseUtil.error(message=f'Product {sale_data["product_id"]} does not exist')
+
+        sale_id = self.flash_sale_service.create_sale(
+            product_id=product.product_id,
+            start_time=sale_data['start_time'],
+            end_time=sale_data['end_time'],
+            total_stock=sale_data['total_stock']
+        )
+        if sale_id is None:
+            return ResponseUtil.error(message='Create flash sale failed: insufficient product stock')
+
+        return ResponseUtil.success(message='Create flash sale success', data={'sale_id': sale_id})
+
+    def warm_up(self):
+        json_data = request.get_json()
+
+        v = Validator({
+            'sale_id': {'type': 'integer', 'min': 1, 'required': True, 'empty': False},
+        })
+        if not v.validate(json_data):
+            return ResponseUtil.error(message=v.errors)
+
+        if not self.flash_sale_service.warm_up_stock(json_data['sale_id']):
+            return ResponseUtil.error(message=f'Flash sale {json_data["sale_id"]} does not exist')
+
+        return ResponseUtil.success(message='Warm up flash sale success')
+
+    def increase_stock(self):
+        json_data = request.get_json()
+
+        v = Validator({
+            'sale_id': {'type': 'integer', 'min': 1, 'required': True, 'empty': False},
+            'amount': {'type': 'integer', 'min': 1, 'required': True, 'empty': False},
+        })
+        if not v.validate(json_data):
+            return ResponseUtil.error(message=v.errors)
+
+        if not self.flash_sale_service.increase_stock(json_data['sale_id'], json_data['amount']):
+            return ResponseUtil.error(message='Increase flash sale stock failed: sale does not exist or insufficient product stock')
+
+        return ResponseUtil.success(message='Increase flash sale stock success')
+
+    def sale_info(self):
+        v = Validator({
+            'sale_id': {'type': 'integer', 'min': 1, 'required': True, 'coerce': int},
+        })
+        if not v.validate(request.args.to_dict()):
+            return ResponseUtil.error(message=v.errors)
+        sale_id = v.document['sale_id']
+
+        sale_meta = self.flash_sale_service.get_sale_meta(sale_id)
+        if sale_meta is None:
+            return ResponseUtil.error(message=f'Flash sale {sale_id} does not exist')
+
+        ledger = self.flash_sale_service.stock_ledger.get_ledger(sale_id)
+        return ResponseUtil.success(
+            message='Get flash sale success',
+            data={
+                'sale_id': sale_id,
+                'product_id': sale_meta['product_id'],
+                'start_time': sale_meta['start_time'].strftime('%Y-%m-%d %H:%M:%S'),
+                'end_time': sale_meta['end_time'].strftime('%Y-%m-%d %H:%M:%S'),
+                'total_stock': ledger.get('total'),
+                'stock': ledger.get('stock')
+            }
+        )
+
+    def buy(self):
+        """
+        抢购入口, 依次经过: 本地售罄标记 -> JWT 签名 -> 按用户/IP限流 -> token 校验 -> 时间窗口 -> 库存预占与一人一单 -> 异步下单
+        整条路径不访问 MySQL, 订单由消费进程批量落库
+        """
+        json_data = request.get_json(silent=True)
+
+        v = Validator({
+            'sale_id': {'type': 'integer', 'min': 1, 'required': True, 'empty': False},
+        })
+        if not v.validate(json_data):
+            return ResponseUtil.error(message=v.errors)
+        sale_id = json_data['sale_id']
+
+        # 售罄后的请求直接拒绝, 不经过限流与 token 校验
+        if sold_out_flags.is_sold_out(sale_id):
+            return ResponseUtil.error(message='Sold out')
+
+        # 先在本地校验签名取出用户ID, 用于按用户限流
+        token = request.headers.get('Authorization', '').removeprefix('Bearer ')
+        payload = self.jwt_redis.decode_token(token) if token else None
+        if payload is None:
+            return ResponseUtil.error(message='Invalid or expired token', status_code=401)
+        # uid 格式为 {user_id}_{username}, 见 UserController.login
+        user_id = int(payload['user_id'].split('_', 1)[0])
+
+        identity = {
+            'user': user_id,
+            'ip': request.headers.get('X-Real-IP', request.remote_addr)
+        }
+        allowed, _, _, retry_after = multi_limiter.try_acquire(identity=identity)
+        if not allowed:
+            headers = {'Retry-After': str(math.ceil(retry_after))} if retry_after >= 0 else None
+            return ResponseUtil.error(
+                message='Too many requests',
+                data={'retry_after': retry_after if retry_after >= 0 else None},
+                status_code=429,
+                headers=headers
+            )
+
+        if self.jwt_redis.verify_token(token) is None:
+            return ResponseUtil.error(message='Invalid or expired token', status_code=401)
+
+        sale_meta = self.flash_sale_service.get_sale_meta(sale_id)
+        if sale_meta is None:
+            return ResponseUtil.error(message=f'Flash sale {sale_id} does not exist', status_code=404)
+        now = datetime.now()
+        if now < sale_meta['start_time']:
+            return ResponseUtil.error(message='Flash sale has not started')
+        if now >= sale_meta['end_time']:
+            return ResponseUtil.error(message='Flash sale has ended')
+
+        result, ticket = self.order_service.place_order(user_id, sale_meta['product_id'], sale_id)
+        if result == StockLedger.DUPLICATE:
+            return ResponseUtil.error(message='Already purchased in this flash sale', status_code=409)
+        if result == StockLedger.SOLD_OUT:
+            return ResponseUtil.error(message='Sold out')
+        if result != StockLedger.ADMITTED:
+            return ResponseUtil.error(message='Flash sale is not available, please retry', status_code=503)
+
+        return ResponseUtil.success(
+            message='Order queued',
+            data={'ticket': ticket},
+            status_code=202
+        )
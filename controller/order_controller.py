@@ -0,0 +1,67 @@
+from cerberus import Validator
+from flask import Blueprint, request
+
+from service.order_service import ORDER_COLUMNS, OrderService
+from util.jwt_redis import JWTRedis
+from util.response_util import ResponseUtil
+
+
+class OrderController:
+    def __init__(self):
+        self.order_service = OrderService()
+        self.jwt_redis = JWTRedis()
+        self.order_bp = Blueprint('order_controller', __name__)
+        self.setup_routes()
+
+    def setup_routes(self):
+        self.order_bp.add_url_rule('/status', 'order_status', self.order_status, methods=['GET'])
+        self.order_bp.add_url_rule('/mine', 'my_orders', self.my_orders, methods=['GET'])
+
+    def order_status(self):
+        v = Validator({
+            'ticket': {'type': 'string', 'regex': r'^[0-9a-f]{32}$', 'required': True},
+        })
+        if not v.validate(request.args.to_dict()):
+            return ResponseUtil.error(message=v.errors)
+
+        ticket_status = self.order_service.get_ticket_status(request.args['ticket'])
+        if ticket_status is None:
+            return ResponseUtil.error(message='Ticket does not exist', status_code=404)
+
+        return ResponseUtil.success(
+            message='Get order status success',
+            data={
+                'ticket': request.args['ticket'],
+                'status': ticket_status['status'],
+                'order_id': ticket_status.get('order_id')
+            }
+        )
+
+    def my_orders(self):
+        """当前用户的订单, 按下单时间倒序, 经用户订单索引定向查询分表"""
+        token = request.headers.get('Authorization', '').removeprefix('Bearer ')
+        payload = self.jwt_redis.verify_token(token) if token else None
+        if payload is None:
+            return ResponseUtil.error(message='Invalid or expired token', status_code=401)
+        # uid 格式为 {user_id}_{username}, 见 UserController.login
+        user_id = int(payload['user_id'].split('_', 1)[0])
+
+        v = Validator({
+            'status': {'type': 'string', 'allowed': ['PENDING', 'COMPLETED', 'CANCELLED']},
+            'offset': {'type': 'integer', 'coerce': int, 'min': 0},
+            'limit': {'type': 'integer', 'coerce': int, 'min': 1, 'max': 100},
+        })
+        if not v.validate(request.args.to_dict()):
+            return ResponseUtil.error(message=v.errors)
+        args = v.document
+
+        orders = self.order_service.get_orders_by_user(
+            user_id,
+            status=args.get('status'),
+            offset=args.get('offset', 0),
+            limit=args.get('limit', 20)
+        )
+        return ResponseUtil.success(
+            message='Get orders success',
+            data=[dict(zip(ORDER_COLUMNS, order)) for order in orders]
+        )
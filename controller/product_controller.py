@@ -1,10 +1,11 @@
 from itertools import product
 
-from service.product_service import ProductService
+from service.product_service import MAX_PAGE_SIZE, PRODUCT_FIELDS, PRODUCT_RESPONSE_GROUP, ProductService
 from flask import Blueprint, request, jsonify
 from cerberus import Validator
 from util.jwt_redis import JWTRedis
 
+from util.response_cache import response_cache
 from util.response_util import ResponseUtil
 
 class ProductController:
@@ -17,7 +18,9 @@ class ProductController:
         self.product_bp.add_url_rule('/create', 'product_create', self.create_product, methods=['POST'])
         self.product_bp.add_url_rule('/update', 'product_update', self.update_product, methods=['POST'])
         self.product_bp.add_url_rule('/delete', 'product_delete', self.delete_product, methods=['POST'])
-        self.product_bp.add_url_rule('/list', 'product_list', self.list_product, methods=['GET'])
+        self.product_bp.add_url_rule(
+            '/list', 'product_list', response_cache.cached(PRODUCT_RESPONSE_GROUP)(self.list_product), methods=['GET']
+        )
         self.product_bp.add_url_rule('/incr_stock', 'product_incr_stock', self.incr_stock, methods=['POST'])
         self.product_bp.add_url_rule('/decr_stock', 'product_decr_stock', self.decr_stock, methods=['POST'])
 
@@ -94,25 +97,33 @@ class ProductController:
         return ResponseUtil.success(message='Delete product success')
 
     def list_product(self):
-        product_list = self.product_service.get_all_products()
-        if not product_list:
+        v = Validator({
+            'after_id': {'type': 'integer', 'min': 0, 'required': False, 'coerce': int},
+            'limit': {'type': 'integer', 'min': 1, 'max': MAX_PAGE_SIZE, 'required': False, 'coerce': int},
+            'fields': {
+                'type': 'list',
+                'allowed': list(PRODUCT_FIELDS),
+                'required': False,
+                'coerce': lambda value: value.split(',')
+            },
+        })
+        if not v.validate(request.args.to_dict()):
+            return ResponseUtil.error(message=v.errors)
+        after_id = v.document.get('after_id', 0)
+
+        products, next_after_id = self.product_service.get_products_page(
+            after_id=after_id,
+            limit=v.document.get('limit', 20),
+            fields=v.document.get('fields')
+        )
+        if not products and after_id == 0:
             return ResponseUtil.error(message='No products found')
 
-        products = [
-            {
-                'id': product.product_id,
-                'name': product.name,
-                'description': product.description,
-                'price': product.price,
-                'stock': product.stock,
-                'created_at': product.created_at
-            } for product in product_list
-        ]
-        return ResponseUtil.success(
+        return ResponseUtil.stream_success(
             message='List product success',
-            data={
-                'products': products
-            }
+            items=products,
+            items_key='products',
+            extra={'next_after_id': next_after_id}
         )
 
     def incr_stock(self):
@@ -10,6 +10,8 @@ from util.response_util import ResponseUtil
 class UserController:
     def __init__(self):
         self.user_service = UserService()
+        self.jwt_redis = JWTRedis()
+        self.email_verify_util = EmailVerifyUtil()
         self.user_bp = Blueprint('user_controller', __name__)
         self.setup_routes()
 
@@ -45,9 +47,8 @@ class UserController:
             if user_id is None:
                 return ResponseUtil.error(message='User reg failed: unknown error')
 
-            jwt_redis = JWTRedis()
             uid = f"{user_id}_{json_data['username']}"
-            token_dict = jwt_redis.generate_token(uid)
+            token_dict = self.jwt_redis.generate_token(uid)
             token: str = token_dict['token']
 
             return ResponseUtil.success(
@@ -77,9 +78,8 @@ class UserController:
             return ResponseUtil.error(message='Username does not exist')
 
         if self.user_service.login(json_data['username'], json_data['password']):
-            jwt_redis = JWTRedis()
             uid = f"{user.user_id}_{user.username}"
-            token_dict = jwt_redis.generate_token(uid)
+            token_dict = self.jwt_redis.generate_token(uid)
             token: str = token_dict['token']
 
             return ResponseUtil.success(
@@ -108,8 +108,7 @@ class UserController:
             return ResponseUtil.error(message='Username does not exist')
         user_email = user.email
 
-        email_verify_util = EmailVerifyUtil()
-        email_verify_util.send_verify_code(user_email)
+        self.email_verify_util.send_verify_code(user_email)
 
         return ResponseUtil.success(message='Verification code sent')
 
@@ -129,8 +128,7 @@ class UserController:
             return ResponseUtil.error(message='Username does not exist')
         user_email = user.email
 
-        email_verify_util = EmailVerifyUtil()
-        verify_success = email_verify_util.verify(user_email, json_data['verify_code'])
+        verify_success = self.email_verify_util.verify(user_email, json_data['verify_code'])
 
         if not verify_success:
             return ResponseUtil.error(message='Invalid verification code')
@@ -46,4 +46,24 @@ CREATE TABLE flash_sale_records (
                                     FOREIGN KEY (user_id) REFERENCES users(user_id),
                                     FOREIGN KEY (sale_id) REFERENCES flash_sales(sale_id),
                                     UNIQUE (user_id, sale_id)  -- 确保用户对每个秒杀活动只能参与一次
-);
\ No newline at end of file
+);
+
+-- 订单分表, 分表数见 conf.yaml 中的 sharding.orders.shards, 扩容时由 service/order_reshard_service.py 创建新表
+CREATE TABLE orders_0 (
+                          order_id VARCHAR(255) PRIMARY KEY,
+                          user_id INT NOT NULL,
+                          product_id INT NOT NULL,
+                          sale_id INT NOT NULL,
+                          order_status ENUM('PENDING', 'COMPLETED', 'CANCELLED') DEFAULT 'PENDING',
+                          created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+                          -- 已取消的订单为 NULL, 不参与唯一约束, 用户取消后可以重新下单
+                          active_sale_id INT AS (IF(order_status = 'CANCELLED', NULL, sale_id)) STORED,
+                          INDEX (user_id, product_id, sale_id),
+                          INDEX (created_at),  -- 跨分表按创建时间归并查询, 二级索引隐含主键 order_id
+                          -- 一人一单: 同一活动的订单路由到同一分表, 由唯一键去重, 下单时无需加锁查询
+                          UNIQUE KEY uk_user_sale (user_id, active_sale_id)
+);
+
+CREATE TABLE orders_1 LIKE orders_0;
+CREATE TABLE orders_2 LIKE orders_0;
+CREATE TABLE orders_3 LIKE orders_0;
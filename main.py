@@ -5,14 +5,19 @@ import time
 from datetime import datetime
 from multiprocessing import Process
 
-from flask import Flask
+from flask import Flask, request
 from flask_cors import CORS
-from peewee import MySQLDatabase
 
 from conf.conf import conf
+from controller.flash_sale_controller import FlashSaleController
+from controller.order_controller import OrderController
 from controller.product_controller import ProductController
 from controller.user_controller import UserController
+from model.base_model import db, get_pool_stats
+from service.flash_sale_service import FlashSaleService
+from service.order_service import OrderService
 from util.email_verify_util import EmailVerifyUtil
+from util.response_util import ResponseUtil
 
 app = Flask(__name__)
 CORS(app)
@@ -25,12 +30,38 @@ def ping():
     print("success")
     return 'pong'
 
+@app.get('/metrics/db_pool')
+def db_pool_metrics():
+    return ResponseUtil.success(message='Get db pool metrics success', data=get_pool_stats())
+
+# 不访问 MySQL 的接口, 请求期间不占用连接池
+DB_FREE_ENDPOINTS = {
+    'index',
+    'ping',
+    'db_pool_metrics',
+    'flash_sale_controller.flash_sale_buy',
+    'order_controller.order_status'
+}
+
+def open_db_connection():
+    if request.endpoint not in DB_FREE_ENDPOINTS:
+        db.connect(reuse_if_open=True)
+
+def close_db_connection(exc):
+    # 归还到连接池, 而不是断开
+    if not db.is_closed():
+        db.close()
+
 def init_controller():
     app.register_blueprint(UserController().user_bp, url_prefix='/user')
     app.register_blueprint(ProductController().product_bp, url_prefix='/product')
+    app.register_blueprint(OrderController().order_bp, url_prefix='/order')
+    app.register_blueprint(FlashSaleController().flash_sale_bp, url_prefix='/flash_sale')
 
 def flask_app():
     init_controller()
+    app.before_request(open_db_connection)
+    app.teardown_request(close_db_connection)
     app.run(
         host=conf.flask.host,
         port=conf.flask.port,
@@ -41,8 +72,23 @@ def email_verify_consumer():
     process = Process(target=EmailVerifyUtil().email_consumer)
     process.start()
 
+def order_consumer():
+    process = Process(target=OrderService().order_consumer)
+    process.start()
+
+def order_timeout_worker():
+    process = Process(target=OrderService().order_timeout_worker)
+    process.start()
+
+def stock_sync_worker():
+    process = Process(target=FlashSaleService().stock_sync_worker)
+    process.start()
+
 if __name__ == '__main__':
     # email_verify_consumer()
+    # order_consumer()
+    # order_timeout_worker()
+    # stock_sync_worker()
     # flask_app()
     order_str = "order:2:1:3"
     hash_obj = hashlib.sha256(order_str.encode())
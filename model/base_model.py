@@ -1,15 +1,32 @@
 from peewee import *
+from playhouse.pool import PooledMySQLDatabase
+
 from conf.conf import conf
 
-db = MySQLDatabase(
+# 连接池: 每个线程从池中取连接, 用完归还而不是断开;
+# 连接数达到上限时最多等待 wait_timeout 秒, 不会无限新建连接
+db = PooledMySQLDatabase(
     conf.mysql.database,
     user=conf.mysql.user,
     password=conf.mysql.password,
     host=conf.mysql.host,
-    port=conf.mysql.port
+    port=conf.mysql.port,
+    max_connections=conf.mysql.max_connections,
+    stale_timeout=conf.mysql.stale_timeout,
+    timeout=conf.mysql.wait_timeout
 )
 
+def get_pool_stats() -> dict:
+    """连接池使用情况"""
+    in_use = len(db._in_use)
+    idle = len(db._connections)
+    return {
+        'max_connections': db._max_connections,
+        'in_use': in_use,
+        'idle': idle,
+        'available': db._max_connections - in_use
+    }
+
 class BaseModel(Model):
     class Meta:
         database = db
-
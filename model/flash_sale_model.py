@@ -1,5 +1,5 @@
 from peewee import AutoField, ForeignKeyField, DateTimeField, IntegerField, SQL
-from base_model import BaseModel
+from model.base_model import BaseModel
 from model.product_model import Products
 
 
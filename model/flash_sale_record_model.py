@@ -1,5 +1,5 @@
 from peewee import AutoField, ForeignKeyField, DateTimeField, SQL
-from base_model import BaseModel
+from model.base_model import BaseModel
 from model.flash_sale_model import FlashSales
 from model.user_model import Users
 
@@ -0,0 +1,140 @@
+import logging
+import time
+from datetime import datetime
+from typing import Dict, Optional
+
+from model.base_model import db
+from model.flash_sale_model import FlashSales
+from model.product_model import Products
+from service.product_service import ProductService
+from util.sharded_stock_ledger import create_stock_ledger
+
+logger = logging.getLogger(__name__)
+
+class FlashSaleService:
+    def __init__(self):
+        self.flash_sale = FlashSales()
+        self.stock_ledger = create_stock_ledger()
+        # 活动元数据进程内缓存, 抢购路径上的时间窗口校验不访问MySQL
+        self._sale_meta: Dict[int, Dict] = {}
+
+    def create_sale(self, product_id: int, start_time: datetime, end_time: datetime, total_stock: int) -> Optional[int]:
+        """创建秒杀活动, 从商品库存中划拨秒杀库存并预热账本, 返回活动ID"""
+        try:
+            with db.atomic():
+                allocated = Products.update(
+                    stock=Products.stock - total_stock
+                ).where(
+                    (Products.product_id == product_id) & (Products.stock >= total_stock)
+                ).execute()
+                if not allocated:
+                    return None
+                sale = self.flash_sale.create(
+                    product=product_id,
+                    start_time=start_time,
+                    end_time=end_time,
+                    total_stock=total_stock
+                )
+        except Exception as e:
+            logger.error(f"创建秒杀活动失败: {str(e)}")
+            return None
+
+        # 划拨改变了商品库存
+        ProductService.invalidate_cache(product_id)
+        self.stock_ledger.warm_up(sale.sale_id, total_stock)
+        return sale.sale_id
+
+    def increase_stock(self, sale_id: int, amount: int) -> bool:
+        """从商品库存中为秒杀活动追加库存, 账本已预热时同步追加, 售罄标记随之清除"""
+        sale = self.get_sale_by_id(sale_id)
+        if sale is None:
+            return False
+        try:
+            with db.atomic():
+                allocated = Products.update(
+                    stock=Products.stock - amount
+                ).where(
+                    (Products.product_id == sale.product_id) & (Products.stock >= amount)
+                ).execute()
+                if not allocated:
+                    return False
+                self.flash_sale.update(
+                    total_stock=FlashSales.total_stock + amount
+                ).where(FlashSales.sale_id == sale_id).execute()
+        except Exception as e:
+            logger.error(f"追加秒杀库存失败: {str(e)}")
+            return False
+
+        ProductService.invalidate_cache(sale.product_id)
+        # 账本未预热时, 预热会读取新的总库存
+        self.stock_ledger.add_stock(sale_id, amount)
+        return True
+
+    def get_sale_by_id(self, sale_id: int) -> FlashSales:
+        return self.flash_sale.select().where(FlashSales.sale_id == sale_id).first()
+
+    def get_sale_meta(self, sale_id: int) -> Optional[Dict]:
+        """获取活动的商品ID与时间窗口, 优先读取进程内缓存"""
+        meta = self._sale_meta.get(sale_id)
+        if meta is not None:
+            return meta
+
+        sale = self.get_sale_by_id(sale_id)
+        if sale is None:
+            return None
+        meta = {
+            'product_id': sale.product_id,
+            'start_time': sale.start_time,
+            'end_time': sale.end_time
+        }
+        self._sale_meta[sale_id] = meta
+        return meta
+
+    def warm_up_stock(self, sale_id: int) -> bool:
+        """活动开始时将库存从MySQL加载到Redis账本"""
+        sale = self.get_sale_by_id(sale_id)
+        if sale is None:
+            return False
+        self.stock_ledger.warm_up(sale.sale_id, sale.total_stock, sale.sold)
+        return True
+
+    def reserve_stock(self, sale_id: int, amount: int = 1) -> bool:
+        return self.stock_ledger.reserve(sale_id, amount)
+
+    def admit_buyer(self, sale_id: int, user_id: int, amount: int = 1) -> int:
+        return self.stock_ledger.admit(sale_id, user_id, amount)
+
+    def confirm_stock(self, sale_id: int, amount: int = 1, user_id: int = None) -> bool:
+        return self.stock_ledger.confirm(sale_id, amount, user_id)
+
+    def release_stock(self, sale_id: int, amount: int = 1, user_id: int = None) -> bool:
+        return self.stock_ledger.release(sale_id, amount, user_id)
+
+    def sync_sold(self, batch_size: int = 100) -> int:
+        """将账本中的已售数量回写MySQL, 返回回写的活动数"""
+        synced = 0
+        for sale_id in self.stock_ledger.pop_dirty(batch_size):
+            # 顺带补完分片账本中中断的调拨
+            self.stock_ledger.recover_transits(sale_id)
+            ledger = self.stock_ledger.get_ledger(sale_id)
+            if not ledger:
+                continue
+            try:
+                self.flash_sale.update(
+                    sold=ledger['sold']
+                ).where(FlashSales.sale_id == sale_id).execute()
+                synced += 1
+            except Exception as e:
+                logger.error(f"回写已售数量失败: {str(e)}")
+                self.stock_ledger.mark_dirty(sale_id)
+        return synced
+
+    def stock_sync_worker(self, interval: float = 1.0, batch_size: int = 100):
+        """后台回写进程入口"""
+        while True:
+            try:
+                if self.sync_sold(batch_size) >= batch_size:
+                    continue
+            except Exception as e:
+                logger.error(f"库存回写异常: {str(e)}")
+            time.sleep(interval)
@@ -0,0 +1,118 @@
+"""
+订单分表扩缩容迁移
+
+步骤:
+    1. conf.yaml 中 sharding.orders.previous_shards 设为当前分表数, shards 设为目标分表数, 重启应用;
+       此后新订单写入新位置, 读取同时查找新旧位置
+    2. 执行迁移(在项目根目录下):
+           python -m service.order_reshard_service [--batch-size 500] [--pause 0.05]
+    3. 迁移完成后删除 previous_shards 并重启应用
+"""
+import argparse
+import logging
+import time
+from typing import Dict, List, Optional, Tuple
+
+from conf.conf import conf
+from model.base_model import db
+from service.order_service import ORDER_COLUMNS
+from util.hash_partitioning import HashPartitioning
+
+logger = logging.getLogger(__name__)
+
+
+class OrderReshardService:
+    def __init__(
+            self,
+            from_shards: int,
+            to_shards: int,
+            virtual_nodes: int = conf.order_sharding.virtual_nodes,
+            batch_size: int = 500,
+            pause: float = 0.0  # 批次之间的休眠时间, 秒, 用于限制迁移对线上的影响
+    ):
+        self.db = db
+        self.source = HashPartitioning(from_shards, virtual_nodes)
+        self.target = HashPartitioning(to_shards, virtual_nodes)
+        self.batch_size = batch_size
+        self.pause = pause
+
+    def prepare(self):
+        """创建目标分表中尚不存在的表"""
+        template = self.source.get_table_name_by_index(0)
+        for table_name in self.target.get_table_names():
+            self.db.execute_sql(f'CREATE TABLE IF NOT EXISTS {table_name} LIKE {template}')
+
+    def _migrate_batch(self, table_name: str, last_order_id: str) -> Tuple[Optional[str], int]:
+        """
+        迁移一批订单, 只移动目标分表发生变化的订单
+
+        Returns:
+            Tuple[Optional[str], int]: (本批最后一个订单ID, 迁移的订单数), 表已扫描完时订单ID为None
+        """
+        columns = ', '.join(ORDER_COLUMNS)
+        with self.db.atomic():
+            # 锁住本批订单, 迁移过程中并发的状态更新会等待迁移提交后在新位置重试
+            rows = self.db.execute_sql(
+                f'SELECT {columns} FROM {table_name} WHERE order_id > %s ORDER BY order_id LIMIT %s FOR UPDATE',
+                (last_order_id, self.batch_size)
+            ).fetchall()
+            if not rows:
+                return None, 0
+
+            moves: Dict[str, List[tuple]] = {}
+            for row in rows:
+                target_table = self.target.get_table_name(row[1], row[2], row[3])
+                if target_table != table_name:
+                    moves.setdefault(target_table, []).append(row)
+
+            for target_table, moved_rows in moves.items():
+                self.db.execute_sql(
+                    f'INSERT IGNORE INTO {target_table} ({columns}) VALUES '
+                    + ', '.join([f"({', '.join(['%s'] * len(ORDER_COLUMNS))})"] * len(moved_rows)),
+                    tuple(value for row in moved_rows for value in row)
+                )
+                self.db.execute_sql(
+                    f'DELETE FROM {table_name} WHERE order_id IN ({", ".join(["%s"] * len(moved_rows))})',
+                    tuple(row[0] for row in moved_rows)
+                )
+
+        return rows[-1][0], sum(len(moved_rows) for moved_rows in moves.values())
+
+    def migrate_table(self, table_name: str) -> int:
+        """按订单ID顺序分批迁移一张旧分表, 返回迁移的订单数"""
+        moved = 0
+        last_order_id = ''
+        while True:
+            last_order_id, batch_moved = self._migrate_batch(table_name, last_order_id)
+            if last_order_id is None:
+                break
+            moved += batch_moved
+            if self.pause:
+                time.sleep(self.pause)
+        logger.info(f"分表 {table_name} 迁移完成, 迁出 {moved} 条订单")
+        return moved
+
+    def migrate(self) -> Dict[str, int]:
+        """迁移所有旧分表, 返回每张表迁出的订单数"""
+        self.prepare()
+        return {table_name: self.migrate_table(table_name) for table_name in self.source.get_table_names()}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--from-shards', type=int, default=conf.order_sharding.previous_shards)
+    parser.add_argument('--to-shards', type=int, default=conf.order_sharding.shards)
+    parser.add_argument('--batch-size', type=int, default=500)
+    parser.add_argument('--pause', type=float, default=0.0)
+    args = parser.parse_args()
+    if not args.from_shards:
+        parser.error('--from-shards is required when sharding.orders.previous_shards is not set')
+
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+    service = OrderReshardService(args.from_shards, args.to_shards, batch_size=args.batch_size, pause=args.pause)
+    moved = service.migrate()
+    logger.info(f"迁移完成, 共迁出 {sum(moved.values())} 条订单")
+
+
+if __name__ == '__main__':
+    main()
@@ -1,30 +1,141 @@
+import itertools
+import json
 import logging
-from datetime import datetime
-import hashlib
-import base64
-import re
+import time
+import uuid
+from typing import Dict, Iterator, List, Optional, Tuple
+
+from peewee import IntegrityError
+
+from conf.conf import conf
 from model.base_model import db
+from util.connection_registry import connection_registry
 from util.hash_partitioning import HashPartitioning
+from util.id_generator import SnowflakeIdGenerator, create_id_generator
+from util.order_deadline_queue import OrderDeadlineQueue
+from util.order_user_index import OrderUserIndex
+from util.rabbitmq_util import RabbitMQUtil
+from util.redis_util import RedisUtil
+from util.scatter_gather import scatter_gather
+from util.sharded_stock_ledger import create_stock_ledger
+from util.stock_ledger import StockLedger
 
 # 配置日志记录
 logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
 
+ORDER_CREATE_QUEUE = 'order_create_queue'
+# 订单ID = 19 位十进制雪花ID + 4 位路由槽位
+ORDER_ID_SNOWFLAKE_DIGITS = 19
+ORDER_ID_SLOT_DIGITS = 4
+TICKET_EXPIRE = 3600
+# 下单去重键的过期时间, 过期后由分表唯一键兜底
+ORDER_DEDUP_EXPIRE = 86400
+# MySQL 唯一键冲突的错误码
+MYSQL_DUPLICATE_ENTRY = 1062
+ORDER_COLUMNS = ('order_id', 'user_id', 'product_id', 'sale_id', 'order_status', 'created_at')
+
+ORDER_STATUSES = ('PENDING', 'COMPLETED', 'CANCELLED')
+# 超时取消的退款日志: 订单ID -> [用户ID, 活动ID], 取消前写入, 退还库存后删除
+ORDER_REFUND_JOURNAL_KEY = 'order_timeout:refund_journal'
+
+
 class OrderService:
+    # 批量更新订单状态的结果
+    UPDATED = 'UPDATED'
+    NOT_FOUND = 'NOT_FOUND'
+    STATUS_MISMATCH = 'STATUS_MISMATCH'
+    FAILED = 'FAILED'
+
     def __init__(self):
         self.db = db
-        self.partitioning = HashPartitioning(4)
+        self.partitioning = HashPartitioning(conf.order_sharding.shards, conf.order_sharding.virtual_nodes)
+        # 扩缩容迁移期间的旧分表规则, 读取时同时查找新旧位置
+        self.previous_partitioning = None
+        if conf.order_sharding.previous_shards:
+            self.previous_partitioning = HashPartitioning(
+                conf.order_sharding.previous_shards, conf.order_sharding.virtual_nodes
+            )
+        self.redis = RedisUtil()
+        self.stock_ledger = create_stock_ledger()
+        self.id_generator = create_id_generator()
+        self.user_index = OrderUserIndex()
+        # 待支付订单的到期队列, 超时未支付的订单由 order_timeout_worker 取消
+        self.deadline_queue = OrderDeadlineQueue(lease=conf.order_timeout.lease)
+
+    @staticmethod
+    def _get_ticket_key(ticket: str) -> str:
+        return f"order_ticket:{ticket}"
+
+    @staticmethod
+    def _get_order_dedup_key(user_id: int, sale_id: int) -> str:
+        return f"order_dedup:{user_id}:{sale_id}"
+
+    @staticmethod
+    def _is_duplicate_entry(error: IntegrityError) -> bool:
+        return bool(error.args) and error.args[0] == MYSQL_DUPLICATE_ENTRY
+
+    def _get_order_id(self, user_id: int, product_id: int, sale_id: int) -> str:
+        """
+        生成订单ID: 定长的雪花ID保证全局唯一且按时间有序, 末尾的路由槽位使得仅凭订单ID即可定位分表;
+        槽位与分表数无关, 扩缩容后依然有效
+        """
+        return self._format_order_id(self.id_generator.next_id(), self.partitioning.get_slot(user_id, product_id, sale_id))
+
+    @staticmethod
+    def _format_order_id(snowflake_id: int, slot: int) -> str:
+        return f"{snowflake_id:0{ORDER_ID_SNOWFLAKE_DIGITS}d}{slot:0{ORDER_ID_SLOT_DIGITS}d}"
 
     @staticmethod
-    def _get_order_id(user_id: int, product_id: int, sale_id: int) -> str:
-        order_str = f"order:{user_id}:{product_id}:{sale_id}"
-        hash_obj = hashlib.sha256(order_str.encode())
-        hash_base64 = (base64.urlsafe_b64encode(hash_obj.digest())
-                       .decode()
-                       .rstrip('='))
-        order_pre = re.sub(r'[^a-zA-Z0-9]', '', hash_base64)
-        now = datetime.now()
-        timestamp_str = now.strftime('%Y%m%d%H%M%S') + f"{now.microsecond // 1000:03d}"
-        return f"FS{order_pre[2:10]}-{timestamp_str}"
+    def _get_order_created_ms(order_id: str) -> int:
+        """订单ID中雪花ID的时间戳部分, 毫秒"""
+        snowflake_id = int(order_id[:ORDER_ID_SNOWFLAKE_DIGITS])
+        return (snowflake_id >> SnowflakeIdGenerator.TIMESTAMP_SHIFT) + SnowflakeIdGenerator.EPOCH
+
+    @staticmethod
+    def _get_payment_deadline_ms(created_ms: int) -> int:
+        return created_ms + int(conf.order_timeout.payment_timeout * 1000)
+
+    @staticmethod
+    def _parse_order_slot(order_id: str) -> Optional[int]:
+        """从订单ID中取出路由槽位, 旧格式的订单ID返回None"""
+        if len(order_id) != ORDER_ID_SNOWFLAKE_DIGITS + ORDER_ID_SLOT_DIGITS or not order_id.isdigit():
+            return None
+        return int(order_id[-ORDER_ID_SLOT_DIGITS:])
+
+    def _get_candidate_tables_by_slot(self, slot: int) -> List[str]:
+        """
+        槽位对应的订单可能所在的分表, 按查找顺序排列
+
+        迁移期间依次为 新位置、旧位置、新位置: 查找旧位置时订单可能刚好被迁走, 最后再查一次新位置
+        """
+        table_name = self.partitioning.get_table_name_by_index(self.partitioning.get_table_index_by_slot(slot))
+        if self.previous_partitioning is None:
+            return [table_name]
+        previous_table_name = self.previous_partitioning.get_table_name_by_index(
+            self.previous_partitioning.get_table_index_by_slot(slot)
+        )
+        if previous_table_name == table_name:
+            return [table_name]
+        return [table_name, previous_table_name, table_name]
+
+    def _get_candidate_tables(self, user_id: int, product_id: int, sale_id: int) -> List[str]:
+        return self._get_candidate_tables_by_slot(self.partitioning.get_slot(user_id, product_id, sale_id))
+
+    def _get_order_tables(self, order_id: str) -> List[str]:
+        """订单ID可能所在的分表, 无法解析槽位的旧订单ID需要查找所有分表"""
+        slot = self._parse_order_slot(order_id)
+        if slot is None:
+            return self._get_all_tables()
+        return self._get_candidate_tables_by_slot(slot)
+
+    def _get_all_tables(self) -> List[str]:
+        table_names = self.partitioning.get_table_names()
+        if self.previous_partitioning is not None:
+            table_names += [
+                table_name for table_name in self.previous_partitioning.get_table_names()
+                if table_name not in table_names
+            ]
+        return table_names
 
     def _execute_sql(self, query: str, params: tuple) -> bool:
         """通用 SQL 执行方法，处理异常"""
@@ -36,51 +147,202 @@ class OrderService:
             return False
 
     def create_order(self, user_id: int, product_id: int, sale_id: int) -> bool:
-        table_name = self.partitioning.get_table_name(user_id, product_id, sale_id)
-        with self.db.atomic():
-            # 加锁以避免并发插入相同订单
-            exist_order = self.db.execute_sql(
-                f'SELECT * FROM {table_name} WHERE user_id = ? AND product_id = ? AND sale_id = ? FOR UPDATE',
-                (user_id, product_id, sale_id)
-            ).fetchone()
-
-            if exist_order is None:
-                order_id = self._get_order_id(user_id, product_id, sale_id)
-                insert_query = (
-                    f'INSERT INTO {table_name} (order_id, user_id, product_id, sale_id, order_status) '
-                    f'VALUES (?, ?, ?, ?, ?)'
-                )
-                return self._execute_sql(insert_query, (order_id, user_id, product_id, sale_id, 'PENDING'))
-            else:
+        """
+        创建订单, 同一用户在一个活动中只能有一个未取消的订单
+
+        先以 Redis SETNX 快速拒绝重复请求, 再由分表上 (user_id, active_sale_id) 唯一键兜底,
+        插入时不加行锁或间隙锁
+        """
+        dedup_key = self._get_order_dedup_key(user_id, sale_id)
+        acquired = self.redis.set_nx(dedup_key, 1, expire=ORDER_DEDUP_EXPIRE)
+        if acquired is False:
+            logging.warning(f"Order already exists for user_id: {user_id}, product_id: {product_id}, sale_id: {sale_id}")
+            return False
+        if acquired is None:
+            # Redis 不可用时不拒绝下单, 由唯一键去重
+            logging.warning(f"下单去重键不可用, 由唯一键去重: user_id: {user_id}, sale_id: {sale_id}")
+
+        created = False
+        try:
+            table_name = self.partitioning.get_table_name(user_id, product_id, sale_id)
+            # 唯一键只在单张分表内生效, 迁移期间还需查找旧位置
+            for candidate_table in self._get_candidate_tables(user_id, product_id, sale_id):
+                if candidate_table != table_name and self.db.execute_sql(
+                        f"SELECT 1 FROM {candidate_table} "
+                        f"WHERE user_id = %s AND sale_id = %s AND order_status <> 'CANCELLED' LIMIT 1",
+                        (user_id, sale_id)
+                ).fetchone() is not None:
+                    logging.warning(
+                        f"Order already exists for user_id: {user_id}, product_id: {product_id}, sale_id: {sale_id}"
+                    )
+                    return False
+
+            order_id = self._get_order_id(user_id, product_id, sale_id)
+            self.db.execute_sql(
+                f'INSERT INTO {table_name} (order_id, user_id, product_id, sale_id, order_status) '
+                f'VALUES (%s, %s, %s, %s, %s)',
+                (order_id, user_id, product_id, sale_id, 'PENDING')
+            )
+            created = True
+        except IntegrityError as e:
+            if self._is_duplicate_entry(e):
                 logging.warning(f"Order already exists for user_id: {user_id}, product_id: {product_id}, sale_id: {sale_id}")
-                return False
+            else:
+                logging.error(f"SQL Error: {e}")
+            return False
+        except Exception as e:
+            logging.error(f"SQL Error: {e}")
+            return False
+        finally:
+            # 未写入订单时删除本次设置的去重键, 避免用户在去重键过期前无法下单
+            if not created and acquired:
+                self.redis.delete(dedup_key)
+
+        created_ms = self._get_order_created_ms(order_id)
+        self.user_index.add([(user_id, order_id, created_ms, 'PENDING')])
+        self.deadline_queue.add([(order_id, user_id, sale_id, self._get_payment_deadline_ms(created_ms))])
+        return True
 
-    def update_order_status(self, order_id: str, user_id: int, product_id, sale_id: int, new_status: str) -> bool:
-        if new_status not in {'PENDING', 'COMPLETED', 'CANCELLED'}:
+    def update_order_status(self, order_id: str, new_status: str) -> bool:
+        """
+        更新单个订单的状态
+
+        取消订单时与超时取消走同一退还流程: 提交前写入退款日志, 提交后退还库存并删除日志;
+        退还失败时订单重新放入到期队列, 由 order_timeout_worker 按退款日志补退
+        """
+        if new_status not in ORDER_STATUSES:
             logging.error("Invalid order status provided.")
             return False
 
-        table_name = self.partitioning.get_table_name(user_id, product_id, sale_id)
+        for table_name in self._get_order_tables(order_id):
+            refund = None
+            try:
+                with self.db.atomic():
+                    # 加锁以确保数据一致性
+                    existing_order = self.db.execute_sql(
+                        f'SELECT * FROM {table_name} WHERE order_id = %s FOR UPDATE',
+                        (order_id,)
+                    ).fetchone()
 
-        with self.db.atomic():
-            # 加锁以确保数据一致性
-            existing_order = self.db.execute_sql(
-                f'SELECT * FROM {table_name} WHERE order_id = ? FOR UPDATE',
-                (order_id,)
-            ).fetchone()
+                    if existing_order:
+                        if new_status == 'CANCELLED' and existing_order[4] != 'CANCELLED':
+                            refund = (order_id, existing_order[1], existing_order[3])
+                            self._journal_refunds([refund])
+                        self.db.execute_sql(
+                            f'UPDATE {table_name} SET order_status = %s WHERE order_id = %s',
+                            (new_status, order_id)
+                        )
+            except Exception as e:
+                logging.error(f"SQL Error: {e}")
+                return False
 
             if existing_order:
-                update_query = f'UPDATE {table_name} SET order_status = ? WHERE order_id = ?'
-                return self._execute_sql(update_query, (new_status, order_id))
-            else:
-                logging.warning(f"Order not found for order_id: {order_id}")
-                return False
+                # 事务提交后再更新索引, 索引写入失败时由 rebuild_user_index 修复
+                self.user_index.update_status(existing_order[1], order_id, new_status)
+                if new_status == 'CANCELLED':
+                    self.redis.delete(self._get_order_dedup_key(existing_order[1], existing_order[3]))
+                if refund is not None:
+                    self._refund_cancelled_order(refund)
+                return True
+
+        logging.warning(f"Order not found for order_id: {order_id}")
+        return False
+
+    def update_orders_status(
+            self,
+            order_ids: List[str],
+            new_status: str,
+            from_status: Optional[str] = 'PENDING',
+            chunk_size: int = 500
+    ) -> Dict[str, str]:
+        """
+        批量更新订单状态: 订单按所在分表分组, 每张分表每 chunk_size 个订单一个事务,
+        事务内锁定本批订单后执行一条带状态条件的 UPDATE
+
+        Args:
+            order_ids: 订单ID列表
+            new_status: 目标状态
+            from_status: 只更新处于该状态的订单, None 表示不限制
+            chunk_size: 每个事务更新的最大订单数
+
+        Returns:
+            Dict[str, str]: 订单ID -> UPDATED / NOT_FOUND / STATUS_MISMATCH / FAILED
+        """
+        if new_status not in ORDER_STATUSES or (from_status is not None and from_status not in ORDER_STATUSES):
+            raise ValueError(f"order status must be one of {ORDER_STATUSES}")
+        if chunk_size <= 0:
+            raise ValueError("chunk_size must be positive")
+
+        outcomes: Dict[str, str] = {}
+        # 更新成功的 (订单ID, 用户ID, 原状态, 活动ID)
+        updated = []
+        # 迁移期间订单可能位于多张候选分表, 未找到的订单依次在下一张候选分表中查找
+        remaining = {order_id: self._get_order_tables(order_id) for order_id in dict.fromkeys(order_ids)}
+        while remaining:
+            table_orders: Dict[str, List[str]] = {}
+            for order_id, table_names in remaining.items():
+                table_orders.setdefault(table_names[0], []).append(order_id)
+
+            for table_name, ids in table_orders.items():
+                for start in range(0, len(ids), chunk_size):
+                    chunk = ids[start:start + chunk_size]
+                    outcomes.update(self._update_status_chunk(table_name, chunk, new_status, from_status, updated))
+
+            remaining = {
+                order_id: table_names[1:] for order_id, table_names in remaining.items()
+                if order_id not in outcomes and len(table_names) > 1
+            }
+
+        self.user_index.update_statuses((row[1], row[0], new_status) for row in updated)
+        if new_status == 'CANCELLED' and updated:
+            # 取消后用户可以重新下单, 去重键删除失败时等待过期, 不影响已提交的状态
+            try:
+                self.redis.client.delete(*[self._get_order_dedup_key(row[1], row[3]) for row in updated])
+            except Exception as e:
+                logging.error(f"删除下单去重键失败: {e}")
+        for order_id in order_ids:
+            outcomes.setdefault(order_id, self.NOT_FOUND)
+        return outcomes
+
+    def _update_status_chunk(
+            self,
+            table_name: str,
+            order_ids: List[str],
+            new_status: str,
+            from_status: Optional[str],
+            updated: List[tuple]
+    ) -> Dict[str, str]:
+        """在一个事务中更新同一分表的一批订单, 分表中不存在的订单不出现在返回值中"""
+        placeholders = ', '.join(['%s'] * len(order_ids))
+        outcomes = {}
+        try:
+            with self.db.atomic():
+                rows = self.db.execute_sql(
+                    f'SELECT order_id, user_id, order_status, sale_id FROM {table_name} '
+                    f'WHERE order_id IN ({placeholders}) FOR UPDATE',
+                    tuple(order_ids)
+                ).fetchall()
+                matched = [row for row in rows if from_status is None or row[2] == from_status]
+                if matched:
+                    conditions = f"order_id IN ({', '.join(['%s'] * len(matched))})"
+                    params = [new_status] + [row[0] for row in matched]
+                    if from_status is not None:
+                        conditions += ' AND order_status = %s'
+                        params.append(from_status)
+                    self.db.execute_sql(f'UPDATE {table_name} SET order_status = %s WHERE {conditions}', tuple(params))
+        except Exception as e:
+            logging.error(f"SQL Error: {e}")
+            return {order_id: self.FAILED for order_id in order_ids}
+
+        for row in rows:
+            outcomes[row[0]] = self.UPDATED if from_status is None or row[2] == from_status else self.STATUS_MISMATCH
+        updated.extend(matched)
+        return outcomes
 
     def get_order(self, order_id: str):
         order = {}
-        for i in range(self.partitioning.num_tables):
-            table_name = f"orders_{i}"
-            order = self.db.execute_sql(f'SELECT * FROM {table_name} WHERE order_id = ?', (order_id,)).fetchone()
+        for table_name in self._get_order_tables(order_id):
+            order = self.db.execute_sql(f'SELECT * FROM {table_name} WHERE order_id = %s', (order_id,)).fetchone()
             if order is not None:
                 break
         if order:
@@ -89,27 +351,438 @@ class OrderService:
             logging.warning(f"Order not found for order_id: {order_id}")
             return None
 
+    def _fetch_order_page(
+            self,
+            table_name: str,
+            conditions: List[str],
+            params: List,
+            cursor: Optional[Tuple],
+            page_size: int,
+            newest_first: bool
+    ) -> List[tuple]:
+        """按 (created_at, order_id) 游标读取一张分表的一页订单, 在线程池中执行"""
+        conditions = list(conditions)
+        params = list(params)
+        if cursor is not None:
+            conditions.append(f"(created_at, order_id) {'<' if newest_first else '>'} (%s, %s)")
+            params.extend(cursor)
+        where = f"WHERE {' AND '.join(conditions)}" if conditions else ''
+        direction = 'DESC' if newest_first else 'ASC'
+        query = (
+            f"SELECT {', '.join(ORDER_COLUMNS)} FROM {table_name} {where} "
+            f"ORDER BY created_at {direction}, order_id {direction} LIMIT %s"
+        )
+        # 工作线程从连接池取连接, 查询结束后归还
+        with self.db.connection_context():
+            return list(self.db.execute_sql(query, tuple(params + [page_size])).fetchall())
+
+    def iter_orders(
+            self,
+            user_id: Optional[int] = None,
+            sale_id: Optional[int] = None,
+            status: Optional[str] = None,
+            limit: Optional[int] = None,
+            offset: int = 0,
+            newest_first: bool = False,
+            page_size: int = 500
+    ) -> Iterator[tuple]:
+        """
+        并发查询所有分表, 按创建时间归并后逐行返回订单
+
+        Args:
+            user_id / sale_id / status: 可选的过滤条件
+            limit / offset: 归并后的分页
+            newest_first: 是否按创建时间倒序
+            page_size: 每张分表每次读取的行数
+
+        Returns:
+            Iterator[tuple]: 按 ORDER_COLUMNS 排列的订单行
+        """
+        conditions, params = [], []
+        for column, value in (('user_id', user_id), ('sale_id', sale_id), ('order_status', status)):
+            if value is not None:
+                conditions.append(f'{column} = %s')
+                params.append(value)
+        if limit is not None:
+            # 单张分表最多只需要读取 offset + limit 行
+            page_size = min(page_size, offset + limit)
+
+        fetchers = [
+            lambda cursor, table_name=table_name: self._fetch_order_page(
+                table_name, conditions, params, cursor, page_size, newest_first
+            )
+            for table_name in self._get_all_tables()
+        ]
+        orders = scatter_gather.merge(
+            fetchers,
+            key=lambda row: (row[5], row[0]),
+            page_size=page_size,
+            reverse=newest_first
+        )
+
+        if self.previous_partitioning is not None:
+            # 迁移期间同一订单可能在新旧分表中各读到一次
+            orders = self._unique_orders(orders)
+        stop = None if limit is None else offset + limit
+        return itertools.islice(orders, offset, stop)
+
+    @staticmethod
+    def _unique_orders(orders: Iterator[tuple]) -> Iterator[tuple]:
+        seen = set()
+        for order in orders:
+            if order[0] not in seen:
+                seen.add(order[0])
+                yield order
+
     def get_all_orders(self):
-        all_orders = []
-        for i in range(self.partitioning.num_tables):
-            table_name = f'orders_{i}'
-            orders = self.db.execute_sql(f'SELECT * FROM {table_name}').fetchall()
-            all_orders.extend(orders)
-        return all_orders
+        return list(self.iter_orders())
+
+    def get_orders_by_user(
+            self,
+            user_id: int,
+            status: Optional[str] = None,
+            offset: int = 0,
+            limit: int = 20
+    ) -> List[tuple]:
+        """
+        按下单时间倒序获取用户的订单: 一次索引读取, 再按订单ID定向查询所在分表
+
+        Returns:
+            List[tuple]: 按 ORDER_COLUMNS 排列的订单行
+        """
+        order_ids = self.user_index.page(user_id, offset, limit, status)
+        if not order_ids:
+            return []
+
+        table_orders: Dict[str, List[str]] = {}
+        for order_id in order_ids:
+            for table_name in dict.fromkeys(self._get_order_tables(order_id)):
+                table_orders.setdefault(table_name, []).append(order_id)
+
+        orders = {}
+        for table_name, ids in table_orders.items():
+            rows = self.db.execute_sql(
+                f"SELECT {', '.join(ORDER_COLUMNS)} FROM {table_name} "
+                f"WHERE order_id IN ({', '.join(['%s'] * len(ids))})",
+                tuple(ids)
+            ).fetchall()
+            for row in rows:
+                orders[row[0]] = row
+        # 保持索引中的顺序, 索引中存在但已不在分表中的订单被忽略
+        return [orders[order_id] for order_id in order_ids if order_id in orders]
+
+    def rebuild_user_index(self, user_id: int) -> int:
+        """从分表重建用户订单索引, 用于补齐旧订单, 返回索引的订单数"""
+        self.user_index.clear(user_id)
+        orders = [
+            (user_id, order[0], int(order[5].timestamp() * 1000), order[4])
+            for order in self.iter_orders(user_id=user_id)
+        ]
+        self.user_index.add(orders)
+        return len(orders)
 
     def delete_order(self, order_id: str) -> bool:
-        for i in range(self.partitioning.num_tables):
-            table_name  = f"orders_{i}"
+        for table_name in self._get_order_tables(order_id):
             with self.db.atomic():
                 # 加锁以确保删除操作的安全性
                 existing_order = self.db.execute_sql(
-                    f'SELECT * FROM {table_name} WHERE order_id = ? FOR UPDATE',
+                    f'SELECT * FROM {table_name} WHERE order_id = %s FOR UPDATE',
                     (order_id,)
                 ).fetchone()
 
                 if existing_order:
-                    delete_query = f'DELETE FROM {table_name} WHERE order_id = ?'
-                    return self._execute_sql(delete_query, (order_id,))
-                else:
-                    logging.warning(f"Order not found for order_id: {order_id}")
-                    return False
\ No newline at end of file
+                    delete_query = f'DELETE FROM {table_name} WHERE order_id = %s'
+                    if not self._execute_sql(delete_query, (order_id,)):
+                        return False
+
+            if existing_order:
+                # 事务提交后再更新索引与去重键
+                self.user_index.remove(existing_order[1], order_id)
+                self.redis.delete(self._get_order_dedup_key(existing_order[1], existing_order[3]))
+                return True
+
+        logging.warning(f"Order not found for order_id: {order_id}")
+        return False
+
+    def place_order(self, user_id: int, product_id: int, sale_id: int) -> Tuple[int, Optional[str]]:
+        """
+        异步下单: 预占库存并去重后投递下单命令, 立即返回下单凭证
+
+        Returns:
+            Tuple[int, Optional[str]]: (StockLedger.admit 返回码, 下单凭证), 未准入时凭证为None
+        """
+        result = self.stock_ledger.admit(sale_id, user_id)
+        if result != StockLedger.ADMITTED:
+            return result, None
+
+        ticket = uuid.uuid4().hex
+        command = {
+            'ticket': ticket,
+            'user_id': user_id,
+            'product_id': product_id,
+            'sale_id': sale_id
+        }
+        try:
+            self.redis.set(self._get_ticket_key(ticket), json.dumps({'status': 'QUEUED'}), expire=TICKET_EXPIRE)
+            # 连接池保证同一连接不会被多个线程同时使用, 出错的连接由连接池丢弃
+            with connection_registry.rabbitmq() as rabbitmq:
+                rabbitmq.publish_message(queue_name=ORDER_CREATE_QUEUE, message=json.dumps(command))
+        except Exception as e:
+            logging.error(f"投递下单命令失败: {e}")
+            self.stock_ledger.release(sale_id, user_id=user_id)
+            self.redis.delete(self._get_ticket_key(ticket))
+            return StockLedger.NOT_READY, None
+
+        return result, ticket
+
+    def get_ticket_status(self, ticket: str) -> Optional[Dict]:
+        """查询下单凭证状态: QUEUED / SUCCESS / FAILED"""
+        stored_data = self.redis.get(self._get_ticket_key(ticket))
+        if stored_data is None:
+            return None
+        return json.loads(stored_data)
+
+    def create_orders_batch(self, commands: List[Dict]) -> Dict[str, Optional[str]]:
+        """
+        按分表批量写入订单, 每张分表一条多行 INSERT
+
+        批量写入冲突时逐条写入: 用户在该活动中已有未取消的订单时视为写入成功并返回已有的订单ID.
+        购买资格按用户去重, 已有订单只可能来自同一条命令的重复投递(如上次处理中途退出未确认消息);
+        唯一键冲突以外的错误直接抛出, 由消费者将整批消息重新入队
+
+        Returns:
+            Dict[str, Optional[str]]: 下单凭证 -> 订单ID, 写入失败的订单ID为None
+        """
+        shard_rows = {}
+        # 整批一次性生成订单ID
+        for command, snowflake_id in zip(commands, self.id_generator.next_ids(len(commands))):
+            slot = self.partitioning.get_slot(command['user_id'], command['product_id'], command['sale_id'])
+            table_name = self.partitioning.get_table_name_by_index(self.partitioning.get_table_index_by_slot(slot))
+            order_id = self._format_order_id(snowflake_id, slot)
+            shard_rows.setdefault(table_name, []).append((command['ticket'], (
+                order_id, command['user_id'], command['product_id'], command['sale_id'], 'PENDING'
+            )))
+
+        results = {}
+        for table_name, rows in shard_rows.items():
+            insert_query = (
+                f'INSERT INTO {table_name} (order_id, user_id, product_id, sale_id, order_status) VALUES '
+                + ', '.join(['(%s, %s, %s, %s, %s)'] * len(rows))
+            )
+            params = tuple(value for _, row in rows for value in row)
+            try:
+                with self.db.atomic():
+                    self.db.execute_sql(insert_query, params)
+                for ticket, row in rows:
+                    results[ticket] = row[0]
+            except IntegrityError:
+                # 批量写入冲突时逐条写入, 隔离出冲突的订单
+                single_query = (
+                    f'INSERT INTO {table_name} (order_id, user_id, product_id, sale_id, order_status) '
+                    f'VALUES (%s, %s, %s, %s, %s)'
+                )
+                for ticket, row in rows:
+                    try:
+                        self.db.execute_sql(single_query, row)
+                        results[ticket] = row[0]
+                    except IntegrityError as e:
+                        if not self._is_duplicate_entry(e):
+                            raise
+                        existing = self.db.execute_sql(
+                            f"SELECT order_id FROM {table_name} "
+                            f"WHERE user_id = %s AND sale_id = %s AND order_status <> 'CANCELLED' LIMIT 1",
+                            (row[1], row[3])
+                        ).fetchone()
+                        results[ticket] = existing[0] if existing else None
+
+        created = [
+            (command, results[command['ticket']], self._get_order_created_ms(results[command['ticket']]))
+            for command in commands if results.get(command['ticket'])
+        ]
+        self.user_index.add(
+            (command['user_id'], order_id, created_ms, 'PENDING') for command, order_id, created_ms in created
+        )
+        self.deadline_queue.add(
+            (order_id, command['user_id'], command['sale_id'], self._get_payment_deadline_ms(created_ms))
+            for command, order_id, created_ms in created
+        )
+
+        records = [
+            (command['user_id'], command['sale_id'])
+            for command in commands if results.get(command['ticket'])
+        ]
+        if records:
+            record_query = (
+                'INSERT IGNORE INTO flash_sale_records (user_id, sale_id) VALUES '
+                + ', '.join(['(%s, %s)'] * len(records))
+            )
+            self._execute_sql(record_query, tuple(value for record in records for value in record))
+
+        return results
+
+    def _get_finished_tickets(self, commands: List[Dict]) -> set:
+        """已有处理结果的下单凭证, 对应的命令是重复投递"""
+        try:
+            stored = self.redis.client.mget([self._get_ticket_key(command['ticket']) for command in commands])
+        except Exception as e:
+            logging.error(f"读取下单凭证失败: {e}")
+            return set()
+        return {
+            command['ticket'] for command, data in zip(commands, stored)
+            if data is not None and json.loads(data)['status'] != 'QUEUED'
+        }
+
+    def handle_order_batch(self, bodies: List[bytes]) -> None:
+        """
+        处理一批下单命令: 写入订单, 更新下单凭证, 确认或释放库存
+
+        重复投递时幂等: 凭证已有结果的命令直接跳过; 订单已写入但凭证未更新的命令由 create_orders_batch
+        返回已有订单. 凭证先于库存更新, 中途退出最多使预占的库存无法售出, 不会重复确认或释放
+        """
+        commands = [json.loads(body) for body in bodies]
+        finished = self._get_finished_tickets(commands)
+        if finished:
+            logging.warning(f"跳过 {len(finished)} 条重复投递的下单命令")
+            commands = [command for command in commands if command['ticket'] not in finished]
+        if not commands:
+            return
+        results = self.create_orders_batch(commands)
+
+        tickets = {}
+        for command in commands:
+            order_id = results.get(command['ticket'])
+            if order_id:
+                tickets[self._get_ticket_key(command['ticket'])] = json.dumps(
+                    {'status': 'SUCCESS', 'order_id': order_id}
+                )
+            else:
+                tickets[self._get_ticket_key(command['ticket'])] = json.dumps({'status': 'FAILED'})
+        self.redis.set_multiple(tickets, expire=TICKET_EXPIRE)
+
+        for command in commands:
+            if results.get(command['ticket']):
+                self.stock_ledger.confirm(command['sale_id'], user_id=command['user_id'])
+            else:
+                self.stock_ledger.release(command['sale_id'], user_id=command['user_id'])
+
+    def order_consumer(self, batch_size: int = 200, flush_interval: float = 0.05):
+        """下单消费进程入口"""
+        # 消费者长期占用连接, 不从连接池借出
+        RabbitMQUtil().consume_batch(
+            queue_name=ORDER_CREATE_QUEUE,
+            handler=self.handle_order_batch,
+            batch_size=batch_size,
+            flush_interval=flush_interval
+        )
+
+    def _journal_refunds(self, orders: List[Tuple[str, int, int]]) -> List[bool]:
+        """
+        取消前将订单写入退款日志
+
+        Returns:
+            List[bool]: 每个订单是否为本次新写入, False 表示上次处理中途退出留下的记录
+        """
+        with self.redis.client.pipeline(transaction=False) as pipe:
+            for order_id, user_id, sale_id in orders:
+                pipe.hsetnx(ORDER_REFUND_JOURNAL_KEY, order_id, json.dumps([user_id, sale_id]))
+            return [bool(created) for created in pipe.execute()]
+
+    def _refund_cancelled_order(self, order: Tuple[str, int, int]) -> None:
+        """退还单个已取消订单, 失败时放入到期队列立即到期, 由 order_timeout_worker 按退款日志重试"""
+        if self._refund_cancelled([order]):
+            try:
+                self.redis.client.hdel(ORDER_REFUND_JOURNAL_KEY, order[0])
+                return
+            except Exception as e:
+                logging.error(f"删除退款日志失败: {e}")
+        self.deadline_queue.add([(*order, time.time_ns() // 1_000_000)])
+
+    def _is_cancelled(self, order_id: str) -> bool:
+        order = self.get_order(order_id)
+        return order is not None and order[4] == 'CANCELLED'
+
+    def _refund_cancelled(self, orders: List[Tuple[str, int, int]]) -> List[Tuple[str, int, int]]:
+        """
+        已取消的订单退还库存并撤销用户的购买资格(账本退还后清除售罄标记), 删除参与记录
+
+        Returns:
+            List[Tuple[str, int, int]]: 退还成功的 (订单ID, 用户ID, 活动ID)
+        """
+        sale_orders: Dict[int, List[Tuple[str, int, int]]] = {}
+        for order in orders:
+            sale_orders.setdefault(order[2], []).append(order)
+        refunded = []
+        for sale_id, sale_order_list in sale_orders.items():
+            if self.stock_ledger.refund(sale_id, [user_id for _, user_id, _ in sale_order_list]) >= 0:
+                refunded.extend(sale_order_list)
+
+        if refunded:
+            # 删除参与记录, 用户可以重新参与该活动
+            self._execute_sql(
+                'DELETE FROM flash_sale_records WHERE (user_id, sale_id) IN ('
+                + ', '.join(['(%s, %s)'] * len(refunded)) + ')',
+                tuple(value for _, user_id, sale_id in refunded for value in (user_id, sale_id))
+            )
+        return refunded
+
+    def cancel_expired_orders(self, batch_size: int = conf.order_timeout.batch_size) -> Tuple[int, int]:
+        """
+        取消一批超时未支付的订单, 退还库存并撤销用户的购买资格
+
+        取消前订单写入退款日志, 退还库存后删除日志再移出到期队列; 中途退出或退还失败的订单不确认,
+        租约到期后重试. 重试时订单可能已被上次处理取消, 状态不符且留有退款日志的订单查询当前状态,
+        已取消的补退库存. 已支付的订单因状态不符被跳过, 直接移出到期队列
+
+        Returns:
+            Tuple[int, int]: (本批取出的到期订单数, 其中取消的订单数)
+        """
+        claimed = self.deadline_queue.claim(batch_size)
+        if not claimed:
+            return 0, 0
+
+        try:
+            journaled = self._journal_refunds(claimed)
+        except Exception as e:
+            logging.error(f"写入退款日志失败: {e}")
+            return len(claimed), 0
+
+        outcomes = self.update_orders_status([order_id for order_id, _, _ in claimed], 'CANCELLED', 'PENDING')
+        cancelled = [order for order in claimed if outcomes[order[0]] == self.UPDATED]
+        # 上次处理已取消但未退还库存的订单
+        unrefunded = [
+            order for order, new in zip(claimed, journaled)
+            if not new and outcomes[order[0]] == self.STATUS_MISMATCH and self._is_cancelled(order[0])
+        ]
+
+        refunded = self._refund_cancelled(cancelled + unrefunded)
+
+        # 退还完成或无需退还的订单删除日志后确认, 取消失败或退还失败的订单保留日志等待重试
+        refunded_ids = {order[0] for order in refunded}
+        done = [
+            order for order in claimed
+            if order[0] in refunded_ids
+            or (outcomes[order[0]] in (self.STATUS_MISMATCH, self.NOT_FOUND) and order not in unrefunded)
+        ]
+        if done:
+            try:
+                self.redis.client.hdel(ORDER_REFUND_JOURNAL_KEY, *[order[0] for order in done])
+            except Exception as e:
+                logging.error(f"删除退款日志失败: {e}")
+                return len(claimed), len(cancelled)
+            self.deadline_queue.ack(done)
+        return len(claimed), len(cancelled)
+
+    def order_timeout_worker(
+            self,
+            interval: float = conf.order_timeout.interval,
+            batch_size: int = conf.order_timeout.batch_size
+    ):
+        """超时订单取消进程入口"""
+        while True:
+            try:
+                claimed, _ = self.cancel_expired_orders(batch_size)
+                if claimed >= batch_size:
+                    continue
+            except Exception as e:
+                logging.error(f"取消超时订单异常: {str(e)}")
+            time.sleep(interval)
@@ -1,15 +1,46 @@
-from typing import List
+from datetime import datetime
+from decimal import Decimal
+from typing import Dict, List, Optional, Tuple
 
 from model.base_model import db
 from model.product_model import Products
+from util.response_cache import response_cache
+from util.two_tier_cache import TwoTierCache
 import logging
 
 logger = logging.getLogger(__name__)
 
+PRODUCT_LIST_GROUP = 'list'
+PRODUCT_RESPONSE_GROUP = 'product'
+MAX_PAGE_SIZE = 100
+PRODUCT_FIELDS = ('id', 'name', 'description', 'price', 'stock', 'created_at')
+DATETIME_FORMAT = '%Y-%m-%d %H:%M:%S'
+
+# 商品缓存, 同一进程内所有 ProductService 共享
+product_cache = TwoTierCache('product_cache')
+
+def _product_to_dict(product: Products) -> Dict:
+    return {
+        'id': product.product_id,
+        'name': product.name,
+        'description': product.description,
+        'price': str(product.price),
+        'stock': product.stock,
+        'created_at': product.created_at.strftime(DATETIME_FORMAT) if product.created_at else None
+    }
+
 class ProductService:
     def __init__(self):
         self.product = Products()
 
+    @staticmethod
+    def invalidate_cache(product_id: Optional[int] = None) -> bool:
+        """商品写入后调用, 使该商品、商品列表及相关响应的缓存在所有节点上失效"""
+        response_cache.invalidate(PRODUCT_RESPONSE_GROUP)
+        if product_id is None:
+            return product_cache.invalidate(groups=[PRODUCT_LIST_GROUP])
+        return product_cache.invalidate(str(product_id), groups=[PRODUCT_LIST_GROUP])
+
     def create_product(self, name: str, description: str, price: float, stock: int) -> bool:
         try:
             self.product.create(
@@ -18,6 +49,7 @@ class ProductService:
                 price=price,
                 stock=stock
             )
+            self.invalidate_cache()
             return True
         except Exception as e:
             logger.error(f"创建商品失败: {str(e)}")
@@ -30,13 +62,29 @@ class ProductService:
                 description=description,
                 price=price
             ).where(Products.product_id == product_id).execute()
+            self.invalidate_cache(product_id)
             return True
         except Exception as e:
             logger.error(f"更新商品失败: {str(e)}")
             return False
 
-    def get_product_by_id(self, product_id: int) -> Products:
-        return self.product.select().where(Products.product_id == product_id).first()
+    def get_product_by_id(self, product_id: int) -> Optional[Products]:
+        """读穿缓存获取商品, 返回的实例由缓存还原, 字段类型与数据库读取一致, 仅用于读取"""
+        def load():
+            product = self.product.select().where(Products.product_id == product_id).first()
+            return _product_to_dict(product) if product else None
+
+        row = product_cache.get(str(product_id), load)
+        if row is None:
+            return None
+        return Products(
+            product_id=row['id'],
+            name=row['name'],
+            description=row['description'],
+            price=Decimal(row['price']),
+            stock=row['stock'],
+            created_at=datetime.strptime(row['created_at'], DATETIME_FORMAT) if row['created_at'] else None
+        )
 
     def get_product_by_name(self, name: str) -> Products:
         return self.product.select().where(Products.name == name).first()
@@ -44,26 +92,58 @@ class ProductService:
     def get_all_products(self) -> List[Products]:
         return self.product.select()
 
+    def get_products_page(
+            self,
+            after_id: int = 0,
+            limit: int = 20,
+            fields: Optional[List[str]] = None
+    ) -> Tuple[List[Dict], Optional[int]]:
+        """
+        按 product_id 游标分页获取商品, 读穿缓存
+
+        Args:
+            after_id: 上一页最后一个商品ID, 首页为0
+            limit: 每页条数, 不超过 MAX_PAGE_SIZE
+            fields: 返回的字段, 默认返回全部 PRODUCT_FIELDS
+
+        Returns:
+            Tuple[List[Dict], Optional[int]]: (本页商品, 下一页的 after_id), 没有下一页时为None
+        """
+        limit = max(1, min(limit, MAX_PAGE_SIZE))
+
+        def load():
+            query = self.product.select().where(
+                Products.product_id > after_id
+            ).order_by(Products.product_id).limit(limit)
+            return [_product_to_dict(product) for product in query]
+
+        page = product_cache.get(f'list:{after_id}:{limit}', load, group=PRODUCT_LIST_GROUP)
+        next_after_id = page[-1]['id'] if len(page) == limit else None
+        if fields:
+            page = [{field: row[field] for field in fields} for row in page]
+        return page, next_after_id
+
     def delete_product(self, product_id: int) -> bool:
         try:
             self.product.delete().where(Products.product_id == product_id).execute()
+            self.invalidate_cache(product_id)
             return True
         except Exception as e:
             logger.error(f"删除商品失败: {str(e)}")
             return False
 
     def decrease_stock(self, product_id: int, amount: int) -> bool:
-        product = self.get_product_by_id(product_id)
-        if product is None:
-            return False
-        if product.stock < amount:
-            return False
         try:
+            # 条件更新, 库存检查与扣减在同一条语句中完成, 避免超卖
             with db.atomic():
-                self.product.update(
+                updated = self.product.update(
                     stock=Products.stock - amount
-                ).where(Products.product_id == product_id).execute()
-            return True
+                ).where(
+                    (Products.product_id == product_id) & (Products.stock >= amount)
+                ).execute()
+            if updated:
+                self.invalidate_cache(product_id)
+            return updated > 0
         except Exception as e:
             logger.error(f"减少库存失败: {str(e)}")
             return False
@@ -74,6 +154,7 @@ class ProductService:
                 self.product.update(
                     stock=Products.stock + amount
                 ).where(Products.product_id == product_id).execute()
+            self.invalidate_cache(product_id)
             return True
         except Exception as e:
             logger.error(f"增加库存失败: {str(e)}")
@@ -0,0 +1,296 @@
+import json
+import unittest
+import uuid
+from unittest.mock import MagicMock
+
+from peewee import IntegrityError
+
+from service.order_service import MYSQL_DUPLICATE_ENTRY, ORDER_REFUND_JOURNAL_KEY, OrderService
+from util.stock_ledger import StockLedger
+
+
+class TestCreateOrder(unittest.TestCase):
+    def setUp(self):
+        self.service = OrderService()
+        self.service.db = MagicMock()
+        self.service.user_index = MagicMock()
+        self.service.deadline_queue = MagicMock()
+        self.user_id, self.sale_id = 900100, 900100
+        self.dedup_key = self.service._get_order_dedup_key(self.user_id, self.sale_id)
+        self.service.redis.delete(self.dedup_key)
+
+    def _create(self):
+        return self.service.create_order(self.user_id, 1, self.sale_id)
+
+    def test_duplicate_rejected_by_dedup_key(self):
+        self.assertTrue(self._create())
+        self.assertFalse(self._create())
+        self.assertEqual(self.service.db.execute_sql.call_count, 1)
+
+    def test_redis_error_falls_back_to_unique_key(self):
+        self.service.redis.set_nx = MagicMock(return_value=None)
+        self.assertTrue(self._create())
+        self.service.db.execute_sql.assert_called_once()
+
+        self.service.db.execute_sql.side_effect = IntegrityError(MYSQL_DUPLICATE_ENTRY, 'Duplicate entry')
+        self.assertFalse(self._create())
+
+    def test_dedup_key_released_on_failure(self):
+        # 迁移期间查找旧位置失败
+        table_name = self.service.partitioning.get_table_name(self.user_id, 1, self.sale_id)
+        self.service._get_candidate_tables = lambda *args: [table_name, 'orders_old', table_name]
+        self.service.db.execute_sql.side_effect = Exception('Lost connection to MySQL server')
+        self.assertFalse(self._create())
+        self.assertFalse(self.service.redis.exists(self.dedup_key))
+
+        # 唯一键冲突以外的写入错误
+        self.service._get_candidate_tables = lambda *args: [table_name]
+        self.service.db.execute_sql.side_effect = IntegrityError(1452, 'Cannot add or update a child row')
+        self.assertFalse(self._create())
+        self.assertFalse(self.service.redis.exists(self.dedup_key))
+
+    def tearDown(self):
+        self.service.redis.delete(self.dedup_key)
+
+
+class TestCancelOrder(unittest.TestCase):
+    def setUp(self):
+        self.service = OrderService()
+        self.service.db = MagicMock()
+        self.service.user_index = MagicMock()
+        self.service.deadline_queue = MagicMock()
+        self.ledger = StockLedger()
+        self.service.stock_ledger = self.ledger
+        self.sale_id = 900101
+        self.order_id = uuid.uuid4().hex
+        self.ledger.remove(self.sale_id)
+        self.service.db.execute_sql.return_value.fetchone.return_value = (
+            self.order_id, 1, 1, self.sale_id, 'COMPLETED', None
+        )
+
+    def test_cancel_reopens_sold_out_sale(self):
+        self.ledger.warm_up(self.sale_id, 1)
+        self.assertEqual(self.ledger.admit(self.sale_id, 1), StockLedger.ADMITTED)
+        self.ledger.confirm(self.sale_id)
+        self.assertIn(self.sale_id, self.ledger.get_sold_out())
+
+        # 取消后退还库存、撤销购买资格并清除售罄标记
+        self.assertTrue(self.service.update_order_status(self.order_id, 'CANCELLED'))
+        self.assertNotIn(self.sale_id, self.ledger.get_sold_out())
+        self.assertIsNone(self.service.redis.client.hget(ORDER_REFUND_JOURNAL_KEY, self.order_id))
+        self.assertEqual(self.ledger.admit(self.sale_id, 2), StockLedger.ADMITTED)
+        self.service.deadline_queue.add.assert_not_called()
+
+    def test_failed_refund_is_retried_by_timeout_worker(self):
+        self.service.stock_ledger = MagicMock()
+        self.service.stock_ledger.refund.return_value = -1
+        self.assertTrue(self.service.update_order_status(self.order_id, 'CANCELLED'))
+
+        self.assertIsNotNone(self.service.redis.client.hget(ORDER_REFUND_JOURNAL_KEY, self.order_id))
+        order = self.service.deadline_queue.add.call_args[0][0][0]
+        self.assertEqual(order[:3], (self.order_id, 1, self.sale_id))
+
+    def tearDown(self):
+        self.ledger.remove(self.sale_id)
+        self.ledger.redis_client.srem(StockLedger.DIRTY_KEY, self.sale_id)
+        self.service.redis.client.hdel(ORDER_REFUND_JOURNAL_KEY, self.order_id)
+
+
+class TestDeleteOrder(unittest.TestCase):
+    def setUp(self):
+        self.service = OrderService()
+        self.service.db = MagicMock()
+        self.service.user_index = MagicMock()
+        self.order_id = uuid.uuid4().hex
+        self.service._get_order_tables = lambda order_id: ['orders_0']
+        self.service.db.execute_sql.return_value.fetchone.return_value = (
+            self.order_id, 1, 1, 900102, 'COMPLETED', None
+        )
+
+    def test_index_updated_after_commit(self):
+        calls = []
+        self.service.db.atomic.return_value.__exit__.side_effect = lambda *args: calls.append('commit')
+        self.service.user_index.remove.side_effect = lambda *args: calls.append('remove')
+
+        self.assertTrue(self.service.delete_order(self.order_id))
+        self.assertEqual(calls, ['commit', 'remove'])
+        self.service.user_index.remove.assert_called_once_with(1, self.order_id)
+
+    def test_failed_delete_keeps_index(self):
+        self.service._execute_sql = MagicMock(return_value=False)
+        self.assertFalse(self.service.delete_order(self.order_id))
+        self.service.user_index.remove.assert_not_called()
+
+
+class TestUpdateOrdersStatus(unittest.TestCase):
+    def setUp(self):
+        self.service = OrderService()
+        self.service.db = MagicMock()
+        self.service.user_index = MagicMock()
+        self.service.redis = MagicMock()
+        self.service.db.execute_sql.side_effect = self._execute_sql
+        # 分表 -> 订单ID -> (订单ID, 用户ID, 订单状态, 活动ID)
+        self.tables = {
+            'orders_0': {'paid': ('paid', 2, 'COMPLETED', 1)},
+            'orders_1': {'pending': ('pending', 1, 'PENDING', 1), 'moved': ('moved', 3, 'PENDING', 1)},
+        }
+        # 迁移期间 moved 仍在旧分表 orders_1 中, broken 所在分表不可用
+        self.order_tables = {
+            'pending': ['orders_1'],
+            'paid': ['orders_0'],
+            'missing': ['orders_0'],
+            'moved': ['orders_0', 'orders_1', 'orders_0'],
+            'broken': ['orders_broken'],
+        }
+        self.service._get_order_tables = lambda order_id: self.order_tables[order_id]
+
+    def _execute_sql(self, query, params):
+        table_name = query.split(' FROM ' if query.startswith('SELECT') else ' ')[1].split()[0]
+        if table_name == 'orders_broken':
+            raise Exception('Lost connection to MySQL server')
+        table = self.tables[table_name]
+        cursor = MagicMock()
+        if query.startswith('SELECT'):
+            cursor.fetchall.return_value = [table[order_id] for order_id in params if order_id in table]
+        else:
+            new_status, order_ids = params[0], params[1:-1]
+            for order_id in order_ids:
+                table[order_id] = table[order_id][:2] + (new_status,) + table[order_id][3:]
+        return cursor
+
+    def test_outcomes(self):
+        outcomes = self.service.update_orders_status(
+            ['pending', 'paid', 'missing', 'moved', 'broken'], 'CANCELLED', chunk_size=1
+        )
+        self.assertEqual(outcomes, {
+            'pending': OrderService.UPDATED,
+            'paid': OrderService.STATUS_MISMATCH,
+            'missing': OrderService.NOT_FOUND,
+            'moved': OrderService.UPDATED,
+            'broken': OrderService.FAILED,
+        })
+        self.assertEqual(self.tables['orders_1']['moved'][2], 'CANCELLED')
+        self.assertEqual(self.tables['orders_0']['paid'][2], 'COMPLETED')
+
+        # 只有更新成功的订单写入索引并删除去重键
+        self.service.user_index.update_statuses.assert_called_once()
+        self.assertEqual(
+            sorted(self.service.user_index.update_statuses.call_args[0][0]),
+            [(1, 'pending', 'CANCELLED'), (3, 'moved', 'CANCELLED')]
+        )
+        self.service.redis.client.delete.assert_called_once()
+
+    def test_invalid_arguments(self):
+        with self.assertRaises(ValueError):
+            self.service.update_orders_status(['pending'], 'PAID')
+        with self.assertRaises(ValueError):
+            self.service.update_orders_status(['pending'], 'CANCELLED', chunk_size=0)
+        self.service.db.execute_sql.assert_not_called()
+
+
+class TestHandleOrderBatch(unittest.TestCase):
+    def setUp(self):
+        self.service = OrderService()
+        self.service.db = MagicMock()
+        self.service.stock_ledger = MagicMock()
+        self.service.user_index = MagicMock()
+        self.service.deadline_queue = MagicMock()
+        # 用户1的订单已由上一次投递写入
+        self.existing_order_id = self.service._format_order_id(self.service.id_generator.next_id(), 0)
+        self.service.db.execute_sql.side_effect = self._execute_sql
+
+        self.commands = [
+            {'ticket': uuid.uuid4().hex, 'user_id': user_id, 'product_id': 1, 'sale_id': 1}
+            for user_id in (1, 2)
+        ]
+        for command in self.commands:
+            self.service.redis.set(self._ticket_key(command), json.dumps({'status': 'QUEUED'}))
+
+    def _ticket_key(self, command):
+        return self.service._get_ticket_key(command['ticket'])
+
+    def _execute_sql(self, query, params):
+        if query.startswith('INSERT INTO orders') and 1 in params[1::5]:
+            raise IntegrityError(MYSQL_DUPLICATE_ENTRY, 'Duplicate entry')
+        cursor = MagicMock()
+        cursor.fetchone.return_value = (self.existing_order_id,)
+        return cursor
+
+    def _ticket(self, command):
+        return json.loads(self.service.redis.get(self._ticket_key(command)))
+
+    def test_redelivery_is_idempotent(self):
+        bodies = [json.dumps(command).encode() for command in self.commands]
+        self.service.handle_order_batch(bodies)
+
+        # 已写入的订单视为成功, 不释放库存
+        self.assertEqual(self._ticket(self.commands[0]), {'status': 'SUCCESS', 'order_id': self.existing_order_id})
+        self.assertEqual(self._ticket(self.commands[1])['status'], 'SUCCESS')
+        self.assertEqual(self.service.stock_ledger.confirm.call_count, 2)
+        self.service.stock_ledger.release.assert_not_called()
+
+        # 凭证已有结果, 再次投递不再写入订单或确认库存
+        calls = self.service.db.execute_sql.call_count
+        self.service.handle_order_batch(bodies)
+        self.assertEqual(self.service.db.execute_sql.call_count, calls)
+        self.assertEqual(self.service.stock_ledger.confirm.call_count, 2)
+
+    def test_other_errors_are_raised(self):
+        self.service.db.execute_sql.side_effect = IntegrityError(1452, 'Cannot add or update a child row')
+        with self.assertRaises(IntegrityError):
+            self.service.handle_order_batch([json.dumps(command).encode() for command in self.commands])
+        self.service.stock_ledger.confirm.assert_not_called()
+        self.service.stock_ledger.release.assert_not_called()
+        self.assertEqual(self._ticket(self.commands[0])['status'], 'QUEUED')
+
+    def tearDown(self):
+        for command in self.commands:
+            self.service.redis.delete(self._ticket_key(command))
+
+class TestCancelExpiredOrders(unittest.TestCase):
+    def setUp(self):
+        self.service = OrderService()
+        self.service.db = MagicMock()
+        self.service.stock_ledger = MagicMock()
+        self.service.deadline_queue = MagicMock()
+        self.service.update_orders_status = MagicMock()
+        self.service.get_order = MagicMock()
+        self.orders = [(uuid.uuid4().hex, 1, 1), (uuid.uuid4().hex, 2, 1)]
+        self.service.deadline_queue.claim.return_value = self.orders
+
+    def _journal(self):
+        return self.service.redis.client.hmget(ORDER_REFUND_JOURNAL_KEY, [order[0] for order in self.orders])
+
+    def test_ack_after_refund(self):
+        pending, paid = self.orders
+        self.service.update_orders_status.return_value = {
+            pending[0]: OrderService.UPDATED, paid[0]: OrderService.STATUS_MISMATCH
+        }
+        # 退还失败时不确认已取消的订单, 保留退款日志
+        self.service.stock_ledger.refund.return_value = -1
+        self.assertEqual(self.service.cancel_expired_orders(), (2, 1))
+        self.service.deadline_queue.ack.assert_called_once_with([paid])
+        self.assertIsNotNone(self._journal()[0])
+        self.assertIsNone(self._journal()[1])
+
+        # 重试时订单已是取消状态, 按退款日志补退库存后确认
+        self.service.deadline_queue.claim.return_value = [pending]
+        self.service.update_orders_status.return_value = {pending[0]: OrderService.STATUS_MISMATCH}
+        self.service.get_order.return_value = (pending[0], 1, 1, 1, 'CANCELLED')
+        self.service.stock_ledger.refund.return_value = 1
+        self.assertEqual(self.service.cancel_expired_orders(), (1, 0))
+        self.service.stock_ledger.refund.assert_called_with(1, [1])
+        self.service.deadline_queue.ack.assert_called_with([pending])
+        self.assertEqual(self._journal(), [None, None])
+
+    def test_failed_update_is_retried(self):
+        self.service.update_orders_status.return_value = {order[0]: OrderService.FAILED for order in self.orders}
+        self.assertEqual(self.service.cancel_expired_orders(), (2, 0))
+        self.service.stock_ledger.refund.assert_not_called()
+        self.service.deadline_queue.ack.assert_not_called()
+
+    def tearDown(self):
+        self.service.redis.client.hdel(ORDER_REFUND_JOURNAL_KEY, *[order[0] for order in self.orders])
+
+if __name__ == '__main__':
+    unittest.main()
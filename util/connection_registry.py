@@ -0,0 +1,143 @@
+import logging
+import os
+import queue
+import threading
+from contextlib import contextmanager
+from typing import Dict, Iterator, Tuple
+
+import redis
+
+from conf.conf import conf
+from util.rabbitmq_util import RabbitMQUtil
+
+logger = logging.getLogger(__name__)
+
+
+class ConnectionRegistry:
+    """
+    进程级连接注册表
+
+    同一进程内所有工具类共享按 (host, port, db, password, decode_responses) 划分的 Redis 连接池,
+    RabbitMQ 连接放入池中按需借出, 请求路径上不再新建连接
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._redis_pools: Dict[Tuple, redis.ConnectionPool] = {}
+        self._rabbitmq_pool = queue.LifoQueue(maxsize=conf.rabbitmq.pool_size)
+        self._pid = os.getpid()
+
+    def _check_pid(self):
+        # fork 后子进程不能复用父进程的 socket, 丢弃继承来的 RabbitMQ 连接
+        # Redis 连接池自身会检测 pid 并重建连接
+        if self._pid != os.getpid():
+            with self._lock:
+                if self._pid != os.getpid():
+                    self._rabbitmq_pool = queue.LifoQueue(maxsize=conf.rabbitmq.pool_size)
+                    self._pid = os.getpid()
+
+    def redis(
+            self,
+            host: str = conf.redis.host,
+            port: int = conf.redis.port,
+            db: int = conf.redis.db,
+            password: str = conf.redis.password,
+            decode_responses: bool = False
+    ) -> redis.Redis:
+        """
+        获取共享连接池的 Redis 客户端
+
+        客户端本身只是连接池的轻量包装, 每次调用返回新实例即可
+        """
+        pool_key = (host, port, db, password, decode_responses)
+        pool = self._redis_pools.get(pool_key)
+        if pool is None:
+            with self._lock:
+                pool = self._redis_pools.get(pool_key)
+                if pool is None:
+                    # 连接数达到上限时阻塞等待空闲连接, 而不是直接报错
+                    pool = redis.BlockingConnectionPool(
+                        host=host,
+                        port=port,
+                        db=db,
+                        password=password or None,
+                        decode_responses=decode_responses,
+                        max_connections=conf.redis.max_connections,
+                        timeout=conf.redis.socket_timeout,
+                        socket_timeout=conf.redis.socket_timeout,
+                        socket_connect_timeout=conf.redis.socket_timeout,
+                        health_check_interval=conf.redis.health_check_interval
+                    )
+                    self._redis_pools[pool_key] = pool
+        return redis.Redis(connection_pool=pool)
+
+    @contextmanager
+    def rabbitmq(self) -> Iterator[RabbitMQUtil]:
+        """
+        借出一个 RabbitMQ 连接, 用完归还
+
+        pika 连接非线程安全, 同一连接同一时刻只会被一个线程持有;
+        使用过程中抛出异常的连接直接关闭丢弃
+        """
+        self._check_pid()
+        pool = self._rabbitmq_pool
+
+        rabbitmq = None
+        while rabbitmq is None:
+            try:
+                rabbitmq = pool.get_nowait()
+            except queue.Empty:
+                rabbitmq = RabbitMQUtil()
+                break
+            if not self._is_healthy(rabbitmq):
+                self._close_quietly(rabbitmq)
+                rabbitmq = None
+
+        try:
+            yield rabbitmq
+        except Exception:
+            self._close_quietly(rabbitmq)
+            raise
+
+        try:
+            pool.put_nowait(rabbitmq)
+        except queue.Full:
+            self._close_quietly(rabbitmq)
+
+    @staticmethod
+    def _is_healthy(rabbitmq: RabbitMQUtil) -> bool:
+        """
+        检查空闲连接是否可用
+
+        BlockingConnection 只在处理 I/O 时收发心跳, 空闲期间被服务端关闭后 is_open 仍为 True;
+        借出前先处理一次积压的 I/O, 使断开的连接暴露出来
+        """
+        try:
+            rabbitmq.conn.process_data_events(time_limit=0)
+        except Exception as e:
+            logger.warning(f"RabbitMQ 空闲连接已断开: {e}")
+            return False
+        return rabbitmq.conn.is_open and rabbitmq.channel.is_open
+
+    @staticmethod
+    def _close_quietly(rabbitmq: RabbitMQUtil):
+        try:
+            rabbitmq.close()
+        except Exception as e:
+            logger.warning(f"关闭 RabbitMQ 连接失败: {e}")
+
+    def close(self):
+        """关闭所有连接, 用于进程退出"""
+        with self._lock:
+            for pool in self._redis_pools.values():
+                pool.disconnect()
+            self._redis_pools.clear()
+
+        while True:
+            try:
+                self._close_quietly(self._rabbitmq_pool.get_nowait())
+            except queue.Empty:
+                break
+
+
+connection_registry = ConnectionRegistry()
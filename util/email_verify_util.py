@@ -3,6 +3,7 @@ import time
 
 import pika
 
+from util.connection_registry import connection_registry
 from util.rabbitmq_util import RabbitMQUtil
 from util.redis_util import RedisUtil
 import smtplib
@@ -12,7 +13,6 @@ from conf.conf import conf
 class EmailVerifyUtil:
     def __init__(self):
         self.redis = RedisUtil()
-        self.rabbitmq = RabbitMQUtil()
 
     def _get_redis_key(self, email: str) -> str:
         return f"email_verify_code:{email}"
@@ -42,10 +42,11 @@ class EmailVerifyUtil:
 
     def send_verify_code(self, recipient_email: str):
         verify_code = str(random.uniform(0, 1))[2:8]
-        self.rabbitmq.publish_message(
-            queue_name='email_verify_queue',
-            message=f'{recipient_email}::{verify_code}'
-        )
+        with connection_registry.rabbitmq() as rabbitmq:
+            rabbitmq.publish_message(
+                queue_name='email_verify_queue',
+                message=f'{recipient_email}::{verify_code}'
+            )
 
     def verify(self, recipient_email: str, code: str) -> bool:
         saved_code = self.redis.get(self._get_redis_key(recipient_email))
@@ -61,7 +62,8 @@ class EmailVerifyUtil:
             self._send_email(recipient_email, verify_code)
             ch.basic_ack(delivery_tag=method.delivery_tag)
 
-        self.rabbitmq.consume_message(
+        # 消费者长期占用连接, 不从连接池借出
+        RabbitMQUtil().consume_message(
             queue_name='email_verify_queue',
             callback=callback,
             auto_ack=False
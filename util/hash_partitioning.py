@@ -1,26 +1,59 @@
+import bisect
 import hashlib
+from typing import List
 
-from peewee import Model
 
-from model.order_model import Orders0, Orders1, Orders2, Orders3
+def _hash32(value: str) -> int:
+    return int(hashlib.md5(value.encode()).hexdigest()[:8], 16)
 
-INDEX_MAP = {
-    0: Orders0(),
-    1: Orders1(),
-    2: Orders2(),
-    3: Orders3(),
-}
 
 class HashPartitioning:
-    def __init__(self, num_tables: int):
+    """
+    基于一致性哈希的订单分表
+
+    订单键先映射到 SLOTS 个固定槽位之一, 槽位在哈希环上的位置决定所属分表.
+    每张分表在环上放置 virtual_nodes 个虚拟节点, 分表数从 N 扩到 M 时
+    只有约 1 - N/M 的槽位(及其订单)需要迁移, 而取模方式几乎需要迁移全部订单
+    """
+
+    SLOTS = 1024
+    RING_SIZE = 1 << 32
+
+    def __init__(self, num_tables: int, virtual_nodes: int = 160, table_prefix: str = 'orders'):
         self.num_tables = num_tables
+        self.virtual_nodes = virtual_nodes
+        self.table_prefix = table_prefix
+
+        ring = sorted(
+            (_hash32(f"{self.get_table_name_by_index(index)}#{node}"), index)
+            for index in range(num_tables)
+            for node in range(virtual_nodes)
+        )
+        self._ring_points = [point for point, _ in ring]
+        self._ring_tables = [index for _, index in ring]
+        # 槽位数固定, 预先计算每个槽位所属分表
+        self._slot_tables = [self._lookup(slot * (self.RING_SIZE // self.SLOTS)) for slot in range(self.SLOTS)]
+
+    def _lookup(self, point: int) -> int:
+        position = bisect.bisect_left(self._ring_points, point)
+        if position == len(self._ring_points):
+            position = 0
+        return self._ring_tables[position]
+
+    def get_slot(self, user_id: int, product_id: int, sale_id: int) -> int:
+        return _hash32(f"order:{user_id}:{product_id}:{sale_id}") % self.SLOTS
+
+    def get_table_index_by_slot(self, slot: int) -> int:
+        return self._slot_tables[slot]
+
+    def get_table_index(self, user_id: int, product_id: int, sale_id: int) -> int:
+        return self.get_table_index_by_slot(self.get_slot(user_id, product_id, sale_id))
+
+    def get_table_name_by_index(self, index: int) -> str:
+        return f"{self.table_prefix}_{index}"
 
-    def _generate_order_index(self, user_id: int, product_id: int, sale_id: int) -> int:
-        order_str = f"order:{user_id}:{product_id}:{sale_id}"
-        hash_obj = hashlib.sha256(order_str.encode())
-        hash_hex = hash_obj.hexdigest()
-        return int(hash_hex, 16) % self.num_tables
+    def get_table_name(self, user_id: int, product_id: int, sale_id: int) -> str:
+        return self.get_table_name_by_index(self.get_table_index(user_id, product_id, sale_id))
 
-    def get_table_name(self, user_id: int, product_id: int, sale_id: int) -> Model:
-        table_index = self._generate_order_index(user_id, product_id, sale_id)
-        return f"orders_{table_index}"
\ No newline at end of file
+    def get_table_names(self) -> List[str]:
+        return [self.get_table_name_by_index(index) for index in range(self.num_tables)]
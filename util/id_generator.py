@@ -0,0 +1,291 @@
+import logging
+import os
+import threading
+import time
+import uuid
+import weakref
+from typing import List, Optional
+
+from conf.conf import conf
+from util.connection_registry import connection_registry
+
+logger = logging.getLogger(__name__)
+
+
+class ClockMovedBackwardsError(RuntimeError):
+    pass
+
+
+class RedisNodeIdAllocator:
+    """
+    通过 Redis 为每个进程分配唯一的节点ID
+
+    所有节点ID的占用记录保存在一个哈希中(节点ID -> 占用者|租约到期毫秒), 脚本只访问声明的单个键;
+    后台线程定期续期, 续期失败(租约已过期被其他进程占用)时放弃当前ID, 下次生成ID时重新分配.
+    本地记录租约的最晚到期时间, 每次续期成功后延后; Redis 持续不可用使租约到期后不再使用当前ID,
+    重新分配成功前获取节点ID抛出异常, 避免与接手该ID的进程生成重复的ID
+    """
+
+    # Lua脚本: 占用第一个空闲或租约已过期的节点ID, 以 Redis 服务器时间判断过期
+    ALLOCATE_SCRIPT = """
+    local nodes_key = KEYS[1]
+    local owner = ARGV[1]
+    local ttl_ms = tonumber(ARGV[2])
+    local max_node_id = tonumber(ARGV[3])
+    local time = redis.call('time')
+    local now = tonumber(time[1]) * 1000 + math.floor(tonumber(time[2]) / 1000)
+
+    for node_id = 0, max_node_id do
+        local claim = redis.call('hget', nodes_key, node_id)
+        if not claim or tonumber(string.match(claim, '|(%d+)$')) <= now then
+            redis.call('hset', nodes_key, node_id, owner .. '|' .. (now + ttl_ms))
+            return node_id
+        end
+    end
+    return -1
+    """
+
+    # Lua脚本: 仅当节点ID仍由自己占用时续期
+    RENEW_SCRIPT = """
+    local nodes_key = KEYS[1]
+    local node_id = ARGV[1]
+    local owner = ARGV[2]
+    local ttl_ms = tonumber(ARGV[3])
+    local claim = redis.call('hget', nodes_key, node_id)
+    if not claim or string.match(claim, '^(.*)|') ~= owner then
+        return 0
+    end
+    local time = redis.call('time')
+    local now = tonumber(time[1]) * 1000 + math.floor(tonumber(time[2]) / 1000)
+    redis.call('hset', nodes_key, node_id, owner .. '|' .. (now + ttl_ms))
+    return 1
+    """
+
+    # Lua脚本: 仅当节点ID仍由自己占用时释放
+    RELEASE_SCRIPT = """
+    local claim = redis.call('hget', KEYS[1], ARGV[1])
+    if claim and string.match(claim, '^(.*)|') == ARGV[2] then
+        return redis.call('hdel', KEYS[1], ARGV[1])
+    end
+    return 0
+    """
+
+    def __init__(self, namespace: str = 'id_generator:node', ttl: int = 60, max_node_id: int = 1023):
+        self.redis_client = connection_registry.redis(decode_responses=True)
+        self.namespace = namespace
+        self.ttl = ttl
+        self.max_node_id = max_node_id
+        self.owner = f"{uuid.uuid4().hex}:{os.getpid()}"
+        self._node_id = None
+        # 本地估计的租约到期时间(monotonic), 以发起请求的时刻计算, 不晚于 Redis 中的到期时间
+        self._lease_deadline = 0.0
+        self._lock = threading.Lock()
+        self._heartbeat = None
+
+        self._allocate_script = self.redis_client.register_script(self.ALLOCATE_SCRIPT)
+        self._renew_script = self.redis_client.register_script(self.RENEW_SCRIPT)
+        self._release_script = self.redis_client.register_script(self.RELEASE_SCRIPT)
+
+    @property
+    def node_id(self) -> int:
+        node_id = self._node_id
+        if node_id is None or time.monotonic() >= self._lease_deadline:
+            with self._lock:
+                if self._node_id is not None and time.monotonic() >= self._lease_deadline:
+                    logger.error(f"节点ID {self._node_id} 的租约已到期, 重新分配")
+                    self._node_id = None
+                if self._node_id is None:
+                    self._allocate()
+                node_id = self._node_id
+        return node_id
+
+    def _allocate(self):
+        started = time.monotonic()
+        node_id = self._allocate_script(keys=[self.namespace], args=[self.owner, int(self.ttl * 1000), self.max_node_id])
+        if node_id < 0:
+            raise RuntimeError("没有空闲的节点ID")
+        self._lease_deadline = started + self.ttl
+        self._node_id = node_id
+        logger.info(f"分配到节点ID {node_id}")
+
+        if self._heartbeat is None or not self._heartbeat.is_alive():
+            self._heartbeat = threading.Thread(target=self._renew_loop, daemon=True)
+            self._heartbeat.start()
+
+    def _renew_loop(self):
+        while True:
+            time.sleep(self.ttl / 3)
+            node_id = self._node_id
+            if node_id is None:
+                continue
+            started = time.monotonic()
+            try:
+                renewed = self._renew_script(keys=[self.namespace], args=[node_id, self.owner, int(self.ttl * 1000)])
+            except Exception as e:
+                # 租约到期前仍可使用当前ID, 到期后由 node_id 重新分配
+                logger.error(f"节点ID续期失败: {e}")
+                continue
+            with self._lock:
+                if self._node_id != node_id:
+                    continue
+                if renewed:
+                    self._lease_deadline = started + self.ttl
+                else:
+                    logger.error(f"节点ID {node_id} 已被其他进程占用, 重新分配")
+                    self._node_id = None
+
+    def reset(self):
+        """fork 后子进程调用: 父进程占用的节点ID不能复用"""
+        self.owner = f"{uuid.uuid4().hex}:{os.getpid()}"
+        self._node_id = None
+        self._lease_deadline = 0.0
+        self._heartbeat = None
+        self._lock = threading.Lock()
+
+    def release(self):
+        """进程退出前归还节点ID"""
+        node_id = self._node_id
+        if node_id is not None:
+            self._node_id = None
+            self._release_script(keys=[self.namespace], args=[node_id, self.owner])
+
+
+class SnowflakeIdGenerator:
+    """
+    雪花算法ID生成器, 生成按时间递增的 63 位整数
+
+    | 41 位毫秒时间戳(相对 EPOCH) | 10 位节点ID | 12 位毫秒内序号 |
+
+    每毫秒序号用尽或时钟小幅回拨时借用后续的毫秒继续生成, 不等待时钟;
+    借用超过 max_backward_ms 时抛出 ClockMovedBackwardsError, 避免长时间偏离真实时间
+    """
+
+    EPOCH = 1704067200000  # 2024-01-01 00:00:00 UTC, 毫秒
+    NODE_BITS = 10
+    SEQUENCE_BITS = 12
+    MAX_NODE_ID = (1 << NODE_BITS) - 1
+    MAX_SEQUENCE = (1 << SEQUENCE_BITS) - 1
+    TIMESTAMP_SHIFT = NODE_BITS + SEQUENCE_BITS
+
+    def __init__(
+            self,
+            node_id: Optional[int] = None,
+            allocator: Optional[RedisNodeIdAllocator] = None,
+            max_backward_ms: int = 1000
+    ):
+        """
+        Args:
+            node_id: 固定的节点ID, 0 ~ MAX_NODE_ID
+            allocator: 未指定 node_id 时由 Redis 分配节点ID
+            max_backward_ms: 允许借用的最大毫秒数
+            node_id 与 allocator 都未指定时按进程号生成节点ID, 多台机器或多个容器部署时会冲突, 仅用于单机开发
+        """
+        if node_id is not None and not 0 <= node_id <= self.MAX_NODE_ID:
+            raise ValueError(f"node_id must be between 0 and {self.MAX_NODE_ID}")
+        self._fixed_node_id = node_id
+        self.allocator = allocator
+        self.max_backward_ms = max_backward_ms
+        self._reset()
+        # fork 后子进程与父进程的状态相同, 必须更换节点ID
+        _generators.add(self)
+
+    def _reset(self):
+        self._lock = threading.Lock()
+        self._last_timestamp = -1
+        self._sequence = 0
+        if self.allocator is not None:
+            self.allocator.reset()
+        self._pid_node_id = os.getpid() & self.MAX_NODE_ID
+
+    @property
+    def node_id(self) -> int:
+        if self._fixed_node_id is not None:
+            return self._fixed_node_id
+        if self.allocator is not None:
+            return self.allocator.node_id
+        return self._pid_node_id
+
+    def next_ids(self, count: int) -> List[int]:
+        """批量生成ID, 整批只加一次锁"""
+        node_bits = self.node_id << self.SEQUENCE_BITS
+        shift = self.TIMESTAMP_SHIFT
+        max_sequence = self.MAX_SEQUENCE
+        ids = []
+
+        with self._lock:
+            now = time.time_ns() // 1_000_000
+            timestamp = self._last_timestamp
+            sequence = self._sequence
+            if now > timestamp:
+                timestamp = now
+                sequence = -1
+            elif timestamp - now > self.max_backward_ms:
+                raise ClockMovedBackwardsError(
+                    f"Clock is {timestamp - now} ms behind the last issued id"
+                )
+
+            for _ in range(count):
+                sequence += 1
+                if sequence > max_sequence:
+                    # 本毫秒序号用尽, 借用下一毫秒
+                    timestamp += 1
+                    sequence = 0
+                ids.append(((timestamp - self.EPOCH) << shift) | node_bits | sequence)
+
+            self._last_timestamp = timestamp
+            self._sequence = sequence
+        return ids
+
+    def next_id(self) -> int:
+        # 单个ID是热点路径, 与 next_ids 逻辑相同但避免构造列表
+        node_id = self.node_id
+        with self._lock:
+            now = time.time_ns() // 1_000_000
+            timestamp = self._last_timestamp
+            if now > timestamp:
+                timestamp = now
+                sequence = 0
+            else:
+                if timestamp - now > self.max_backward_ms:
+                    raise ClockMovedBackwardsError(
+                        f"Clock is {timestamp - now} ms behind the last issued id"
+                    )
+                sequence = self._sequence + 1
+                if sequence > self.MAX_SEQUENCE:
+                    timestamp += 1
+                    sequence = 0
+            self._last_timestamp = timestamp
+            self._sequence = sequence
+        return ((timestamp - self.EPOCH) << self.TIMESTAMP_SHIFT) | (node_id << self.SEQUENCE_BITS) | sequence
+
+
+_generators = weakref.WeakSet()
+
+
+def _reset_after_fork():
+    for generator in list(_generators):
+        generator._reset()
+
+
+if hasattr(os, 'register_at_fork'):
+    os.register_at_fork(after_in_child=_reset_after_fork)
+
+
+def create_id_generator() -> SnowflakeIdGenerator:
+    """
+    按配置创建ID生成器: 固定节点ID > Redis 分配节点ID > 按进程号生成节点ID
+
+    不同容器中的进程号相同, 按进程号生成节点ID会产生重复ID, 必须通过 pid_node_id 显式开启
+    """
+    if conf.id_generator.node_id is not None:
+        return SnowflakeIdGenerator(node_id=conf.id_generator.node_id, max_backward_ms=conf.id_generator.max_backward_ms)
+    if conf.id_generator.allocate_node_id:
+        return SnowflakeIdGenerator(
+            allocator=RedisNodeIdAllocator(), max_backward_ms=conf.id_generator.max_backward_ms
+        )
+    if not conf.id_generator.pid_node_id:
+        raise ValueError(
+            "id_generator: set node_id, enable allocate_node_id, "
+            "or explicitly enable pid_node_id for single-host development"
+        )
+    return SnowflakeIdGenerator(max_backward_ms=conf.id_generator.max_backward_ms)
@@ -1,9 +1,9 @@
 import jwt
-import redis
 import json
 from typing import Dict, Optional, Union
 from datetime import datetime, timedelta
 from conf.conf import conf
+from util.connection_registry import connection_registry
 
 class JWTRedis:
     def __init__(
@@ -28,7 +28,7 @@ class JWTRedis:
             algorithm: JWT算法,默认HS256
             token_prefix: Redis中token键的前缀
         """
-        self.redis_client = redis.Redis(
+        self.redis_client = connection_registry.redis(
             host=redis_host,
             port=redis_port,
             password=redis_password,
@@ -110,6 +110,26 @@ class JWTRedis:
 
         return token_info
 
+    def decode_token(self, token: str) -> Optional[Dict]:
+        """
+        仅校验token签名与有效期, 不访问Redis
+
+        Args:
+            token: JWT token
+
+        Returns:
+            Dict: token的payload
+            None: token无效时返回None
+        """
+        try:
+            return jwt.decode(
+                token,
+                self.secret_key,
+                algorithms=[self.algorithm]
+            )
+        except jwt.InvalidTokenError:
+            return None
+
     def verify_token(self, token: str) -> Optional[Dict]:
         """
         验证token
@@ -0,0 +1,96 @@
+import logging
+import time
+from typing import Iterable, List, Tuple
+
+from util.connection_registry import connection_registry
+
+logger = logging.getLogger(__name__)
+
+
+class OrderDeadlineQueue:
+    """
+    基于 Redis 有序集合的订单到期队列
+
+    成员为 {订单ID}:{用户ID}:{活动ID}, 分数为到期时间(毫秒). 取出到期订单时不删除成员,
+    而是将分数推后 lease 毫秒作为租约; 处理完成后确认删除, 处理进程崩溃时租约到期后重新被取出.
+    取出与续租由一个 Lua 脚本原子完成, 多个处理进程不会取到同一订单
+    """
+
+    # Lua脚本: 取出到期的成员并续租
+    CLAIM_SCRIPT = """
+    local queue_key = KEYS[1]
+    local now = tonumber(ARGV[1])
+    local count = tonumber(ARGV[2])
+    local lease_until = tonumber(ARGV[3])
+
+    local members = redis.call('zrangebyscore', queue_key, '-inf', now, 'LIMIT', 0, count)
+    for _, member in ipairs(members) do
+        redis.call('zadd', queue_key, 'XX', lease_until, member)
+    end
+    return members
+    """
+
+    def __init__(self, namespace: str = 'order_deadline', lease: float = 60):
+        """
+        Args:
+            namespace: 有序集合的键
+            lease: 取出的订单的租约时长, 秒
+        """
+        self.redis_client = connection_registry.redis(decode_responses=True)
+        self.queue_key = namespace
+        self.lease_ms = int(lease * 1000)
+        self._claim_script = self.redis_client.register_script(self.CLAIM_SCRIPT)
+
+    @staticmethod
+    def _format_member(order_id: str, user_id: int, sale_id: int) -> str:
+        return f"{order_id}:{user_id}:{sale_id}"
+
+    @staticmethod
+    def _parse_member(member: str) -> Tuple[str, int, int]:
+        order_id, user_id, sale_id = member.rsplit(':', 2)
+        return order_id, int(user_id), int(sale_id)
+
+    def add(self, orders: Iterable[Tuple[str, int, int, int]]) -> bool:
+        """
+        批量加入队列
+
+        Args:
+            orders: (订单ID, 用户ID, 活动ID, 到期时间毫秒)
+        """
+        mapping = {
+            self._format_member(order_id, user_id, sale_id): deadline_ms
+            for order_id, user_id, sale_id, deadline_ms in orders
+        }
+        if not mapping:
+            return True
+        try:
+            self.redis_client.zadd(self.queue_key, mapping)
+            return True
+        except Exception as e:
+            logger.error(f"写入订单到期队列失败: {e}")
+            return False
+
+    def claim(self, count: int, now_ms: int = None) -> List[Tuple[str, int, int]]:
+        """
+        取出最多 count 个已到期的订单
+
+        Returns:
+            List[Tuple[str, int, int]]: (订单ID, 用户ID, 活动ID)
+        """
+        if now_ms is None:
+            now_ms = time.time_ns() // 1_000_000
+        members = self._claim_script(keys=[self.queue_key], args=[now_ms, count, now_ms + self.lease_ms])
+        return [self._parse_member(member) for member in members]
+
+    def ack(self, orders: Iterable[Tuple[str, int, int]]) -> int:
+        """处理完成后从队列中删除"""
+        members = [self._format_member(*order) for order in orders]
+        if not members:
+            return 0
+        return self.redis_client.zrem(self.queue_key, *members)
+
+    def size(self) -> int:
+        return self.redis_client.zcard(self.queue_key)
+
+    def clear(self):
+        self.redis_client.delete(self.queue_key)
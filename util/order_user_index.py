@@ -0,0 +1,130 @@
+import logging
+from typing import Iterable, List, Optional, Tuple
+
+from util.connection_registry import connection_registry
+
+logger = logging.getLogger(__name__)
+
+
+class OrderUserIndex:
+    """
+    按用户维护的订单二级索引
+
+    每个用户一个有序集合(订单ID -> 下单时间毫秒)和一个哈希(订单ID -> 订单状态),
+    查询用户订单时先读索引得到订单ID, 再按订单ID中的路由槽位定向查询分表.
+    索引在订单事务提交后写入, 写入失败时索引可能落后于分表, 由 OrderService.rebuild_user_index 修复
+    """
+
+    # Lua脚本: 只更新索引中已存在的订单状态, KEYS[i] 为状态哈希, ARGV 依次为订单ID与状态
+    UPDATE_STATUS_SCRIPT = """
+    local updated = 0
+    for i, status_key in ipairs(KEYS) do
+        local order_id = ARGV[2 * i - 1]
+        if redis.call('hexists', status_key, order_id) == 1 then
+            redis.call('hset', status_key, order_id, ARGV[2 * i])
+            updated = updated + 1
+        end
+    end
+    return updated
+    """
+
+    def __init__(self, namespace: str = 'user_orders'):
+        self.redis_client = connection_registry.redis(decode_responses=True)
+        self.namespace = namespace
+        self._update_status_script = self.redis_client.register_script(self.UPDATE_STATUS_SCRIPT)
+
+    def _get_index_key(self, user_id: int) -> str:
+        return f"{self.namespace}:{user_id}"
+
+    def _get_status_key(self, user_id: int) -> str:
+        return f"{self.namespace}:{user_id}:status"
+
+    def add(self, orders: Iterable[Tuple[int, str, int, str]]) -> bool:
+        """
+        批量写入索引
+
+        Args:
+            orders: (用户ID, 订单ID, 下单时间毫秒, 订单状态)
+        """
+        try:
+            with self.redis_client.pipeline(transaction=False) as pipe:
+                for user_id, order_id, created_ms, status in orders:
+                    pipe.zadd(self._get_index_key(user_id), {order_id: created_ms})
+                    pipe.hset(self._get_status_key(user_id), order_id, status)
+                pipe.execute()
+            return True
+        except Exception as e:
+            logger.error(f"写入用户订单索引失败: {e}")
+            return False
+
+    def update_status(self, user_id: int, order_id: str, status: str) -> bool:
+        return self.update_statuses([(user_id, order_id, status)])
+
+    def update_statuses(self, orders: Iterable[Tuple[int, str, str]]) -> bool:
+        """
+        批量更新索引中的订单状态, 一次脚本调用完成; 只更新索引中已存在的订单,
+        判断与写入在同一脚本中执行, 不会与 remove 交错而写回已删除的订单
+
+        Args:
+            orders: (用户ID, 订单ID, 订单状态)
+        """
+        orders = list(orders)
+        if not orders:
+            return True
+        try:
+            self._update_status_script(
+                keys=[self._get_status_key(user_id) for user_id, _, _ in orders],
+                args=[value for _, order_id, status in orders for value in (order_id, status)]
+            )
+            return True
+        except Exception as e:
+            logger.error(f"批量更新用户订单索引失败: {e}")
+            return False
+
+    def remove(self, user_id: int, order_id: str) -> bool:
+        try:
+            with self.redis_client.pipeline(transaction=False) as pipe:
+                pipe.zrem(self._get_index_key(user_id), order_id)
+                pipe.hdel(self._get_status_key(user_id), order_id)
+                pipe.execute()
+            return True
+        except Exception as e:
+            logger.error(f"删除用户订单索引失败: {e}")
+            return False
+
+    def page(
+            self,
+            user_id: int,
+            offset: int = 0,
+            limit: int = 20,
+            status: Optional[str] = None,
+            chunk_size: int = 200
+    ) -> List[str]:
+        """按下单时间倒序返回用户的订单ID, 可按状态过滤"""
+        index_key = self._get_index_key(user_id)
+        if status is None:
+            return self.redis_client.zrevrange(index_key, offset, offset + limit - 1)
+
+        # 按状态过滤时分块读取索引, 直到凑满一页
+        order_ids = []
+        skipped = 0
+        start = 0
+        while len(order_ids) < limit:
+            chunk = self.redis_client.zrevrange(index_key, start, start + chunk_size - 1)
+            if not chunk:
+                break
+            statuses = self.redis_client.hmget(self._get_status_key(user_id), chunk)
+            for order_id, order_status in zip(chunk, statuses):
+                if order_status != status:
+                    continue
+                if skipped < offset:
+                    skipped += 1
+                    continue
+                order_ids.append(order_id)
+                if len(order_ids) == limit:
+                    break
+            start += chunk_size
+        return order_ids
+
+    def clear(self, user_id: int):
+        self.redis_client.delete(self._get_index_key(user_id), self._get_status_key(user_id))
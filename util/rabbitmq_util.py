@@ -18,18 +18,81 @@ class RabbitMQUtil:
         )
         self.channel = self.conn.channel()
         self.logger = logging.getLogger(__name__)
+        # 已在当前通道上声明过的队列
+        self._declared = set()
 
-    def publish_message(self, queue_name, message, exchange=''):
-        self.channel.queue_declare(queue=queue_name)
-        self.channel.basic_publish(exchange=exchange, routing_key=queue_name, body=message)
+    def _declare(self, queue_name):
+        """声明持久化队列, 每个通道只声明一次"""
+        if queue_name not in self._declared:
+            self.channel.queue_declare(queue=queue_name, durable=True)
+            self._declared.add(queue_name)
+
+    def publish_message(self, queue_name, message, exchange='', headers=None):
+        self._declare(queue_name)
+        self.channel.basic_publish(
+            exchange=exchange,
+            routing_key=queue_name,
+            body=message,
+            properties=pika.BasicProperties(delivery_mode=2, headers=headers)
+        )
         self.logger.info(f"Published message to queue '{queue_name}': {message}")
 
     def consume_message(self, queue_name, callback, auto_ack=True):
-        self.channel.queue_declare(queue=queue_name)
+        self._declare(queue_name)
         self.channel.basic_consume(queue=queue_name, on_message_callback=callback, auto_ack=auto_ack)
         self.logger.info(f"Started consuming messages from queue '{queue_name}'")
         self.channel.start_consuming()
 
+    def consume_batch(self, queue_name, handler, batch_size=100, flush_interval=0.05, max_retries=3):
+        """
+        批量消费消息
+
+        累积到 batch_size 条或空闲 flush_interval 秒后调用 handler(bodies), 处理成功后一次性确认整批消息;
+        失败则逐条重新处理, 找出失败的消息重新投递到队尾并在消息头中累计重试次数,
+        超过 max_retries 次后转入死信队列 <queue_name>.dead, 避免一条坏消息使整批反复重新入队
+        """
+        self._declare(queue_name)
+        self.channel.basic_qos(prefetch_count=batch_size)
+        self.logger.info(f"Started batch consuming messages from queue '{queue_name}'")
+
+        messages = []
+        for method, properties, body in self.channel.consume(queue_name, inactivity_timeout=flush_interval):
+            if method is not None:
+                messages.append((method, properties, body))
+                if len(messages) < batch_size:
+                    continue
+
+            if not messages:
+                continue
+
+            try:
+                handler([body for _, _, body in messages])
+            except Exception as e:
+                self.logger.error(f"Batch handler failed, retry {len(messages)} messages one by one: {e}")
+                for message in messages:
+                    self._handle_one(queue_name, handler, message, max_retries)
+            self.channel.basic_ack(delivery_tag=messages[-1][0].delivery_tag, multiple=True)
+            messages = []
+
+    def _handle_one(self, queue_name, handler, message, max_retries):
+        """单独处理一条消息, 失败时重新投递或转入死信队列, 由调用方统一确认"""
+        method, properties, body = message
+        try:
+            handler([body])
+            return
+        except Exception as e:
+            error = e
+
+        headers = dict(properties.headers or {})
+        retries = headers.get('x-retries', 0) + 1
+        if retries > max_retries:
+            self.logger.error(f"Message failed {max_retries} retries, dead-lettered: {error}")
+            self.publish_message(f'{queue_name}.dead', body, headers=headers)
+        else:
+            self.logger.warning(f"Message failed, requeue for retry {retries}/{max_retries}: {error}")
+            headers['x-retries'] = retries
+            self.publish_message(queue_name, body, headers=headers)
+
     def close(self):
         self.conn.close()
         self.logger.info("RabbitMQ connection closed.")
@@ -1,7 +1,7 @@
-import redis
 from redis.exceptions import RedisError
 from typing import Optional, Union, List, Dict
 from conf.conf import conf
+from util.connection_registry import connection_registry
 
 class RedisUtil:
     def __init__(self,
@@ -11,7 +11,7 @@ class RedisUtil:
                  password: str = conf.redis.password) -> None:
         """初始化 Redis 连接，测试连接是否成功。"""
         try:
-            self.client = redis.Redis(host=host, port=port, db=db, password=password)
+            self.client = connection_registry.redis(host=host, port=port, db=db, password=password)
             self.client.ping()  # 测试连接
         except RedisError as error:
             raise ConnectionError(f"无法连接到 Redis 服务器: {error}")
@@ -24,6 +24,14 @@ class RedisUtil:
             print(f"设置键 {key} 时发生错误: {error}")
             return False
 
+    def set_nx(self, key: str, value: Union[str, bytes], expire: Optional[int] = None) -> Optional[bool]:
+        """仅当键不存在时设置键值对，返回是否设置成功；Redis 出错时返回 None，与键已存在区分。"""
+        try:
+            return bool(self.client.set(key, value, ex=expire, nx=True))
+        except RedisError as error:
+            print(f"设置键 {key} 时发生错误: {error}")
+            return None
+
     def get(self, key: str) -> Optional[Union[str, bytes]]:
         """从 Redis 中获取一个键的值。"""
         try:
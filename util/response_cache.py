@@ -0,0 +1,79 @@
+import functools
+import hashlib
+
+from flask import Response, current_app, request
+
+from util.two_tier_cache import TwoTierCache
+
+
+class ResponseCache:
+    """
+    GET 接口的响应缓存
+
+    缓存序列化完成的响应体与 ETag, 命中时直接返回, 不再执行视图与 JSON 编码;
+    请求携带匹配的 If-None-Match 时返回 304. 只缓存 200 响应, 缓存键为路径加查询参数
+    """
+
+    def __init__(self, namespace: str = 'response_cache', local_ttl: float = 5.0, redis_ttl: int = 60):
+        self.cache = TwoTierCache(namespace, local_ttl=local_ttl, redis_ttl=redis_ttl)
+
+    @staticmethod
+    def _make_etag(body: bytes) -> str:
+        return hashlib.sha1(body).hexdigest()
+
+    def _make_entry(self, body: bytes, mimetype: str) -> dict:
+        return {'body': body.decode('utf-8'), 'mimetype': mimetype, 'etag': self._make_etag(body)}
+
+    def _tee(self, chunks, key: str, mimetype: str, generation, group: str):
+        """原样转发流式响应的分块, 完整发送后再写入缓存; 客户端中途断开时不缓存"""
+        parts = []
+        try:
+            for chunk in chunks:
+                parts.append(chunk.encode('utf-8') if isinstance(chunk, str) else chunk)
+                yield chunk
+        finally:
+            close = getattr(chunks, 'close', None)
+            if close is not None:
+                close()
+        self.cache.store(key, self._make_entry(b''.join(parts), mimetype), generation, group)
+
+    def cached(self, group: str):
+        """视图装饰器, group 用于按数据来源整体失效"""
+        def decorator(view):
+            @functools.wraps(view)
+            def wrapper(*args, **kwargs):
+                if request.method != 'GET':
+                    return view(*args, **kwargs)
+
+                key = request.full_path
+                entry, generation = self.cache.lookup(key, group)
+                if entry is None:
+                    response = current_app.make_response(view(*args, **kwargs))
+                    if response.status_code != 200:
+                        # 非 200 响应不缓存, 原样返回
+                        return response
+                    if response.is_streamed:
+                        # 流式响应不在内存中拼接, 边发送边收集, 本次响应不带 ETag
+                        response.response = self._tee(response.response, key, response.mimetype, generation, group)
+                        response.headers['Cache-Control'] = 'no-cache'
+                        return response
+                    entry = self._make_entry(response.get_data(), response.mimetype)
+                    self.cache.store(key, entry, generation, group)
+
+                if request.if_none_match.contains(entry['etag']):
+                    response = Response(status=304)
+                else:
+                    response = Response(entry['body'], mimetype=entry['mimetype'])
+                response.set_etag(entry['etag'])
+                # 客户端每次携带 ETag 重新校验, 数据变更后立即可见
+                response.headers['Cache-Control'] = 'no-cache'
+                return response
+
+            return wrapper
+        return decorator
+
+    def invalidate(self, *groups: str) -> bool:
+        return self.cache.invalidate(groups=groups)
+
+
+response_cache = ResponseCache()
@@ -1,22 +1,93 @@
 import json
+from datetime import date, datetime
+from decimal import Decimal
 
-from flask import jsonify
+from flask import Response, stream_with_context
+
+try:
+    import orjson
+except ImportError:  # 未安装 orjson 时使用标准库
+    orjson = None
+
+DATETIME_FORMAT = '%Y-%m-%d %H:%M:%S'
+
+
+def _default(obj):
+    """标准库无法序列化的类型: Decimal 转为字符串以保留精度, 时间统一格式"""
+    if isinstance(obj, Decimal):
+        return str(obj)
+    if isinstance(obj, datetime):
+        return obj.strftime(DATETIME_FORMAT)
+    if isinstance(obj, date):
+        return obj.isoformat()
+    raise TypeError(f'Object of type {type(obj).__name__} is not JSON serializable')
+
+
+class StdlibEncoder:
+    name = 'json'
+
+    @staticmethod
+    def dumps(obj) -> bytes:
+        return json.dumps(obj, ensure_ascii=False, separators=(',', ':'), default=_default).encode('utf-8')
+
+
+class OrjsonEncoder:
+    name = 'orjson'
 
-class ResponseUtil:
     @staticmethod
-    def success(message="Success", data=None, status_code=200):
+    def dumps(obj) -> bytes:
+        # datetime 交给 _default 处理, 非字符串键(如 Cerberus 列表元素的错误)转为字符串, 与标准库编码器输出一致
+        return orjson.dumps(obj, default=_default, option=orjson.OPT_PASSTHROUGH_DATETIME | orjson.OPT_NON_STR_KEYS)
+
+
+class ResponseUtil:
+    # 所有响应共用的 JSON 编码器, 安装了 orjson 时优先使用
+    encoder = OrjsonEncoder if orjson is not None else StdlibEncoder
+
+    @classmethod
+    def set_encoder(cls, encoder):
+        """替换编码器, encoder 需提供 dumps(obj) -> bytes"""
+        cls.encoder = encoder
+
+    @classmethod
+    def _response(cls, body, status_code, headers):
+        return Response(cls.encoder.dumps(body), status=status_code, headers=headers, mimetype='application/json')
+
+    @classmethod
+    def success(cls, message="Success", data=None, status_code=200, headers=None):
         response = {
             "status": "success",
             "message": message,
             "data": data
         }
-        return jsonify(response), status_code
+        return cls._response(response, status_code, headers)
 
-    @staticmethod
-    def error(message="Error", data=None, status_code=400):
+    @classmethod
+    def error(cls, message="Error", data=None, status_code=400, headers=None):
         response = {
             "status": "error",
             "message": message,
             "data": data
         }
-        return json.dumps(response, ensure_ascii=False), status_code
\ No newline at end of file
+        return cls._response(response, status_code, headers)
+
+    @classmethod
+    def stream_success(cls, message="Success", items=(), items_key="items", extra=None, status_code=200):
+        """
+        流式返回列表, 逐条序列化 items 而不是一次性构造完整响应体
+
+        响应结构与 success 相同: {"status", "message", "data": {items_key: [...], **extra}}
+        """
+        dumps = cls.encoder.dumps
+
+        def generate():
+            head = dumps({"status": "success", "message": message})
+            yield head[:-1] + b',"data":{' + dumps(items_key) + b':['
+            for i, item in enumerate(items):
+                yield (b',' if i else b'') + dumps(item)
+            yield b']'
+            for key, value in (extra or {}).items():
+                yield b',' + dumps(key) + b':' + dumps(value)
+            yield b'}}'
+
+        return Response(stream_with_context(generate()), status=status_code, mimetype='application/json')
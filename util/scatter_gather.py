@@ -0,0 +1,69 @@
+import heapq
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable, Iterator, List, Optional, Sequence
+
+
+class ScatterGatherExecutor:
+    """
+    并发查询多个分片并按排序键归并
+
+    每个分片由一个分页函数 fetch(cursor) 描述, cursor 为上一页最后一行的排序键(首页为None),
+    返回按排序键有序的一页数据. 各分片的首页并发查询, 消费当前页时后台预取下一页,
+    结果经 k 路归并后以生成器逐行返回, 内存占用与分片数 × 页大小成正比
+    """
+
+    def __init__(self, max_workers: int = 8):
+        self.max_workers = max_workers
+        self._executor = None
+        self._pid = None
+        self._lock = threading.Lock()
+
+    @property
+    def executor(self) -> ThreadPoolExecutor:
+        # 线程池不能跨 fork 使用, 子进程中重新创建
+        if self._pid != os.getpid():
+            with self._lock:
+                if self._pid != os.getpid():
+                    self._executor = ThreadPoolExecutor(max_workers=self.max_workers, thread_name_prefix='scatter_gather')
+                    self._pid = os.getpid()
+        return self._executor
+
+    def _iterate_shard(self, fetch: Callable[[Optional[Any]], List], key: Callable, page_size: int, first_page) -> Iterator:
+        future = first_page
+        while True:
+            page = future.result()
+            if not page:
+                return
+            has_more = len(page) >= page_size
+            if has_more:
+                future = self.executor.submit(fetch, key(page[-1]))
+            yield from page
+            if not has_more:
+                return
+
+    def merge(
+            self,
+            fetchers: Sequence[Callable[[Optional[Any]], List]],
+            key: Callable[[Any], Any],
+            page_size: int,
+            reverse: bool = False
+    ) -> Iterator:
+        """
+        Args:
+            fetchers: 每个分片的分页函数
+            key: 排序键, 同时作为分页游标
+            page_size: 分页函数每页返回的最大行数, 不足一页表示分片已读完
+            reverse: 各分片按排序键降序返回时为True
+        """
+        # 先并发提交所有分片的首页
+        first_pages = [self.executor.submit(fetch, None) for fetch in fetchers]
+        shards = [
+            self._iterate_shard(fetch, key, page_size, first_page)
+            for fetch, first_page in zip(fetchers, first_pages)
+        ]
+        return heapq.merge(*shards, key=key, reverse=reverse)
+
+
+scatter_gather = ScatterGatherExecutor()
@@ -0,0 +1,571 @@
+import json
+import logging
+import random
+import time
+import uuid
+import zlib
+from typing import List, Optional
+
+import redis
+
+from conf.conf import conf
+from util.stock_ledger import StockLedger
+
+logger = logging.getLogger(__name__)
+
+
+class ShardedStockLedger(StockLedger):
+    """
+    分片库存账本, 用于单个活动的库存键成为热点的极热商品
+
+    预热时活动库存拆分到 K 个子账本, 子账本的键带 {活动ID:分片} 哈希标签, 每个脚本只访问同一标签的键;
+    用户按哈希固定落在一个子账本上, 一人一单的购买者集合随子账本拆分.
+    目前通过 connection_registry 的单节点客户端访问, 子账本分布在同一 Redis 实例上, 拆分的是单键热点;
+    分布到 Redis Cluster 的不同槽位需要改用集群客户端.
+
+    每个子账本内 total = stock + reserved + sold, 所有子账本的 total 与调拨中的件数之和即活动总库存:
+    子账本之间调拨库存时, 调出方扣减库存并在同一脚本中记入自己的调拨日志, 调入方按调拨ID幂等地加入库存后
+    删除日志; 调拨途中进程退出时, 日志中的件数由售空子账本的调拨、库存回写进程或 rebalance 补完,
+    get_ledger 与售罄判断都将其计入可售库存, 不会丢失也不会超卖.
+
+    用户所在子账本售空时, 从库存最多的子账本调拨一半库存再重试; 所有子账本都售空时标记售罄.
+    子账本数在预热时写入活动的元数据键, 未拆分(预热时分片数为1)的活动沿用 StockLedger 的单键账本;
+    进程内缓存的子账本数 SHARDS_CACHE_TTL 秒后重新读取, 账本不存在时立即重新读取
+    """
+
+    SHARDS_CACHE_TTL = 5.0
+    # 调拨标记的保留时间(秒), 期间重复的调入被忽略
+    MOVE_MARKER_TTL = 86400
+
+    # Lua脚本: 预热一个子账本
+    WARM_UP_SHARD_SCRIPT = """
+    local ledger_key = KEYS[1]
+    local total = tonumber(ARGV[1])
+    local sold = tonumber(ARGV[2])
+
+    if redis.call('exists', ledger_key) == 1 then
+        return 0
+    end
+
+    redis.call('hset', ledger_key,
+        'total', total,
+        'stock', math.max(0, total - sold),
+        'reserved', 0,
+        'sold', sold)
+    return 1
+    """
+
+    # Lua脚本: 在子账本中预占库存, 传入购买者集合时同时完成一人一单去重; 预占后子账本售空时返回2
+    RESERVE_SHARD_SCRIPT = """
+    local ledger_key = KEYS[1]
+    local buyers_key = KEYS[2]
+    local amount = tonumber(ARGV[1])
+    local user_id = ARGV[2]
+
+    local stock = redis.call('hget', ledger_key, 'stock')
+    if not stock then
+        return -1
+    end
+
+    if buyers_key and redis.call('sismember', buyers_key, user_id) == 1 then
+        return -2
+    end
+
+    if tonumber(stock) < amount then
+        return 0
+    end
+
+    local remaining = redis.call('hincrby', ledger_key, 'stock', -amount)
+    redis.call('hincrby', ledger_key, 'reserved', amount)
+    if buyers_key then
+        redis.call('sadd', buyers_key, user_id)
+    end
+    if remaining <= 0 then
+        return 2
+    end
+    return 1
+    """
+
+    # RESERVE_SHARD_SCRIPT 的返回码: 预占成功且子账本已售空
+    SHARD_EMPTIED = 2
+
+    # Lua脚本: 确认子账本中预占的库存
+    CONFIRM_SHARD_SCRIPT = """
+    local ledger_key = KEYS[1]
+    local amount = tonumber(ARGV[1])
+
+    local reserved = tonumber(redis.call('hget', ledger_key, 'reserved') or 0)
+    if reserved < amount then
+        return 0
+    end
+
+    redis.call('hincrby', ledger_key, 'reserved', -amount)
+    redis.call('hincrby', ledger_key, 'sold', amount)
+    return 1
+    """
+
+    # Lua脚本: 释放子账本中预占的库存, 传入购买者集合时同时移除购买资格
+    RELEASE_SHARD_SCRIPT = """
+    local ledger_key = KEYS[1]
+    local buyers_key = KEYS[2]
+    local amount = tonumber(ARGV[1])
+    local user_id = ARGV[2]
+
+    local reserved = tonumber(redis.call('hget', ledger_key, 'reserved') or 0)
+    if reserved < amount then
+        return 0
+    end
+
+    redis.call('hincrby', ledger_key, 'reserved', -amount)
+    redis.call('hincrby', ledger_key, 'stock', amount)
+    if buyers_key then
+        redis.call('srem', buyers_key, user_id)
+    end
+    return 1
+    """
+
+    # Lua脚本: 退还子账本中已售的库存, 只退还仍在购买者集合中的用户
+    REFUND_SHARD_SCRIPT = """
+    local ledger_key = KEYS[1]
+    local buyers_key = KEYS[2]
+
+    local sold = tonumber(redis.call('hget', ledger_key, 'sold') or 0)
+    local refunded = 0
+    for i = 1, #ARGV do
+        if refunded >= sold then
+            break
+        end
+        if redis.call('srem', buyers_key, ARGV[i]) == 1 then
+            refunded = refunded + 1
+        end
+    end
+
+    if refunded > 0 then
+        redis.call('hincrby', ledger_key, 'sold', -refunded)
+        redis.call('hincrby', ledger_key, 'stock', refunded)
+    end
+    return refunded
+    """
+
+    # Lua脚本: 从子账本调出最多 amount 件可售库存并记入调拨日志(调拨ID -> 调入方:件数), 返回实际调出的件数
+    TAKE_SCRIPT = """
+    local ledger_key = KEYS[1]
+    local transit_key = KEYS[2]
+    local amount = tonumber(ARGV[1])
+    local move_id = ARGV[2]
+    local to_shard = ARGV[3]
+
+    local stock = tonumber(redis.call('hget', ledger_key, 'stock') or 0)
+    local taken = math.min(stock, amount)
+    if taken > 0 then
+        redis.call('hincrby', ledger_key, 'stock', -taken)
+        redis.call('hincrby', ledger_key, 'total', -taken)
+        redis.call('hset', transit_key, move_id, to_shard .. ':' .. taken)
+    end
+    return taken
+    """
+
+    # Lua脚本: 向子账本调入库存, 子账本不存在时返回0; 传入调拨标记键时按调拨去重, 已调入过的返回1
+    GIVE_SCRIPT = """
+    local ledger_key = KEYS[1]
+    local move_key = KEYS[2]
+    local amount = tonumber(ARGV[1])
+    local ttl = tonumber(ARGV[2])
+
+    if redis.call('exists', ledger_key) == 0 then
+        return 0
+    end
+    if move_key and not redis.call('set', move_key, 1, 'NX', 'EX', ttl) then
+        return 1
+    end
+
+    redis.call('hincrby', ledger_key, 'stock', amount)
+    redis.call('hincrby', ledger_key, 'total', amount)
+    return 1
+    """
+
+    def __init__(self, shards: int = conf.stock_ledger.shards, **kwargs):
+        """
+        Args:
+            shards: 新预热的活动拆分的子账本数, 已预热的活动以预热时的子账本数为准
+        """
+        super().__init__(**kwargs)
+        self.shards = shards
+        # 活动ID -> (子账本数, 过期时间), 进程内缓存
+        self._sale_shards = {}
+
+        self._warm_up_shard_script = self.redis_client.register_script(self.WARM_UP_SHARD_SCRIPT)
+        self._reserve_shard_script = self.redis_client.register_script(self.RESERVE_SHARD_SCRIPT)
+        self._confirm_shard_script = self.redis_client.register_script(self.CONFIRM_SHARD_SCRIPT)
+        self._release_shard_script = self.redis_client.register_script(self.RELEASE_SHARD_SCRIPT)
+        self._refund_shard_script = self.redis_client.register_script(self.REFUND_SHARD_SCRIPT)
+        self._take_script = self.redis_client.register_script(self.TAKE_SCRIPT)
+        self._give_script = self.redis_client.register_script(self.GIVE_SCRIPT)
+
+    @staticmethod
+    def _get_shards_key(sale_id: int) -> str:
+        return f"flash_sale:{sale_id}:shards"
+
+    @staticmethod
+    def _get_shard_ledger_key(sale_id: int, shard: int) -> str:
+        return f"flash_sale:{{{sale_id}:{shard}}}:ledger"
+
+    @staticmethod
+    def _get_shard_buyers_key(sale_id: int, shard: int) -> str:
+        return f"flash_sale:{{{sale_id}:{shard}}}:buyers"
+
+    @staticmethod
+    def _get_shard_transit_key(sale_id: int, shard: int) -> str:
+        return f"flash_sale:{{{sale_id}:{shard}}}:transit"
+
+    @staticmethod
+    def _get_shard_move_key(sale_id: int, shard: int, move_id: str) -> str:
+        return f"flash_sale:{{{sale_id}:{shard}}}:move:{move_id}"
+
+    @staticmethod
+    def _split(amount: int, shards: int) -> List[int]:
+        return [amount // shards + (1 if shard < amount % shards else 0) for shard in range(shards)]
+
+    @staticmethod
+    def _get_user_shard(user_id: int, shards: int) -> int:
+        return zlib.crc32(str(user_id).encode()) % shards
+
+    def _get_sale_shards(self, sale_id: int) -> Optional[int]:
+        """活动的子账本数, 未拆分的活动为1, 账本未预热时返回None"""
+        cached = self._sale_shards.get(sale_id)
+        if cached is not None and cached[1] > time.monotonic():
+            return cached[0]
+
+        stored = self.redis_client.get(self._get_shards_key(sale_id))
+        if stored is not None:
+            shards = int(stored)
+        elif self.redis_client.exists(self._get_ledger_key(sale_id)):
+            shards = 1
+        else:
+            return None
+        self._sale_shards[sale_id] = (shards, time.monotonic() + self.SHARDS_CACHE_TTL)
+        return shards
+
+    def _get_shard_stocks(self, sale_id: int, shards: int) -> List[int]:
+        with self.redis_client.pipeline(transaction=False) as pipe:
+            for shard in range(shards):
+                pipe.hget(self._get_shard_ledger_key(sale_id, shard), 'stock')
+            return [int(stock or 0) for stock in pipe.execute()]
+
+    def _get_available(self, sale_id: int, shards: int) -> int:
+        """所有子账本的可售库存与调拨途中的件数之和, 一次往返"""
+        with self.redis_client.pipeline(transaction=False) as pipe:
+            for shard in range(shards):
+                pipe.hget(self._get_shard_ledger_key(sale_id, shard), 'stock')
+            for shard in range(shards):
+                pipe.hvals(self._get_shard_transit_key(sale_id, shard))
+            results = pipe.execute()
+        stocks = sum(int(stock or 0) for stock in results[:shards])
+        in_transit = sum(int(value.split(':')[1]) for values in results[shards:] for value in values)
+        return stocks + in_transit
+
+    def _publish_sold_out(self, sale_id: int, sold_out: bool):
+        self.redis_client.publish(self.SOLD_OUT_KEY, json.dumps({'sale_id': sale_id, 'sold_out': sold_out}))
+
+    def _mark_sold_out(self, sale_id: int, shards: int):
+        # 标记后复查: 标记期间其他进程退还的库存会使复查失败, 撤销标记
+        if self.redis_client.sadd(self.SOLD_OUT_KEY, sale_id):
+            self._publish_sold_out(sale_id, True)
+        if self._get_available(sale_id, shards) > 0:
+            self._clear_sold_out(sale_id)
+
+    def _clear_sold_out(self, sale_id: int):
+        if self.redis_client.srem(self.SOLD_OUT_KEY, sale_id):
+            self._publish_sold_out(sale_id, False)
+
+    def warm_up(self, sale_id: int, total_stock: int, sold: int = 0) -> bool:
+        if self.shards <= 1:
+            return super().warm_up(sale_id, total_stock, sold)
+
+        # 元数据键同时作为预热标记, 已存在则不覆盖
+        if not self.redis_client.set(self._get_shards_key(sale_id), self.shards, nx=True):
+            return False
+        for shard, (shard_total, shard_sold) in enumerate(
+                zip(self._split(total_stock, self.shards), self._split(sold, self.shards))
+        ):
+            self._warm_up_shard_script(
+                keys=[self._get_shard_ledger_key(sale_id, shard)],
+                args=[shard_total, shard_sold]
+            )
+        self._sale_shards[sale_id] = (self.shards, time.monotonic() + self.SHARDS_CACHE_TTL)
+        if total_stock <= sold:
+            self._mark_sold_out(sale_id, self.shards)
+        return True
+
+    def _move(self, sale_id: int, from_shard: int, to_shard: int, amount: int) -> int:
+        """在子账本之间调拨库存, 返回实际调拨的件数"""
+        move_id = uuid.uuid4().hex
+        taken = self._take_script(
+            keys=[self._get_shard_ledger_key(sale_id, from_shard), self._get_shard_transit_key(sale_id, from_shard)],
+            args=[amount, move_id, to_shard]
+        )
+        if taken <= 0:
+            return 0
+        return self._finish_move(sale_id, from_shard, to_shard, move_id, taken)
+
+    def _give(self, sale_id: int, shard: int, amount: int, move_id: str) -> bool:
+        return bool(self._give_script(
+            keys=[self._get_shard_ledger_key(sale_id, shard), self._get_shard_move_key(sale_id, shard, move_id)],
+            args=[amount, self.MOVE_MARKER_TTL]
+        ))
+
+    def _finish_move(self, sale_id: int, from_shard: int, to_shard: int, move_id: str, amount: int) -> int:
+        """将调拨日志中的库存调入目标子账本(调入失败时退回调出方)并删除日志, 重复执行不会重复调入"""
+        moved = amount if self._give(sale_id, to_shard, amount, move_id) else 0
+        if not moved:
+            self._give(sale_id, from_shard, amount, move_id)
+        # 调拨标记保留到过期, 删除日志后仍在执行的重复调入会被忽略
+        self.redis_client.hdel(self._get_shard_transit_key(sale_id, from_shard), move_id)
+        # 调拨途中其他进程看到的库存之和偏小, 可能误标售罄
+        self._clear_sold_out(sale_id)
+        return moved
+
+    def _get_transits(self, sale_id: int, shards: int) -> List[tuple]:
+        """所有子账本的调拨日志: (调出方, 调入方, 调拨ID, 件数)"""
+        with self.redis_client.pipeline(transaction=False) as pipe:
+            for shard in range(shards):
+                pipe.hgetall(self._get_shard_transit_key(sale_id, shard))
+            transits = pipe.execute()
+        return [
+            (from_shard, int(value.split(':')[0]), move_id, int(value.split(':')[1]))
+            for from_shard, moves in enumerate(transits)
+            for move_id, value in moves.items()
+        ]
+
+    def recover_transits(self, sale_id: int) -> int:
+        """
+        补完调拨途中进程退出留下的调拨; 正在进行的调拨被并发补完时按调拨ID去重, 不会重复调入
+
+        Returns:
+            int: 补完的件数
+        """
+        shards = self._get_sale_shards(sale_id)
+        if shards is None or shards <= 1:
+            return 0
+        return sum(
+            self._finish_move(sale_id, from_shard, to_shard, move_id, amount)
+            for from_shard, to_shard, move_id, amount in self._get_transits(sale_id, shards)
+        )
+
+    def _refill(self, sale_id: int, shards: int, shard: int, amount: int) -> int:
+        """
+        子账本售空时从库存最多的子账本调拨一半库存(至少 amount 件), 返回调拨的件数;
+        调拨前先补完中途中断的调拨, 滞留在调拨日志中的库存重新可售
+        """
+        self.recover_transits(sale_id)
+        stocks = self._get_shard_stocks(sale_id, shards)
+        stocks[shard] = 0
+        donor = max(range(shards), key=lambda index: stocks[index])
+        if stocks[donor] <= 0:
+            return 0
+        return self._move(sale_id, donor, shard, max(amount, stocks[donor] // 2))
+
+    def rebalance(self, sale_id: int) -> int:
+        """
+        将各子账本的可售库存调拨均匀, 用于售空的子账本过多时批量调整
+
+        Returns:
+            int: 调拨的件数
+        """
+        shards = self._get_sale_shards(sale_id)
+        if shards is None or shards <= 1:
+            return 0
+
+        self.recover_transits(sale_id)
+        stocks = self._get_shard_stocks(sale_id, shards)
+        targets = self._split(sum(stocks), shards)
+        donors = [[shard, stocks[shard] - targets[shard]] for shard in range(shards) if stocks[shard] > targets[shard]]
+        moved = 0
+        for shard in range(shards):
+            deficit = targets[shard] - stocks[shard]
+            while deficit > 0 and donors:
+                donor = donors[-1]
+                taken = self._move(sale_id, donor[0], shard, min(deficit, donor[1]))
+                if taken <= 0:
+                    # 调出方的库存已被并发预占
+                    donors.pop()
+                    continue
+                deficit -= taken
+                donor[1] -= taken
+                moved += taken
+                if donor[1] <= 0:
+                    donors.pop()
+        return moved
+
+    def _reserve_in_shard(self, sale_id: int, shards: int, shard: int, amount: int, user_id: Optional[int]) -> int:
+        keys = [self._get_shard_ledger_key(sale_id, shard)]
+        args = [amount]
+        if user_id is not None:
+            keys.append(self._get_shard_buyers_key(sale_id, shard))
+            args.append(user_id)
+
+        result = self._reserve_shard_script(keys=keys, args=args)
+        if result == self.SOLD_OUT and self._refill(sale_id, shards, shard, amount) > 0:
+            result = self._reserve_shard_script(keys=keys, args=args)
+        if result in (self.SOLD_OUT, self.SHARD_EMPTIED) and self._get_available(sale_id, shards) <= 0:
+            self._mark_sold_out(sale_id, shards)
+        return self.ADMITTED if result == self.SHARD_EMPTIED else result
+
+    def reserve(self, sale_id: int, amount: int = 1) -> bool:
+        try:
+            shards = self._get_sale_shards(sale_id)
+            if shards is None or shards <= 1:
+                return super().reserve(sale_id, amount)
+            return self._reserve_in_shard(sale_id, shards, random.randrange(shards), amount, None) == self.ADMITTED
+        except redis.RedisError as e:
+            logger.error(f"预占库存失败: {str(e)}")
+            return False
+
+    def admit(self, sale_id: int, user_id: int, amount: int = 1) -> int:
+        try:
+            shards = self._get_sale_shards(sale_id)
+            if shards is None or shards <= 1:
+                result = super().admit(sale_id, user_id, amount)
+            else:
+                result = self._reserve_in_shard(
+                    sale_id, shards, self._get_user_shard(user_id, shards), amount, user_id
+                )
+            # 账本不存在时缓存的子账本数可能已过时(活动被删除后按新的子账本数重新预热)
+            if result == self.NOT_READY and shards is not None and self._refresh_sale_shards(sale_id, shards):
+                return self.admit(sale_id, user_id, amount)
+            return result
+        except redis.RedisError as e:
+            logger.error(f"预占库存失败: {str(e)}")
+            return self.NOT_READY
+
+    def _refresh_sale_shards(self, sale_id: int, shards: int) -> bool:
+        """丢弃缓存的子账本数并重新读取, 返回子账本数是否变化"""
+        self._sale_shards.pop(sale_id, None)
+        refreshed = self._get_sale_shards(sale_id)
+        return refreshed is not None and refreshed != shards
+
+    def _get_candidate_shards(self, shards: int, user_id: Optional[int]) -> List[int]:
+        """用户的子账本; 未指定用户时依次尝试所有子账本"""
+        if user_id is not None:
+            return [self._get_user_shard(user_id, shards)]
+        return list(range(shards))
+
+    def confirm(self, sale_id: int, amount: int = 1, user_id: int = None) -> bool:
+        try:
+            shards = self._get_sale_shards(sale_id)
+            if shards is None or shards <= 1:
+                return super().confirm(sale_id, amount)
+            for shard in self._get_candidate_shards(shards, user_id):
+                if self._confirm_shard_script(keys=[self._get_shard_ledger_key(sale_id, shard)], args=[amount]):
+                    self.mark_dirty(sale_id)
+                    return True
+            return False
+        except redis.RedisError as e:
+            logger.error(f"确认库存失败: {str(e)}")
+            return False
+
+    def release(self, sale_id: int, amount: int = 1, user_id: int = None) -> bool:
+        try:
+            shards = self._get_sale_shards(sale_id)
+            if shards is None or shards <= 1:
+                return super().release(sale_id, amount, user_id)
+            for shard in self._get_candidate_shards(shards, user_id):
+                keys = [self._get_shard_ledger_key(sale_id, shard)]
+                args = [amount]
+                if user_id is not None:
+                    keys.append(self._get_shard_buyers_key(sale_id, shard))
+                    args.append(user_id)
+                if self._release_shard_script(keys=keys, args=args):
+                    self._clear_sold_out(sale_id)
+                    return True
+            return False
+        except redis.RedisError as e:
+            logger.error(f"释放库存失败: {str(e)}")
+            return False
+
+    def refund(self, sale_id: int, user_ids: List[int]) -> int:
+        if not user_ids:
+            return 0
+        try:
+            shards = self._get_sale_shards(sale_id)
+            if shards is None or shards <= 1:
+                return super().refund(sale_id, user_ids)
+
+            shard_users = {}
+            for user_id in user_ids:
+                shard_users.setdefault(self._get_user_shard(user_id, shards), []).append(user_id)
+            refunded = sum(
+                self._refund_shard_script(
+                    keys=[self._get_shard_ledger_key(sale_id, shard), self._get_shard_buyers_key(sale_id, shard)],
+                    args=users
+                )
+                for shard, users in shard_users.items()
+            )
+            if refunded:
+                self.mark_dirty(sale_id)
+                self._clear_sold_out(sale_id)
+            return refunded
+        except redis.RedisError as e:
+            logger.error(f"退还库存失败: {str(e)}")
+            return -1
+
+    def add_stock(self, sale_id: int, amount: int) -> bool:
+        try:
+            shards = self._get_sale_shards(sale_id)
+            if shards is None or shards <= 1:
+                return super().add_stock(sale_id, amount)
+            for shard, shard_amount in enumerate(self._split(amount, shards)):
+                if shard_amount and not self._give_script(
+                        keys=[self._get_shard_ledger_key(sale_id, shard)], args=[shard_amount, 0]
+                ):
+                    return False
+            self._clear_sold_out(sale_id)
+            return True
+        except redis.RedisError as e:
+            logger.error(f"追加库存失败: {str(e)}")
+            return False
+
+    def get_ledger(self, sale_id: int) -> dict:
+        """获取所有子账本汇总的快照, 账本不存在时返回空字典"""
+        shards = self._get_sale_shards(sale_id)
+        if shards is None or shards <= 1:
+            return super().get_ledger(sale_id)
+
+        with self.redis_client.pipeline(transaction=False) as pipe:
+            for shard in range(shards):
+                pipe.hgetall(self._get_shard_ledger_key(sale_id, shard))
+            shard_ledgers = pipe.execute()
+        ledger = {}
+        for shard_ledger in shard_ledgers:
+            for field, value in shard_ledger.items():
+                ledger[field] = ledger.get(field, 0) + int(value)
+        # 调拨途中的库存已从调出方扣减、尚未加到调入方, 计入可售库存
+        in_transit = sum(amount for _, _, _, amount in self._get_transits(sale_id, shards))
+        if ledger and in_transit:
+            ledger['total'] += in_transit
+            ledger['stock'] += in_transit
+        return ledger
+
+    def remove(self, sale_id: int) -> bool:
+        """删除所有子账本、购买者集合与元数据"""
+        shards = self._get_sale_shards(sale_id)
+        self._sale_shards.pop(sale_id, None)
+        if shards is None or shards <= 1:
+            return super().remove(sale_id)
+
+        keys = [self._get_shards_key(sale_id)]
+        for shard in range(shards):
+            keys.append(self._get_shard_ledger_key(sale_id, shard))
+            keys.append(self._get_shard_buyers_key(sale_id, shard))
+            keys.append(self._get_shard_transit_key(sale_id, shard))
+        # 各子账本位于不同槽位, 逐个删除
+        deleted = sum(self.redis_client.delete(key) for key in keys)
+        self._clear_sold_out(sale_id)
+        return bool(deleted)
+
+
+def create_stock_ledger() -> StockLedger:
+    """按配置创建库存账本: stock_ledger.shards 大于1时使用分片账本"""
+    if conf.stock_ledger.shards > 1:
+        return ShardedStockLedger()
+    return StockLedger()
@@ -0,0 +1,89 @@
+import json
+import logging
+import os
+import threading
+import time
+
+from util.connection_registry import connection_registry
+from util.stock_ledger import StockLedger
+
+logger = logging.getLogger(__name__)
+
+
+class SoldOutFlags:
+    """
+    进程内的售罄标记表
+
+    库存账本的 Lua 脚本在可售库存归零/恢复时维护 Redis 中的售罄集合并广播,
+    每个进程订阅广播更新本地标记, 抢购路径只读本地标记, 售罄后的请求不经过任何网络 I/O.
+    订阅后从售罄集合全量加载, 订阅断开时清空标记并在下次查询时重新订阅, 避免错过广播;
+    订阅失败后 RETRY_INTERVAL 秒内不再重试, Redis 不可用时抢购路径不会每次都尝试连接
+    """
+
+    RETRY_INTERVAL = 1.0
+
+    def __init__(self, channel: str = StockLedger.SOLD_OUT_KEY):
+        self.channel = channel
+        self.redis_client = connection_registry.redis(decode_responses=True)
+
+        self._sold_out = frozenset()
+        self._lock = threading.Lock()
+        self._listener_pid = None
+        self._thread = None
+        self._retry_at = 0.0
+
+    def _ensure_listener(self):
+        # 订阅线程不会随 fork 复制到子进程, 按 pid 判断是否需要启动
+        if self._listener_pid == os.getpid() or time.monotonic() < self._retry_at:
+            return
+        with self._lock:
+            if self._listener_pid == os.getpid() or time.monotonic() < self._retry_at:
+                return
+            pubsub = None
+            try:
+                pubsub = self.redis_client.pubsub(ignore_subscribe_messages=True)
+                pubsub.subscribe(**{self.channel: self._on_message})
+                # 先订阅再加载, 加载期间的变化在订阅线程启动后补上
+                self._sold_out = frozenset(int(sale_id) for sale_id in self.redis_client.smembers(self.channel))
+                self._thread = pubsub.run_in_thread(
+                    sleep_time=1.0, daemon=True, exception_handler=self._on_listener_error
+                )
+            except Exception as e:
+                logger.error(f"订阅售罄标记失败: {e}")
+                if pubsub is not None:
+                    pubsub.close()
+                self._retry_at = time.monotonic() + self.RETRY_INTERVAL
+                return
+            self._listener_pid = os.getpid()
+
+    def _on_message(self, message):
+        data = json.loads(message['data'])
+        with self._lock:
+            if data['sold_out']:
+                self._sold_out = self._sold_out | {data['sale_id']}
+            else:
+                self._sold_out = self._sold_out - {data['sale_id']}
+
+    def _on_listener_error(self, e, pubsub, thread):
+        # 断线期间可能错过广播: 停止订阅线程并清空标记(退回到查询账本), 下次查询时重新订阅并全量加载
+        logger.error(f"售罄标记订阅异常: {e}")
+        thread.stop()
+        with self._lock:
+            self._sold_out = frozenset()
+            self._listener_pid = None
+
+    def close(self):
+        """停止订阅线程, 之后的查询会重新订阅"""
+        with self._lock:
+            if self._thread is not None:
+                self._thread.stop()
+                self._thread = None
+            self._sold_out = frozenset()
+            self._listener_pid = None
+
+    def is_sold_out(self, sale_id: int) -> bool:
+        self._ensure_listener()
+        return sale_id in self._sold_out
+
+
+sold_out_flags = SoldOutFlags()
@@ -0,0 +1,359 @@
+import json
+import logging
+from typing import List
+
+import redis
+
+from conf.conf import conf
+from util.connection_registry import connection_registry
+
+logger = logging.getLogger(__name__)
+
+
+class StockLedger:
+    """
+    基于 Redis 的秒杀库存账本
+
+    每个秒杀活动对应一个哈希:
+        total    秒杀总库存
+        stock    可售库存
+        reserved 已预占、待确认的库存
+        sold     已售数量
+    预占/确认/释放均由单个 Lua 脚本原子完成, 已售数量通过脏集合异步回写 MySQL.
+    可售库存归零或恢复时, 脚本同时维护售罄集合并在同名频道上广播, 见 SoldOutFlags
+    """
+
+    SOLD_OUT_KEY = 'flash_sale:sold_out'
+
+    # Lua函数: 按可售库存维护售罄集合, 状态变化时广播
+    SOLD_OUT_FUNCTION = """
+    local function update_sold_out(sold_out_key, sale_id, stock)
+        if stock <= 0 then
+            if redis.call('sadd', sold_out_key, sale_id) == 1 then
+                redis.call('publish', sold_out_key, cjson.encode({sale_id = tonumber(sale_id), sold_out = true}))
+            end
+        elseif redis.call('srem', sold_out_key, sale_id) == 1 then
+            redis.call('publish', sold_out_key, cjson.encode({sale_id = tonumber(sale_id), sold_out = false}))
+        end
+    end
+    """
+
+    # Lua脚本: 活动开始时预热账本, 已存在则不覆盖
+    WARM_UP_SCRIPT = SOLD_OUT_FUNCTION + """
+    local ledger_key = KEYS[1]
+    local sold_out_key = KEYS[2]
+    local total = tonumber(ARGV[1])
+    local sold = tonumber(ARGV[2])
+    local sale_id = ARGV[3]
+
+    if redis.call('exists', ledger_key) == 1 then
+        return 0
+    end
+
+    local stock = math.max(0, total - sold)
+    redis.call('hset', ledger_key,
+        'total', total,
+        'stock', stock,
+        'reserved', 0,
+        'sold', sold)
+    update_sold_out(sold_out_key, sale_id, stock)
+    return 1
+    """
+
+    # Lua脚本: 预占库存, 传入购买者集合时同时完成一人一单去重
+    RESERVE_SCRIPT = SOLD_OUT_FUNCTION + """
+    local ledger_key = KEYS[1]
+    local sold_out_key = KEYS[2]
+    local buyers_key = KEYS[3]
+    local amount = tonumber(ARGV[1])
+    local sale_id = ARGV[2]
+    local user_id = ARGV[3]
+
+    local stock = redis.call('hget', ledger_key, 'stock')
+    if not stock then
+        return -1
+    end
+
+    if buyers_key and redis.call('sismember', buyers_key, user_id) == 1 then
+        return -2
+    end
+
+    stock = tonumber(stock)
+    if stock < amount then
+        if stock <= 0 then
+            update_sold_out(sold_out_key, sale_id, stock)
+        end
+        return 0
+    end
+
+    stock = redis.call('hincrby', ledger_key, 'stock', -amount)
+    redis.call('hincrby', ledger_key, 'reserved', amount)
+    if stock <= 0 then
+        update_sold_out(sold_out_key, sale_id, stock)
+    end
+    if buyers_key then
+        redis.call('sadd', buyers_key, user_id)
+    end
+    return 1
+    """
+
+    # Lua脚本: 确认预占库存, 计入已售并标记待回写
+    CONFIRM_SCRIPT = """
+    local ledger_key = KEYS[1]
+    local dirty_key = KEYS[2]
+    local amount = tonumber(ARGV[1])
+    local sale_id = ARGV[2]
+
+    local reserved = tonumber(redis.call('hget', ledger_key, 'reserved') or 0)
+    if reserved < amount then
+        return 0
+    end
+
+    redis.call('hincrby', ledger_key, 'reserved', -amount)
+    redis.call('hincrby', ledger_key, 'sold', amount)
+    redis.call('sadd', dirty_key, sale_id)
+    return 1
+    """
+
+    # Lua脚本: 释放预占库存, 传入购买者集合时同时移除购买资格
+    RELEASE_SCRIPT = SOLD_OUT_FUNCTION + """
+    local ledger_key = KEYS[1]
+    local sold_out_key = KEYS[2]
+    local buyers_key = KEYS[3]
+    local amount = tonumber(ARGV[1])
+    local sale_id = ARGV[2]
+    local user_id = ARGV[3]
+
+    local reserved = tonumber(redis.call('hget', ledger_key, 'reserved') or 0)
+    if reserved < amount then
+        return 0
+    end
+
+    redis.call('hincrby', ledger_key, 'reserved', -amount)
+    update_sold_out(sold_out_key, sale_id, redis.call('hincrby', ledger_key, 'stock', amount))
+    if buyers_key then
+        redis.call('srem', buyers_key, user_id)
+    end
+    return 1
+    """
+
+    # Lua脚本: 退还已售库存(订单取消), 只退还仍在购买者集合中的用户, 重复退还不生效
+    REFUND_SCRIPT = SOLD_OUT_FUNCTION + """
+    local ledger_key = KEYS[1]
+    local buyers_key = KEYS[2]
+    local dirty_key = KEYS[3]
+    local sold_out_key = KEYS[4]
+    local sale_id = ARGV[1]
+
+    local sold = tonumber(redis.call('hget', ledger_key, 'sold') or 0)
+    local refunded = 0
+    for i = 2, #ARGV do
+        if refunded >= sold then
+            break
+        end
+        if redis.call('srem', buyers_key, ARGV[i]) == 1 then
+            refunded = refunded + 1
+        end
+    end
+
+    if refunded > 0 then
+        redis.call('hincrby', ledger_key, 'sold', -refunded)
+        redis.call('sadd', dirty_key, sale_id)
+        update_sold_out(sold_out_key, sale_id, redis.call('hincrby', ledger_key, 'stock', refunded))
+    end
+    return refunded
+    """
+
+    # Lua脚本: 追加秒杀库存
+    ADD_STOCK_SCRIPT = SOLD_OUT_FUNCTION + """
+    local ledger_key = KEYS[1]
+    local sold_out_key = KEYS[2]
+    local amount = tonumber(ARGV[1])
+    local sale_id = ARGV[2]
+
+    if redis.call('exists', ledger_key) == 0 then
+        return 0
+    end
+
+    redis.call('hincrby', ledger_key, 'total', amount)
+    update_sold_out(sold_out_key, sale_id, redis.call('hincrby', ledger_key, 'stock', amount))
+    return 1
+    """
+
+    DIRTY_KEY = 'flash_sale:ledger:dirty'
+
+    # admit 返回码
+    ADMITTED = 1
+    SOLD_OUT = 0
+    NOT_READY = -1
+    DUPLICATE = -2
+
+    def __init__(
+            self,
+            redis_host: str = conf.redis.host,
+            redis_port: int = conf.redis.port,
+            redis_db: int = conf.redis.db,
+            redis_password: str = conf.redis.password
+    ):
+        self.redis_client = connection_registry.redis(
+            host=redis_host,
+            port=redis_port,
+            db=redis_db,
+            password=redis_password,
+            decode_responses=True
+        )
+
+        # 预编译Lua脚本
+        self._warm_up_script = self.redis_client.register_script(self.WARM_UP_SCRIPT)
+        self._reserve_script = self.redis_client.register_script(self.RESERVE_SCRIPT)
+        self._confirm_script = self.redis_client.register_script(self.CONFIRM_SCRIPT)
+        self._release_script = self.redis_client.register_script(self.RELEASE_SCRIPT)
+        self._refund_script = self.redis_client.register_script(self.REFUND_SCRIPT)
+        self._add_stock_script = self.redis_client.register_script(self.ADD_STOCK_SCRIPT)
+
+    @staticmethod
+    def _get_ledger_key(sale_id: int) -> str:
+        return f"flash_sale:{sale_id}:ledger"
+
+    @staticmethod
+    def _get_buyers_key(sale_id: int) -> str:
+        return f"flash_sale:{sale_id}:buyers"
+
+    def warm_up(self, sale_id: int, total_stock: int, sold: int = 0) -> bool:
+        """
+        预热库存账本
+
+        Returns:
+            bool: 是否写入了新的账本, 账本已存在时返回False
+        """
+        result = self._warm_up_script(
+            keys=[self._get_ledger_key(sale_id), self.SOLD_OUT_KEY],
+            args=[total_stock, sold, sale_id]
+        )
+        return result == 1
+
+    def reserve(self, sale_id: int, amount: int = 1) -> bool:
+        """
+        预占库存
+
+        Returns:
+            bool: 是否预占成功, 库存不足或账本未预热时返回False
+        """
+        try:
+            result = self._reserve_script(
+                keys=[self._get_ledger_key(sale_id), self.SOLD_OUT_KEY],
+                args=[amount, sale_id]
+            )
+        except redis.RedisError as e:
+            logger.error(f"预占库存失败: {str(e)}")
+            return False
+
+        if result == -1:
+            logger.warning(f"秒杀活动 {sale_id} 的库存账本未预热")
+        return result == 1
+
+    def admit(self, sale_id: int, user_id: int, amount: int = 1) -> int:
+        """
+        为用户预占库存, 每个用户在一个活动中只能预占一次
+
+        Returns:
+            int: ADMITTED / SOLD_OUT / NOT_READY / DUPLICATE
+        """
+        try:
+            return self._reserve_script(
+                keys=[self._get_ledger_key(sale_id), self.SOLD_OUT_KEY, self._get_buyers_key(sale_id)],
+                args=[amount, sale_id, user_id]
+            )
+        except redis.RedisError as e:
+            logger.error(f"预占库存失败: {str(e)}")
+            return self.NOT_READY
+
+    def confirm(self, sale_id: int, amount: int = 1, user_id: int = None) -> bool:
+        """确认预占的库存, 计入已售数量; user_id 供分片账本定位子账本"""
+        try:
+            result = self._confirm_script(
+                keys=[self._get_ledger_key(sale_id), self.DIRTY_KEY],
+                args=[amount, sale_id]
+            )
+            return result == 1
+        except redis.RedisError as e:
+            logger.error(f"确认库存失败: {str(e)}")
+            return False
+
+    def release(self, sale_id: int, amount: int = 1, user_id: int = None) -> bool:
+        """释放预占的库存, 归还可售库存; 传入user_id时同时撤销该用户的购买资格"""
+        keys = [self._get_ledger_key(sale_id), self.SOLD_OUT_KEY]
+        args = [amount, sale_id]
+        if user_id is not None:
+            keys.append(self._get_buyers_key(sale_id))
+            args.append(user_id)
+
+        try:
+            result = self._release_script(keys=keys, args=args)
+            return result == 1
+        except redis.RedisError as e:
+            logger.error(f"释放库存失败: {str(e)}")
+            return False
+
+    def refund(self, sale_id: int, user_ids: List[int]) -> int:
+        """
+        取消已售订单后退还库存并撤销用户的购买资格, 每个用户退还一件
+
+        Returns:
+            int: 实际退还的件数, 已退还过的用户不重复计算; Redis 出错时返回-1, 可以重试
+        """
+        if not user_ids:
+            return 0
+        try:
+            return self._refund_script(
+                keys=[self._get_ledger_key(sale_id), self._get_buyers_key(sale_id), self.DIRTY_KEY, self.SOLD_OUT_KEY],
+                args=[sale_id, *user_ids]
+            )
+        except redis.RedisError as e:
+            logger.error(f"退还库存失败: {str(e)}")
+            return -1
+
+    def add_stock(self, sale_id: int, amount: int) -> bool:
+        """追加秒杀库存, 账本不存在时返回False"""
+        try:
+            result = self._add_stock_script(
+                keys=[self._get_ledger_key(sale_id), self.SOLD_OUT_KEY],
+                args=[amount, sale_id]
+            )
+            return result == 1
+        except redis.RedisError as e:
+            logger.error(f"追加库存失败: {str(e)}")
+            return False
+
+    def get_sold_out(self) -> set:
+        """所有已售罄的活动ID"""
+        return {int(sale_id) for sale_id in self.redis_client.smembers(self.SOLD_OUT_KEY)}
+
+    def get_ledger(self, sale_id: int) -> dict:
+        """获取账本快照, 账本不存在时返回空字典"""
+        ledger = self.redis_client.hgetall(self._get_ledger_key(sale_id))
+        return {field: int(value) for field, value in ledger.items()}
+
+    def pop_dirty(self, count: int = 100) -> list:
+        """取出一批已售数量发生变化、待回写MySQL的活动ID"""
+        sale_ids = self.redis_client.spop(self.DIRTY_KEY, count) or []
+        return [int(sale_id) for sale_id in sale_ids]
+
+    def recover_transits(self, sale_id: int) -> int:
+        """补完子账本之间中断的调拨, 单键账本没有调拨, 返回0"""
+        return 0
+
+    def mark_dirty(self, *sale_ids: int) -> None:
+        """回写失败时重新标记活动为待回写"""
+        if sale_ids:
+            self.redis_client.sadd(self.DIRTY_KEY, *sale_ids)
+
+    def remove(self, sale_id: int) -> bool:
+        """删除账本及购买者集合"""
+        with self.redis_client.pipeline() as pipe:
+            pipe.delete(self._get_ledger_key(sale_id), self._get_buyers_key(sale_id))
+            pipe.srem(self.SOLD_OUT_KEY, sale_id)
+            deleted, unflagged = pipe.execute()
+        if unflagged:
+            self.redis_client.publish(self.SOLD_OUT_KEY, json.dumps({'sale_id': sale_id, 'sold_out': False}))
+        return bool(deleted)
@@ -0,0 +1,61 @@
+import unittest
+from unittest.mock import patch
+
+from util.connection_registry import ConnectionRegistry
+
+
+class TestConnectionRegistry(unittest.TestCase):
+    def setUp(self):
+        self.registry = ConnectionRegistry()
+
+    def test_redis_clients_share_pool(self):
+        first = self.registry.redis()
+        second = self.registry.redis()
+        self.assertIs(first.connection_pool, second.connection_pool)
+
+        # 不同的解码方式使用独立的连接池
+        decoded = self.registry.redis(decode_responses=True)
+        self.assertIsNot(first.connection_pool, decoded.connection_pool)
+
+    def test_redis_pool_limits(self):
+        pool = self.registry.redis().connection_pool
+        self.assertGreater(pool.max_connections, 0)
+        self.assertIn('health_check_interval', pool.connection_kwargs)
+
+    @patch('util.connection_registry.RabbitMQUtil')
+    def test_rabbitmq_connection_reused(self, MockRabbitMQ):
+        with self.registry.rabbitmq() as first:
+            pass
+        with self.registry.rabbitmq() as second:
+            pass
+        self.assertIs(first, second)
+        MockRabbitMQ.assert_called_once()
+
+    @patch('util.connection_registry.RabbitMQUtil')
+    def test_rabbitmq_broken_connection_discarded(self, MockRabbitMQ):
+        with self.assertRaises(RuntimeError):
+            with self.registry.rabbitmq() as rabbitmq:
+                raise RuntimeError('publish failed')
+        rabbitmq.close.assert_called_once()
+
+        with self.registry.rabbitmq():
+            pass
+        self.assertEqual(MockRabbitMQ.call_count, 2)
+
+    @patch('util.connection_registry.RabbitMQUtil')
+    def test_rabbitmq_stale_connection_discarded(self, MockRabbitMQ):
+        with self.registry.rabbitmq() as stale:
+            pass
+        # 空闲期间错过心跳被服务端关闭, 处理 I/O 时才发现
+        stale.conn.process_data_events.side_effect = ConnectionResetError('Connection reset by peer')
+
+        with self.registry.rabbitmq():
+            pass
+        stale.close.assert_called_once()
+        self.assertEqual(MockRabbitMQ.call_count, 2)
+
+    def tearDown(self):
+        self.registry.close()
+
+if __name__ == '__main__':
+    unittest.main()
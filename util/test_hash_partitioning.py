@@ -0,0 +1,38 @@
+import unittest
+from collections import Counter
+
+from util.hash_partitioning import HashPartitioning
+
+
+class TestHashPartitioning(unittest.TestCase):
+    def test_stable_routing(self):
+        partitioning = HashPartitioning(4)
+        self.assertEqual(
+            partitioning.get_table_name(1, 2, 3),
+            HashPartitioning(4).get_table_name(1, 2, 3)
+        )
+        self.assertIn(partitioning.get_table_name(1, 2, 3), partitioning.get_table_names())
+
+    def test_balanced(self):
+        partitioning = HashPartitioning(16)
+        counts = Counter(partitioning.get_table_index(user_id, 1, 1) for user_id in range(50000))
+        self.assertEqual(len(counts), 16)
+        # 虚拟节点使各分表的订单数偏差保持在平均值的 ±40% 以内
+        self.assertLess(max(counts.values()), 50000 / 16 * 1.4)
+        self.assertGreater(min(counts.values()), 50000 / 16 * 0.6)
+
+    def test_add_shard_moves_only_to_new_shard(self):
+        before, after = HashPartitioning(4), HashPartitioning(5)
+        moved = 0
+        for slot in range(HashPartitioning.SLOTS):
+            old_index = before.get_table_index_by_slot(slot)
+            new_index = after.get_table_index_by_slot(slot)
+            if old_index != new_index:
+                moved += 1
+                # 扩容时订单只会迁往新增的分表
+                self.assertEqual(new_index, 4)
+        # 理想情况为 1/5
+        self.assertLess(moved / HashPartitioning.SLOTS, 0.3)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,94 @@
+import time
+import unittest
+from unittest.mock import patch
+
+from util.id_generator import ClockMovedBackwardsError, RedisNodeIdAllocator, SnowflakeIdGenerator
+
+
+class TestSnowflakeIdGenerator(unittest.TestCase):
+    def test_unique_and_monotonic(self):
+        generator = SnowflakeIdGenerator(node_id=1)
+        ids = [generator.next_id() for _ in range(20000)] + generator.next_ids(20000)
+        self.assertEqual(len(set(ids)), len(ids))
+        self.assertEqual(ids, sorted(ids))
+
+    def test_node_id_bits(self):
+        generator = SnowflakeIdGenerator(node_id=7)
+        node_id = (generator.next_id() >> SnowflakeIdGenerator.SEQUENCE_BITS) & SnowflakeIdGenerator.MAX_NODE_ID
+        self.assertEqual(node_id, 7)
+
+        with self.assertRaises(ValueError):
+            SnowflakeIdGenerator(node_id=SnowflakeIdGenerator.MAX_NODE_ID + 1)
+
+    def test_sequence_overflow_borrows_next_millisecond(self):
+        generator = SnowflakeIdGenerator(node_id=1)
+        now = time.time_ns()
+        with patch('util.id_generator.time.time_ns', return_value=now):
+            ids = generator.next_ids(SnowflakeIdGenerator.MAX_SEQUENCE + 2) + [generator.next_id()]
+        self.assertEqual(len(set(ids)), len(ids))
+        self.assertEqual(ids, sorted(ids))
+
+    def test_clock_rollback(self):
+        generator = SnowflakeIdGenerator(node_id=1, max_backward_ms=100)
+        now = time.time_ns()
+        with patch('util.id_generator.time.time_ns', return_value=now):
+            first = generator.next_id()
+
+        # 小幅回拨时借用上一个时间戳, 保持递增
+        with patch('util.id_generator.time.time_ns', return_value=now - 50 * 1_000_000):
+            self.assertGreater(generator.next_id(), first)
+
+        # 超过允许范围时拒绝生成
+        with patch('util.id_generator.time.time_ns', return_value=now - 500 * 1_000_000):
+            with self.assertRaises(ClockMovedBackwardsError):
+                generator.next_id()
+
+
+class TestRedisNodeIdAllocator(unittest.TestCase):
+    def setUp(self):
+        self.namespace = 'test_id_generator:node'
+        self.allocators = [RedisNodeIdAllocator(namespace=self.namespace, max_node_id=3) for _ in range(4)]
+
+    def test_unique_node_ids(self):
+        node_ids = [allocator.node_id for allocator in self.allocators]
+        self.assertEqual(sorted(node_ids), [0, 1, 2, 3])
+
+        # 全部占用后无法再分配
+        with self.assertRaises(RuntimeError):
+            RedisNodeIdAllocator(namespace=self.namespace, max_node_id=3).node_id
+
+        # 归还后可被其他进程复用
+        self.allocators[0].release()
+        self.assertEqual(RedisNodeIdAllocator(namespace=self.namespace, max_node_id=3).node_id, node_ids[0])
+
+    def test_expired_claim_is_reused(self):
+        allocator = RedisNodeIdAllocator(namespace=self.namespace, max_node_id=0)
+        # 模拟已退出、不再续期的进程占用的节点ID
+        node_id = allocator._allocate_script(keys=[self.namespace], args=['exited', 50, 0])
+        time.sleep(0.1)
+
+        # 租约过期后其他进程可以占用, 原占用者续期失败
+        self.assertEqual(allocator.node_id, node_id)
+        self.assertEqual(allocator._renew_script(keys=[self.namespace], args=[node_id, 'exited', 1000]), 0)
+
+    def test_renew_failure_past_ttl(self):
+        allocator = RedisNodeIdAllocator(namespace=self.namespace, ttl=0.3, max_node_id=7)
+        generator = SnowflakeIdGenerator(allocator=allocator)
+        generator.next_id()
+
+        # Redis 持续不可用, 续期与重新分配都失败
+        with patch.object(allocator, '_renew_script', side_effect=ConnectionError('down')):
+            with patch.object(allocator, '_allocate_script', side_effect=ConnectionError('down')):
+                time.sleep(0.4)
+                with self.assertRaises(ConnectionError):
+                    generator.next_id()
+
+        # Redis 恢复后重新分配节点ID再继续生成
+        generator.next_id()
+        self.assertIsNotNone(allocator._node_id)
+
+    def tearDown(self):
+        self.allocators[0].redis_client.delete(self.namespace)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,47 @@
+import unittest
+
+from util.order_deadline_queue import OrderDeadlineQueue
+
+
+class TestOrderDeadlineQueue(unittest.TestCase):
+    def setUp(self):
+        self.queue = OrderDeadlineQueue(namespace='test_order_deadline', lease=10)
+        self.queue.clear()
+        self.queue.add([
+            ('order-1', 1, 100, 1000),
+            ('order-2', 2, 100, 2000),
+            ('order-3', 3, 200, 3000),
+        ])
+
+    def tearDown(self):
+        self.queue.clear()
+
+    def test_claim_expired(self):
+        self.assertEqual(self.queue.claim(10, now_ms=500), [])
+        self.assertEqual(
+            self.queue.claim(10, now_ms=2500),
+            [('order-1', 1, 100), ('order-2', 2, 100)]
+        )
+        # 租约期内不会被再次取出
+        self.assertEqual(self.queue.claim(10, now_ms=3000), [('order-3', 3, 200)])
+        self.assertEqual(self.queue.size(), 3)
+
+    def test_claim_count(self):
+        self.assertEqual(self.queue.claim(1, now_ms=5000), [('order-1', 1, 100)])
+        self.assertEqual(self.queue.claim(1, now_ms=5000), [('order-2', 2, 100)])
+
+    def test_lease_expires(self):
+        claimed = self.queue.claim(10, now_ms=3000)
+        self.assertEqual(self.queue.claim(10, now_ms=3000 + 10000 - 1), [])
+        # 未确认的订单在租约到期后重新取出
+        self.assertEqual(self.queue.claim(10, now_ms=3000 + 10000), claimed)
+
+    def test_ack(self):
+        claimed = self.queue.claim(10, now_ms=5000)
+        self.assertEqual(self.queue.ack(claimed), 3)
+        self.assertEqual(self.queue.size(), 0)
+        self.assertEqual(self.queue.ack([]), 0)
+
+
+if __name__ == '__main__':
+    unittest.main()
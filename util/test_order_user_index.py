@@ -0,0 +1,65 @@
+import unittest
+
+from util.order_user_index import OrderUserIndex
+
+
+class TestOrderUserIndex(unittest.TestCase):
+    def setUp(self):
+        self.index = OrderUserIndex(namespace='test_user_orders')
+        self.user_id = 900001
+
+        # 清理测试数据
+        self.index.clear(self.user_id)
+        self.index.add(
+            (self.user_id, f"order-{i:03d}", 1000 + i, 'COMPLETED' if i % 3 == 0 else 'PENDING')
+            for i in range(10)
+        )
+
+    def tearDown(self):
+        self.index.clear(self.user_id)
+
+    def test_page_newest_first(self):
+        self.assertEqual(self.index.page(self.user_id, limit=3), ['order-009', 'order-008', 'order-007'])
+        self.assertEqual(self.index.page(self.user_id, offset=8, limit=5), ['order-001', 'order-000'])
+        self.assertEqual(self.index.page(900002), [])
+
+    def test_page_by_status(self):
+        self.assertEqual(
+            self.index.page(self.user_id, limit=10, status='COMPLETED'),
+            ['order-009', 'order-006', 'order-003', 'order-000']
+        )
+        # 分块读取时跨块凑满一页
+        self.assertEqual(
+            self.index.page(self.user_id, offset=1, limit=2, status='COMPLETED', chunk_size=2),
+            ['order-006', 'order-003']
+        )
+
+    def test_update_status(self):
+        self.index.update_status(self.user_id, 'order-001', 'COMPLETED')
+        self.assertIn('order-001', self.index.page(self.user_id, limit=10, status='COMPLETED'))
+
+        # 索引中不存在的订单不会被写入
+        self.index.update_status(self.user_id, 'order-100', 'COMPLETED')
+        self.assertNotIn('order-100', self.index.page(self.user_id, limit=20, status='COMPLETED'))
+
+    def test_update_statuses(self):
+        self.index.update_statuses([
+            (self.user_id, 'order-001', 'CANCELLED'),
+            (self.user_id, 'order-002', 'CANCELLED'),
+            (self.user_id, 'order-100', 'CANCELLED'),
+        ])
+        self.assertEqual(
+            self.index.page(self.user_id, limit=10, status='CANCELLED'),
+            ['order-002', 'order-001']
+        )
+        self.assertFalse(self.index.redis_client.hexists(self.index._get_status_key(self.user_id), 'order-100'))
+        self.assertTrue(self.index.update_statuses([]))
+
+    def test_remove(self):
+        self.index.remove(self.user_id, 'order-009')
+        self.assertEqual(self.index.page(self.user_id, limit=1), ['order-008'])
+        self.assertEqual(self.index.page(self.user_id, limit=1, status='COMPLETED'), ['order-006'])
+
+
+if __name__ == '__main__':
+    unittest.main()
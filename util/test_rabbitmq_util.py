@@ -0,0 +1,57 @@
+import unittest
+from unittest.mock import MagicMock, patch
+
+import pika
+
+from util.rabbitmq_util import RabbitMQUtil
+
+
+def _message(tag, body, headers=None):
+    return MagicMock(delivery_tag=tag), pika.BasicProperties(headers=headers), body
+
+
+class TestRabbitMQUtil(unittest.TestCase):
+    def setUp(self):
+        patcher = patch('util.rabbitmq_util.pika.BlockingConnection')
+        self.addCleanup(patcher.stop)
+        patcher.start()
+        self.rabbitmq = RabbitMQUtil()
+        self.channel = self.rabbitmq.channel
+
+    def test_publish_persistent_and_declare_once(self):
+        self.rabbitmq.publish_message('test_queue', 'a')
+        self.rabbitmq.publish_message('test_queue', 'b')
+
+        self.channel.queue_declare.assert_called_once_with(queue='test_queue', durable=True)
+        properties = self.channel.basic_publish.call_args.kwargs['properties']
+        self.assertEqual(properties.delivery_mode, 2)
+
+    def test_poison_message_is_retried_then_dead_lettered(self):
+        self.channel.consume.return_value = [
+            _message(1, b'ok'),
+            _message(2, b'bad'),
+            _message(3, b'bad', {'x-retries': 3}),
+            (None, None, None)
+        ]
+        handled = []
+
+        def handler(bodies):
+            if b'bad' in bodies:
+                raise ValueError('bad message')
+            handled.extend(bodies)
+
+        self.rabbitmq.consume_batch('test_queue', handler, batch_size=10, max_retries=3)
+
+        # 正常的消息单独处理成功, 坏消息重新投递或转入死信队列, 整批确认
+        self.assertEqual(handled, [b'ok'])
+        published = [
+            (call.kwargs['routing_key'], call.kwargs['properties'].headers)
+            for call in self.channel.basic_publish.call_args_list
+        ]
+        self.assertEqual(published, [('test_queue', {'x-retries': 1}), ('test_queue.dead', {'x-retries': 3})])
+        self.channel.basic_ack.assert_called_once_with(delivery_tag=3, multiple=True)
+        self.channel.basic_nack.assert_not_called()
+
+
+if __name__ == '__main__':
+    unittest.main()
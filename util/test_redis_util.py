@@ -18,6 +18,18 @@ class TestRedisUtil(unittest.TestCase):
         self.assertTrue(result)
         self.mock_redis.set.assert_called_once_with("key", "value", ex=None)
 
+    def test_set_nx(self):
+        """测试仅当键不存在时设置键值对。"""
+        self.mock_redis.set.return_value = None
+        result = self.redis_util.set_nx("key", "value", expire=10)
+        self.assertFalse(result)
+        self.mock_redis.set.assert_called_once_with("key", "value", ex=10, nx=True)
+
+    def test_set_nx_error(self):
+        """测试 Redis 出错时与键已存在区分。"""
+        self.mock_redis.set.side_effect = RedisError("down")
+        self.assertIsNone(self.redis_util.set_nx("key", "value", expire=10))
+
     def test_get(self):
         """测试获取键的值。"""
         self.mock_redis.get.return_value = b"value"
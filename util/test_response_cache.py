@@ -0,0 +1,82 @@
+import unittest
+
+from flask import Flask
+
+from util.response_cache import ResponseCache
+from util.response_util import ResponseUtil
+
+
+class TestResponseCache(unittest.TestCase):
+    def setUp(self):
+        self.cache = ResponseCache(namespace='test_response_cache')
+        self.calls = 0
+
+        def view():
+            self.calls += 1
+            if self.calls > 100:
+                return ResponseUtil.error(message='Too many calls')
+            return ResponseUtil.success(data={'products': [1, 2, 3]})
+
+        def stream_view():
+            self.calls += 1
+            return ResponseUtil.stream_success(items=({'id': i} for i in range(3)))
+
+        app = Flask(__name__)
+        app.add_url_rule('/list', 'list', self.cache.cached('test')(view))
+        app.add_url_rule('/stream', 'stream', self.cache.cached('test')(stream_view))
+        self.client = app.test_client()
+        self._clean()
+
+    def _clean(self):
+        client = self.cache.cache.redis_client
+        keys = client.keys('test_response_cache:*')
+        if keys:
+            client.delete(*keys)
+
+    def test_cached_body_and_etag(self):
+        first = self.client.get('/list')
+        second = self.client.get('/list')
+        self.assertEqual(self.calls, 1)
+        self.assertEqual(first.get_data(), second.get_data())
+        self.assertEqual(first.headers['ETag'], second.headers['ETag'])
+
+        # 不同查询参数分别缓存
+        self.client.get('/list?after_id=1')
+        self.assertEqual(self.calls, 2)
+
+    def test_not_modified(self):
+        etag = self.client.get('/list').headers['ETag']
+        response = self.client.get('/list', headers={'If-None-Match': etag})
+        self.assertEqual(response.status_code, 304)
+        self.assertEqual(response.get_data(), b'')
+
+    def test_invalidate(self):
+        self.client.get('/list')
+        self.cache.invalidate('test')
+        self.client.get('/list')
+        self.assertEqual(self.calls, 2)
+
+    def test_error_not_cached(self):
+        self.calls = 100
+        self.assertEqual(self.client.get('/list').status_code, 400)
+        self.assertEqual(self.client.get('/list').status_code, 400)
+        self.assertEqual(self.calls, 102)
+
+    def test_streamed_response(self):
+        first = self.client.get('/stream')
+        self.assertTrue(first.is_streamed)
+        self.assertNotIn('ETag', first.headers)
+        body = first.get_data()
+
+        # 流发送完成后写入缓存, 之后命中缓存并带上 ETag
+        second = self.client.get('/stream')
+        self.assertEqual(self.calls, 1)
+        self.assertEqual(second.get_data(), body)
+        self.assertEqual(second.json['data'], {'items': [{'id': 0}, {'id': 1}, {'id': 2}]})
+        self.assertIn('ETag', second.headers)
+
+    def tearDown(self):
+        self._clean()
+
+if __name__ == '__main__':
+    unittest.main()
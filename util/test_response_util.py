@@ -0,0 +1,67 @@
+import json
+import unittest
+from datetime import datetime
+from decimal import Decimal
+
+from flask import Flask
+
+from util.response_util import ResponseUtil, StdlibEncoder, orjson
+
+
+class TestResponseUtil(unittest.TestCase):
+    def setUp(self):
+        self.app = Flask(__name__)
+
+    def _stream_body(self, **kwargs) -> dict:
+        with self.app.test_request_context():
+            response = ResponseUtil.stream_success(**kwargs)
+            self.assertEqual(response.mimetype, 'application/json')
+            return json.loads(response.get_data())
+
+    def test_stream_success(self):
+        body = self._stream_body(
+            message='List success',
+            items=({'id': i, 'name': f'商品{i}'} for i in range(3)),
+            items_key='products',
+            extra={'next_after_id': 2}
+        )
+        self.assertEqual(body, {
+            'status': 'success',
+            'message': 'List success',
+            'data': {
+                'products': [{'id': 0, 'name': '商品0'}, {'id': 1, 'name': '商品1'}, {'id': 2, 'name': '商品2'}],
+                'next_after_id': 2
+            }
+        })
+
+    def test_stream_success_empty(self):
+        body = self._stream_body(items=[], extra={'next_after_id': None})
+        self.assertEqual(body['data'], {'items': [], 'next_after_id': None})
+
+    def test_encode_decimal_and_datetime(self):
+        data = {'price': Decimal('9.90'), 'created_at': datetime(2024, 1, 2, 3, 4, 5), 'name': '商品'}
+        with self.app.test_request_context():
+            success = ResponseUtil.success(data=data)
+            error = ResponseUtil.error(message='错误', status_code=404)
+
+        self.assertEqual(success.mimetype, 'application/json')
+        self.assertEqual(
+            json.loads(success.get_data())['data'],
+            {'price': '9.90', 'created_at': '2024-01-02 03:04:05', 'name': '商品'}
+        )
+        self.assertEqual(error.status_code, 404)
+        self.assertEqual(json.loads(error.get_data())['message'], '错误')
+
+    @unittest.skipIf(orjson is None, 'orjson is not installed')
+    def test_encoders_agree(self):
+        from util.response_util import OrjsonEncoder
+
+        data = {'price': Decimal('9.90'), 'created_at': datetime(2024, 1, 2, 3, 4, 5), 'name': '商品'}
+        self.assertEqual(json.loads(OrjsonEncoder.dumps(data)), json.loads(StdlibEncoder.dumps(data)))
+
+        # Cerberus 列表元素的校验错误以整数为键
+        errors = {'ids': [{1: ['must be of integer type']}]}
+        self.assertEqual(json.loads(OrjsonEncoder.dumps(errors)), json.loads(StdlibEncoder.dumps(errors)))
+
+if __name__ == '__main__':
+    unittest.main()
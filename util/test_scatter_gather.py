@@ -0,0 +1,47 @@
+import itertools
+import threading
+import unittest
+
+from util.scatter_gather import ScatterGatherExecutor
+
+
+class TestScatterGatherExecutor(unittest.TestCase):
+    def setUp(self):
+        self.executor = ScatterGatherExecutor(max_workers=4)
+        self.shards = [list(range(start, 100, 3)) for start in range(3)]
+        self.fetch_threads = set()
+        self.fetch_calls = 0
+
+    def _fetcher(self, rows, page_size, reverse=False):
+        rows = sorted(rows, reverse=reverse)
+
+        def fetch(cursor):
+            self.fetch_threads.add(threading.current_thread().name)
+            self.fetch_calls += 1
+            if cursor is None:
+                remaining = rows
+            else:
+                remaining = [row for row in rows if (row < cursor if reverse else row > cursor)]
+            return remaining[:page_size]
+        return fetch
+
+    def test_merge_in_order(self):
+        fetchers = [self._fetcher(rows, 10) for rows in self.shards]
+        merged = list(self.executor.merge(fetchers, key=lambda row: row, page_size=10))
+        self.assertEqual(merged, list(range(100)))
+        self.assertTrue(all(name.startswith('scatter_gather') for name in self.fetch_threads))
+
+    def test_merge_reverse(self):
+        fetchers = [self._fetcher(rows, 7, reverse=True) for rows in self.shards]
+        merged = list(self.executor.merge(fetchers, key=lambda row: row, page_size=7, reverse=True))
+        self.assertEqual(merged, list(range(99, -1, -1)))
+
+    def test_lazy_pages(self):
+        fetchers = [self._fetcher(rows, 5) for rows in self.shards]
+        merged = self.executor.merge(fetchers, key=lambda row: row, page_size=5)
+        self.assertEqual(list(itertools.islice(merged, 3)), [0, 1, 2])
+        # 只读取了每个分片的首页及预取的下一页, 而不是全部数据
+        self.assertLessEqual(self.fetch_calls, 6)
+
+if __name__ == '__main__':
+    unittest.main()
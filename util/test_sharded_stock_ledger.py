@@ -0,0 +1,162 @@
+import threading
+import unittest
+
+from util.sharded_stock_ledger import ShardedStockLedger
+from util.stock_ledger import StockLedger
+
+
+class TestShardedStockLedger(unittest.TestCase):
+    def setUp(self):
+        self.ledger = ShardedStockLedger(shards=4)
+        self.sale_id = 900003
+
+        # 清理测试数据
+        self.ledger.remove(self.sale_id)
+        self.ledger.redis_client.srem(StockLedger.DIRTY_KEY, self.sale_id)
+
+    def tearDown(self):
+        self.ledger.remove(self.sale_id)
+        keys = self.ledger.redis_client.keys(f'flash_sale:{{{self.sale_id}:*}}:move:*')
+        if keys:
+            self.ledger.redis_client.delete(*keys)
+        self.ledger.redis_client.srem(StockLedger.DIRTY_KEY, self.sale_id)
+
+    def test_warm_up_splits_stock(self):
+        self.assertTrue(self.ledger.warm_up(self.sale_id, 10, 3))
+        self.assertFalse(self.ledger.warm_up(self.sale_id, 100))
+        self.assertEqual(
+            self.ledger.get_ledger(self.sale_id),
+            {'total': 10, 'stock': 7, 'reserved': 0, 'sold': 3}
+        )
+        self.assertEqual(self.ledger._get_shard_stocks(self.sale_id, 4), [2, 2, 1, 2])
+
+    def test_admit_never_oversells(self):
+        self.ledger.warm_up(self.sale_id, 50)
+        results = []
+
+        def buy(user_ids):
+            results.extend(self.ledger.admit(self.sale_id, user_id) for user_id in user_ids)
+
+        threads = [threading.Thread(target=buy, args=(range(start, 200, 4),)) for start in range(4)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        # 用户所在子账本售空时从其他子账本调拨, 库存全部售出且不超卖
+        self.assertEqual(results.count(StockLedger.ADMITTED), 50)
+        self.assertEqual(results.count(StockLedger.SOLD_OUT), 150)
+        self.assertEqual(
+            self.ledger.get_ledger(self.sale_id),
+            {'total': 50, 'stock': 0, 'reserved': 50, 'sold': 0}
+        )
+        self.assertIn(self.sale_id, self.ledger.get_sold_out())
+
+    def test_admit_one_per_user(self):
+        self.ledger.warm_up(self.sale_id, 10)
+        self.assertEqual(self.ledger.admit(self.sale_id, 1), StockLedger.ADMITTED)
+        self.assertEqual(self.ledger.admit(self.sale_id, 1), StockLedger.DUPLICATE)
+        self.assertEqual(self.ledger.admit(900004, 1), StockLedger.NOT_READY)
+
+    def test_confirm_release_refund(self):
+        self.ledger.warm_up(self.sale_id, 2)
+        self.ledger.admit(self.sale_id, 1)
+        self.ledger.admit(self.sale_id, 2)
+        self.assertIn(self.sale_id, self.ledger.get_sold_out())
+
+        self.assertTrue(self.ledger.confirm(self.sale_id, user_id=1))
+        self.assertTrue(self.ledger.release(self.sale_id, user_id=2))
+        self.assertNotIn(self.sale_id, self.ledger.get_sold_out())
+        self.assertEqual(self.ledger.refund(self.sale_id, [1, 2]), 1)
+        self.assertEqual(
+            self.ledger.get_ledger(self.sale_id),
+            {'total': 2, 'stock': 2, 'reserved': 0, 'sold': 0}
+        )
+        self.assertIn(self.sale_id, self.ledger.pop_dirty())
+
+    def test_rebalance(self):
+        self.ledger.warm_up(self.sale_id, 8)
+        self.ledger._move(self.sale_id, 0, 3, 2)
+        self.ledger._move(self.sale_id, 1, 3, 2)
+        self.assertEqual(self.ledger._get_shard_stocks(self.sale_id, 4), [0, 0, 2, 6])
+
+        self.assertEqual(self.ledger.rebalance(self.sale_id), 4)
+        self.assertEqual(self.ledger._get_shard_stocks(self.sale_id, 4), [2, 2, 2, 2])
+        self.assertEqual(self.ledger.get_ledger(self.sale_id)['total'], 8)
+
+    def test_recover_transits(self):
+        self.ledger.warm_up(self.sale_id, 8)
+        # 模拟调出后、调入前进程退出
+        self.ledger._take_script(
+            keys=[
+                self.ledger._get_shard_ledger_key(self.sale_id, 0),
+                self.ledger._get_shard_transit_key(self.sale_id, 0)
+            ],
+            args=[2, 'crashed', 3]
+        )
+        self.assertEqual(self.ledger._get_shard_stocks(self.sale_id, 4), [0, 2, 2, 2])
+        self.assertEqual(self.ledger.get_ledger(self.sale_id)['total'], 8)
+
+        self.assertEqual(self.ledger.recover_transits(self.sale_id), 2)
+        self.assertEqual(self.ledger._get_shard_stocks(self.sale_id, 4), [0, 2, 2, 4])
+        # 重复补完不会重复调入
+        self.ledger._finish_move(self.sale_id, 0, 3, 'crashed', 2)
+        self.assertEqual(self.ledger.get_ledger(self.sale_id), {'total': 8, 'stock': 8, 'reserved': 0, 'sold': 0})
+
+    def test_reserve_after_interrupted_move(self):
+        self.ledger.warm_up(self.sale_id, 4)
+        # 子账本0的库存调往子账本3时进程退出
+        self.ledger._take_script(
+            keys=[
+                self.ledger._get_shard_ledger_key(self.sale_id, 0),
+                self.ledger._get_shard_transit_key(self.sale_id, 0)
+            ],
+            args=[1, 'crashed', 3]
+        )
+
+        # 用户2/5/1分别落在子账本1/2/3, 各子账本售空后仍有调拨途中的库存, 不标记售罄
+        for user_id in (2, 5, 1):
+            self.assertEqual(self.ledger.admit(self.sale_id, user_id), StockLedger.ADMITTED)
+        self.assertNotIn(self.sale_id, self.ledger.get_sold_out())
+
+        # 用户4落在子账本0: 补完中断的调拨后调入并售出最后一件
+        self.assertEqual(self.ledger.admit(self.sale_id, 4), StockLedger.ADMITTED)
+        self.assertIn(self.sale_id, self.ledger.get_sold_out())
+        self.assertEqual(self.ledger.admit(self.sale_id, 6), StockLedger.SOLD_OUT)
+        self.assertEqual(
+            self.ledger.get_ledger(self.sale_id),
+            {'total': 4, 'stock': 0, 'reserved': 4, 'sold': 0}
+        )
+
+    def test_stale_shard_count(self):
+        other = ShardedStockLedger(shards=4)
+        self.ledger.warm_up(self.sale_id, 4)
+        self.assertEqual(other.admit(self.sale_id, 1), StockLedger.ADMITTED)
+
+        # 活动被删除后按新的子账本数重新预热, 缓存的子账本数在账本不存在时重新读取
+        self.ledger.remove(self.sale_id)
+        ShardedStockLedger(shards=2).warm_up(self.sale_id, 4)
+        self.assertEqual(other._sale_shards[self.sale_id][0], 4)
+        # 用户5在4个子账本时落在第2个子账本, 重新预热后不存在
+        self.assertEqual(other.admit(self.sale_id, 5), StockLedger.ADMITTED)
+        self.assertEqual(other._sale_shards[self.sale_id][0], 2)
+        self.assertEqual(self.ledger.get_ledger(self.sale_id)['reserved'], 1)
+
+    def test_add_stock(self):
+        self.ledger.warm_up(self.sale_id, 1)
+        self.ledger.admit(self.sale_id, 1)
+        self.assertIn(self.sale_id, self.ledger.get_sold_out())
+
+        self.assertTrue(self.ledger.add_stock(self.sale_id, 6))
+        self.assertNotIn(self.sale_id, self.ledger.get_sold_out())
+        self.assertEqual(self.ledger.get_ledger(self.sale_id)['stock'], 6)
+
+    def test_unsharded_sale(self):
+        # 未拆分的活动沿用单键账本
+        StockLedger().warm_up(self.sale_id, 3)
+        self.assertEqual(self.ledger.admit(self.sale_id, 1), StockLedger.ADMITTED)
+        self.assertEqual(StockLedger().get_ledger(self.sale_id)['reserved'], 1)
+
+
+if __name__ == '__main__':
+    unittest.main()
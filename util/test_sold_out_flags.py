@@ -0,0 +1,84 @@
+import time
+import unittest
+from unittest.mock import patch
+
+from util.sold_out_flags import SoldOutFlags
+from util.stock_ledger import StockLedger
+
+
+class TestSoldOutFlags(unittest.TestCase):
+    def setUp(self):
+        self.ledger = StockLedger()
+        self.flags = SoldOutFlags()
+        self.sale_id = 900002
+
+        # 清理测试数据
+        self.ledger.remove(self.sale_id)
+        self.ledger.redis_client.srem(StockLedger.DIRTY_KEY, self.sale_id)
+
+    def tearDown(self):
+        self.flags.close()
+        self.ledger.remove(self.sale_id)
+        self.ledger.redis_client.srem(StockLedger.DIRTY_KEY, self.sale_id)
+
+    def _wait_for(self, sold_out: bool):
+        deadline = time.monotonic() + 2
+        while self.flags.is_sold_out(self.sale_id) != sold_out and time.monotonic() < deadline:
+            time.sleep(0.01)
+        self.assertEqual(self.flags.is_sold_out(self.sale_id), sold_out)
+
+    def test_sold_out_and_release(self):
+        self.ledger.warm_up(self.sale_id, 2)
+        self.assertFalse(self.flags.is_sold_out(self.sale_id))
+
+        self.assertEqual(self.ledger.admit(self.sale_id, 1), StockLedger.ADMITTED)
+        self.assertNotIn(self.sale_id, self.ledger.get_sold_out())
+        self.assertEqual(self.ledger.admit(self.sale_id, 2), StockLedger.ADMITTED)
+        self.assertIn(self.sale_id, self.ledger.get_sold_out())
+        self._wait_for(True)
+
+        # 释放预占后恢复可售
+        self.ledger.release(self.sale_id, user_id=2)
+        self._wait_for(False)
+
+    def test_refund_and_add_stock(self):
+        self.ledger.warm_up(self.sale_id, 1)
+        self.ledger.admit(self.sale_id, 1)
+        self.ledger.confirm(self.sale_id)
+        self._wait_for(True)
+
+        self.assertEqual(self.ledger.refund(self.sale_id, [1]), 1)
+        self._wait_for(False)
+
+        self.ledger.admit(self.sale_id, 2)
+        self._wait_for(True)
+        self.assertTrue(self.ledger.add_stock(self.sale_id, 5))
+        self._wait_for(False)
+        self.assertEqual(self.ledger.get_ledger(self.sale_id)['total'], 6)
+
+    def test_load_on_subscribe(self):
+        # 订阅前已售罄的活动在首次查询时加载
+        self.ledger.warm_up(self.sale_id, 0)
+        flags = SoldOutFlags()
+        self.assertTrue(flags.is_sold_out(self.sale_id))
+        flags.close()
+
+        self.ledger.remove(self.sale_id)
+        self._wait_for(False)
+
+    def test_subscribe_retry_backoff(self):
+        flags = SoldOutFlags()
+        with patch.object(flags.redis_client, 'pubsub', side_effect=ConnectionError('down')) as pubsub:
+            self.assertFalse(flags.is_sold_out(self.sale_id))
+            self.assertFalse(flags.is_sold_out(self.sale_id))
+            # 退避期间不再尝试订阅
+            self.assertEqual(pubsub.call_count, 1)
+
+        flags._retry_at = 0.0
+        self.ledger.warm_up(self.sale_id, 0)
+        self.assertTrue(flags.is_sold_out(self.sale_id))
+        flags.close()
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,91 @@
+import unittest
+
+from util.stock_ledger import StockLedger
+
+
+class TestStockLedger(unittest.TestCase):
+    def setUp(self):
+        self.ledger = StockLedger()
+        self.sale_id = 900001
+
+        # 清理测试数据
+        self.ledger.remove(self.sale_id)
+        self.ledger.redis_client.srem(StockLedger.DIRTY_KEY, self.sale_id)
+
+    def test_warm_up(self):
+        self.assertTrue(self.ledger.warm_up(self.sale_id, 10, 3))
+        self.assertEqual(
+            self.ledger.get_ledger(self.sale_id),
+            {'total': 10, 'stock': 7, 'reserved': 0, 'sold': 3}
+        )
+
+        # 已存在的账本不会被覆盖
+        self.assertFalse(self.ledger.warm_up(self.sale_id, 100, 0))
+        self.assertEqual(self.ledger.get_ledger(self.sale_id)['total'], 10)
+
+    def test_reserve_without_warm_up(self):
+        self.assertFalse(self.ledger.reserve(self.sale_id))
+
+    def test_reserve_never_oversells(self):
+        self.ledger.warm_up(self.sale_id, 3)
+
+        results = [self.ledger.reserve(self.sale_id) for _ in range(5)]
+        self.assertEqual(results.count(True), 3)
+
+        ledger = self.ledger.get_ledger(self.sale_id)
+        self.assertEqual(ledger['stock'], 0)
+        self.assertEqual(ledger['reserved'], 3)
+
+    def test_admit_one_per_user(self):
+        self.ledger.warm_up(self.sale_id, 1)
+
+        self.assertEqual(self.ledger.admit(self.sale_id, 1), StockLedger.ADMITTED)
+        self.assertEqual(self.ledger.admit(self.sale_id, 1), StockLedger.DUPLICATE)
+        self.assertEqual(self.ledger.admit(self.sale_id, 2), StockLedger.SOLD_OUT)
+
+        # 释放后该用户可以重新抢购
+        self.assertTrue(self.ledger.release(self.sale_id, user_id=1))
+        self.assertEqual(self.ledger.admit(self.sale_id, 1), StockLedger.ADMITTED)
+
+    def test_confirm_and_release(self):
+        self.ledger.warm_up(self.sale_id, 5)
+        self.ledger.reserve(self.sale_id, 2)
+
+        self.assertTrue(self.ledger.confirm(self.sale_id))
+        self.assertTrue(self.ledger.release(self.sale_id))
+        # 没有剩余的预占库存
+        self.assertFalse(self.ledger.confirm(self.sale_id))
+        self.assertFalse(self.ledger.release(self.sale_id))
+
+        self.assertEqual(
+            self.ledger.get_ledger(self.sale_id),
+            {'total': 5, 'stock': 4, 'reserved': 0, 'sold': 1}
+        )
+        self.assertIn(self.sale_id, self.ledger.pop_dirty())
+
+    def test_refund(self):
+        self.ledger.warm_up(self.sale_id, 3)
+        for user_id in (1, 2, 3):
+            self.ledger.admit(self.sale_id, user_id)
+            self.ledger.confirm(self.sale_id)
+        self.ledger.pop_dirty()
+
+        # 未购买的用户不退还, 同一用户只退还一次
+        self.assertEqual(self.ledger.refund(self.sale_id, [1, 2, 4]), 2)
+        self.assertEqual(self.ledger.refund(self.sale_id, [1]), 0)
+        self.assertEqual(
+            self.ledger.get_ledger(self.sale_id),
+            {'total': 3, 'stock': 2, 'reserved': 0, 'sold': 1}
+        )
+        self.assertIn(self.sale_id, self.ledger.pop_dirty())
+
+        # 退还后用户可以重新抢购
+        self.assertEqual(self.ledger.admit(self.sale_id, 1), StockLedger.ADMITTED)
+
+    def tearDown(self):
+        # 清理测试数据
+        self.ledger.remove(self.sale_id)
+        self.ledger.redis_client.srem(StockLedger.DIRTY_KEY, self.sale_id)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,229 @@
+import asyncio
+import time
+import unittest
+from unittest.mock import patch
+
+from util.token_bucket import (
+    DistributedTokenBucket,
+    GCRALimiter,
+    MultiLevelRateLimiter,
+    ServerClockTokenBucket,
+    SlidingWindowLimiter
+)
+
+
+class TestDistributedTokenBucket(unittest.TestCase):
+    def setUp(self):
+        self.namespace = 'test_token_bucket'
+        self.bucket = DistributedTokenBucket(rate=1, capacity=2, namespace=self.namespace)
+        self._clean()
+
+    def _clean(self):
+        keys = self.bucket.redis_client.keys(f'{self.namespace}:*')
+        if keys:
+            self.bucket.redis_client.delete(*keys)
+
+    def test_keyed_buckets_are_independent(self):
+        self.assertTrue(self.bucket.acquire(2, key='user_1'))
+        self.assertFalse(self.bucket.acquire(1, key='user_1'))
+
+        # 其他用户的桶不受影响
+        self.assertTrue(self.bucket.acquire(2, key='user_2'))
+
+    def test_keyed_bucket_expires(self):
+        self.bucket.acquire(1, key='user_1')
+
+        tokens_key = self.bucket._get_bucket_keys('user_1')[1]
+        ttl = self.bucket.redis_client.pttl(tokens_key)
+        self.assertGreater(ttl, 0)
+        self.assertLessEqual(ttl, self.bucket.ttl)
+
+    def test_lease_never_overshoots(self):
+        # 两个实例模拟两个进程共享同一个桶
+        nodes = [
+            DistributedTokenBucket(rate=0.001, capacity=50, namespace=self.namespace, lease=True, max_lease=10)
+            for _ in range(2)
+        ]
+
+        acquired = sum(node.acquire() for _ in range(100) for node in nodes)
+        self.assertEqual(acquired, 50)
+
+    def test_lease_returns_unused_tokens(self):
+        bucket = DistributedTokenBucket(rate=0.001, capacity=50, namespace=self.namespace, lease=True, max_lease=10)
+        for _ in range(5):
+            bucket.acquire()
+
+        bucket.release_lease()
+        self.assertAlmostEqual(bucket.get_token_count(), 45, places=1)
+
+    def test_expired_lease_is_returned(self):
+        bucket = DistributedTokenBucket(
+            rate=0.001, capacity=50, namespace=self.namespace, local_cache_time=0.05, lease=True, max_lease=10
+        )
+        for _ in range(5):
+            bucket.acquire()
+        self.assertGreater(bucket._lease_tokens, 0)
+
+        # 租约到期后无需新的请求, 剩余令牌自动归还
+        time.sleep(0.3)
+        self.assertEqual(bucket._lease_tokens, 0)
+        self.assertAlmostEqual(bucket.get_token_count(), 45, places=1)
+
+    def test_lease_redis_calls_without_lock(self):
+        bucket = DistributedTokenBucket(rate=0.001, capacity=50, namespace=self.namespace, lease=True, max_lease=10)
+        locked = []
+        eval_lease, eval_return = bucket._eval_lease, bucket._eval_return
+
+        def check_lease(*args):
+            locked.append(bucket._lock.locked())
+            return eval_lease(*args)
+
+        def check_return(*args):
+            locked.append(bucket._lock.locked())
+            return eval_return(*args)
+
+        with patch.object(bucket, '_eval_lease', side_effect=check_lease), \
+                patch.object(bucket, '_eval_return', side_effect=check_return):
+            for _ in range(15):
+                self.assertTrue(bucket.acquire())
+            bucket.release_lease()
+
+        # 续借、归还都不持有锁, 令牌数不受影响
+        self.assertEqual(locked, [False] * len(locked))
+        self.assertGreaterEqual(len(locked), 3)
+        self.assertAlmostEqual(bucket.get_token_count(), 35, places=1)
+
+    def test_multi_level_keyed_limiter(self):
+        limiter = MultiLevelRateLimiter()
+        limiter.add_limiter(rate=100, capacity=100, namespace=f'{self.namespace}:global')
+        limiter.add_limiter(rate=1, capacity=1, namespace=f'{self.namespace}:user', key='user')
+
+        self.assertTrue(limiter.acquire(identity={'user': 1}))
+        self.assertFalse(limiter.acquire(identity={'user': 1}))
+        self.assertTrue(limiter.acquire(identity={'user': 2}))
+
+        # 缺少标识时跳过按用户划分的层级
+        self.assertTrue(limiter.acquire())
+
+    def test_multi_level_all_or_nothing(self):
+        limiter = MultiLevelRateLimiter()
+        limiter.add_limiter(rate=0.001, capacity=2, namespace=f'{self.namespace}:app')
+        limiter.add_limiter(rate=0.001, capacity=1, namespace=f'{self.namespace}:service')
+
+        self.assertEqual(limiter.try_acquire()[:2], (True, None))
+
+        # 第二层拒绝时第一层不扣减令牌
+        allowed, rejected, _, _ = limiter.try_acquire()
+        self.assertFalse(allowed)
+        self.assertEqual(rejected, f'{self.namespace}:service')
+        self.assertAlmostEqual(
+            limiter.limiters[0][0].get_token_count(), 1.0, places=2
+        )
+
+    def test_gcra_burst_then_rate(self):
+        limiter = GCRALimiter(rate=10, capacity=5, namespace=self.namespace)
+
+        results = [limiter.acquire(key='user_1') for _ in range(6)]
+        self.assertEqual(results, [True] * 5 + [False])
+
+        # 一个发射间隔后恢复一个额度
+        time.sleep(0.11)
+        self.assertTrue(limiter.acquire(key='user_1'))
+        self.assertFalse(limiter.acquire(key='user_1'))
+
+    def test_sliding_window_limit(self):
+        limiter = SlidingWindowLimiter(rate=100, capacity=5, namespace=self.namespace)
+
+        acquired = sum(limiter.acquire(key='user_1') for _ in range(10))
+        self.assertLessEqual(acquired, 5)
+        self.assertGreater(acquired, 0)
+        self.assertLessEqual(limiter.get_token_count(key='user_1'), 5 - acquired + 1e-6)
+
+    def test_multi_level_mixed_engines(self):
+        limiter = MultiLevelRateLimiter()
+        limiter.add_limiter(rate=100, capacity=100, namespace=f'{self.namespace}:app', algorithm='sliding_window')
+        limiter.add_limiter(rate=0.001, capacity=2, namespace=f'{self.namespace}:user', key='user', algorithm='gcra')
+
+        self.assertTrue(limiter.acquire(identity={'user': 1}))
+        self.assertTrue(limiter.acquire(identity={'user': 1}))
+        allowed, rejected, _, _ = limiter.try_acquire(identity={'user': 1})
+        self.assertFalse(allowed)
+        self.assertEqual(rejected, f'{self.namespace}:user')
+
+    def test_retry_after(self):
+        bucket = DistributedTokenBucket(rate=10, capacity=1, namespace=self.namespace)
+        self.assertEqual(bucket.try_acquire(key='user_1'), (True, 0.0))
+
+        allowed, wait = bucket.try_acquire(key='user_1')
+        self.assertFalse(allowed)
+        self.assertGreater(wait, 0)
+        self.assertLessEqual(wait, 0.1)
+
+        # 超过桶容量的请求永远无法满足
+        self.assertEqual(bucket.try_acquire(2, key='user_1'), (False, -1.0))
+
+        # 按返回的等待时间休眠一次即可通过
+        self.assertTrue(bucket.acquire(key='user_1', timeout=0.2))
+
+    def test_multi_level_retry_after(self):
+        limiter = MultiLevelRateLimiter()
+        limiter.add_limiter(rate=10, capacity=1, namespace=f'{self.namespace}:user', key='user', algorithm='gcra')
+
+        self.assertTrue(limiter.acquire(identity={'user': 1}))
+        allowed, _, _, retry_after = limiter.try_acquire(identity={'user': 1})
+        self.assertFalse(allowed)
+        self.assertGreater(retry_after, 0)
+        self.assertLessEqual(retry_after, 0.1)
+
+        self.assertTrue(asyncio.run(limiter.acquire_async(identity={'user': 1}, timeout=0.2)))
+
+    def tearDown(self):
+        self._clean()
+
+class TestClockSkew(unittest.TestCase):
+    """模拟三个时钟不一致的应用节点共享同一个令牌桶"""
+
+    SKEWS = [-2.0, 0.0, 3.0]  # 各节点相对真实时间的时钟偏差, 秒
+    RATE = 20
+    CAPACITY = 10
+    DURATION = 1.0
+
+    def setUp(self):
+        self.namespace = 'test_clock_skew'
+        self._clean()
+
+    def _clean(self):
+        client = DistributedTokenBucket(namespace=self.namespace).redis_client
+        keys = client.keys(f'{self.namespace}:*')
+        if keys:
+            client.delete(*keys)
+
+    def _run_nodes(self, bucket_cls) -> int:
+        nodes = [
+            bucket_cls(rate=self.RATE, capacity=self.CAPACITY, namespace=self.namespace)
+            for _ in self.SKEWS
+        ]
+        real_time = time.time
+        acquired = 0
+        start = real_time()
+        while real_time() - start < self.DURATION:
+            for node, skew in zip(nodes, self.SKEWS):
+                with patch('util.token_bucket.time.time', return_value=real_time() + skew):
+                    acquired += node.acquire()
+        return acquired
+
+    def test_client_clock_overshoots(self):
+        acquired = self._run_nodes(DistributedTokenBucket)
+        self.assertGreater(acquired, 2 * (self.CAPACITY + self.RATE * self.DURATION))
+
+    def test_server_clock_is_accurate(self):
+        acquired = self._run_nodes(ServerClockTokenBucket)
+        expected = self.CAPACITY + self.RATE * self.DURATION
+        self.assertLessEqual(acquired, expected + 2)
+        self.assertGreaterEqual(acquired, expected * 0.8)
+
+    def tearDown(self):
+        self._clean()
+
+if __name__ == '__main__':
+    unittest.main()
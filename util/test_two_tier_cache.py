@@ -0,0 +1,84 @@
+import time
+import unittest
+
+from util.two_tier_cache import TwoTierCache
+
+
+class TestTwoTierCache(unittest.TestCase):
+    def setUp(self):
+        self.namespace = 'test_two_tier_cache'
+        self.cache = TwoTierCache(self.namespace, local_ttl=60, max_size=2)
+        self._clean()
+        self.loads = 0
+
+    def _clean(self):
+        keys = self.cache.redis_client.keys(f'{self.namespace}:*')
+        if keys:
+            self.cache.redis_client.delete(*keys)
+
+    def _loader(self, value):
+        def load():
+            self.loads += 1
+            return value
+        return load
+
+    def test_read_through(self):
+        self.assertEqual(self.cache.get('1', self._loader({'id': 1})), {'id': 1})
+        self.assertEqual(self.cache.get('1', self._loader({'id': 1})), {'id': 1})
+        self.assertEqual(self.loads, 1)
+
+        # 另一个节点从 Redis 命中, 不再回源
+        other = TwoTierCache(self.namespace)
+        self.assertEqual(other.get('1', self._loader({'id': 1})), {'id': 1})
+        self.assertEqual(self.loads, 1)
+
+    def test_none_is_not_cached(self):
+        self.assertIsNone(self.cache.get('1', self._loader(None)))
+        self.assertIsNone(self.cache.get('1', self._loader(None)))
+        self.assertEqual(self.loads, 2)
+
+    def test_lru_eviction(self):
+        for key in ('1', '2', '3'):
+            self.cache.get(key, self._loader(key))
+        self.assertNotIn('1', self.cache._local)
+        self.assertEqual(len(self.cache._local), 2)
+
+    def test_invalidate_all_nodes(self):
+        other = TwoTierCache(self.namespace, local_ttl=60)
+        self.cache.get('1', self._loader('old'))
+        other.get('1', self._loader('old'))
+
+        self.cache.invalidate('1')
+
+        # 等待订阅线程收到失效消息
+        deadline = time.monotonic() + 2
+        while '1' in other._local and time.monotonic() < deadline:
+            time.sleep(0.01)
+        self.assertEqual(other.get('1', self._loader('new')), 'new')
+
+    def test_invalidate_group(self):
+        self.cache.get('list:0', self._loader([1, 2]), group='list')
+        self.cache.get('list:2', self._loader([3]), group='list')
+        self.cache.get('1', self._loader(1))
+
+        self.cache.invalidate(groups=['list'])
+        self.assertEqual(list(self.cache._local), ['1'])
+        self.assertEqual(self.cache.redis_client.keys(f'{self.namespace}:list:*'), [])
+
+    def test_invalidate_during_load_skips_write_back(self):
+        def load():
+            # 加载期间数据被更新并失效
+            self.cache.invalidate('1')
+            return 'stale'
+
+        self.assertEqual(self.cache.get('1', load), 'stale')
+        self.assertNotIn('1', self.cache._local)
+        self.assertIsNone(self.cache.redis_client.get(f'{self.namespace}:1'))
+        self.assertEqual(self.cache.get('1', self._loader('new')), 'new')
+        self.assertEqual(self.cache.get('1', self._loader('newer')), 'new')
+
+    def tearDown(self):
+        self._clean()
+
+if __name__ == '__main__':
+    unittest.main()
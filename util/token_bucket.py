@@ -1,10 +1,12 @@
+import asyncio
 import logging
+import math
 import threading
 import time
-
-import redis
+from typing import Dict, Optional, Tuple, Union
 
 from conf.conf import conf
+from util.connection_registry import connection_registry
 
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
@@ -14,6 +16,8 @@ class DistributedTokenBucket:
     分布式令牌桶
     """
 
+    ALGORITHM = 'token_bucket'
+
     # Lua脚本: 原子性获取令牌
     ACQUIRE_TOKEN_SCRIPT = """
     local bucket_key = KEYS[1]
@@ -23,6 +27,7 @@ class DistributedTokenBucket:
     local capacity = tonumber(ARGV[2])
     local now = tonumber(ARGV[3])
     local requested = tonumber(ARGV[4])
+    local ttl = tonumber(ARGV[5])
     
     -- 获取当前令牌数和上次更新时间
     local tokens = tonumber(redis.call('get', tokens_key) or capacity)
@@ -36,12 +41,64 @@ class DistributedTokenBucket:
     if new_tokens >= requested then
         -- 扣除令牌并更新状态
         new_tokens = new_tokens - requested
-        redis.call('set', tokens_key, new_tokens)
-        redis.call('set', timestamp_key, now)
-        return 1
+        -- 超过补满时间未访问的桶与满桶等价, 设置过期时间以回收空闲的键
+        redis.call('set', tokens_key, new_tokens, 'PX', ttl)
+        redis.call('set', timestamp_key, now, 'PX', ttl)
+        return {1, tostring(new_tokens), '0'}
     end
     
-    return 0
+    -- 令牌不足, 返回补足所需的等待时间(秒), 请求量超过容量时永远无法满足, 返回-1
+    local wait = -1
+    if requested <= capacity then
+        wait = (requested - new_tokens) / rate
+    end
+    return {0, tostring(new_tokens), tostring(wait)}
+    """
+
+    # Lua脚本: 租借一批令牌, 可用令牌不少于 min_batch 时借出 min(可用, batch) 个
+    LEASE_TOKEN_SCRIPT = """
+    local tokens_key = KEYS[1]
+    local timestamp_key = KEYS[2]
+    local rate = tonumber(ARGV[1])
+    local capacity = tonumber(ARGV[2])
+    local now = tonumber(ARGV[3])
+    local batch = tonumber(ARGV[4])
+    local min_batch = tonumber(ARGV[5])
+    local ttl = tonumber(ARGV[6])
+
+    local tokens = tonumber(redis.call('get', tokens_key) or capacity)
+    local last_time = tonumber(redis.call('get', timestamp_key) or now)
+
+    local delta = math.max(0, now - last_time)
+    local available = math.min(capacity, tokens + (delta * rate))
+    if available < min_batch then
+        return 0
+    end
+
+    local granted = math.min(math.floor(available), batch)
+    redis.call('set', tokens_key, available - granted, 'PX', ttl)
+    redis.call('set', timestamp_key, now, 'PX', ttl)
+    return granted
+    """
+
+    # Lua脚本: 归还租约中未使用的令牌
+    RETURN_TOKEN_SCRIPT = """
+    local tokens_key = KEYS[1]
+    local timestamp_key = KEYS[2]
+    local rate = tonumber(ARGV[1])
+    local capacity = tonumber(ARGV[2])
+    local now = tonumber(ARGV[3])
+    local unused = tonumber(ARGV[4])
+    local ttl = tonumber(ARGV[5])
+
+    local tokens = tonumber(redis.call('get', tokens_key) or capacity)
+    local last_time = tonumber(redis.call('get', timestamp_key) or now)
+
+    local delta = math.max(0, now - last_time)
+    local new_tokens = math.min(capacity, tokens + (delta * rate) + unused)
+    redis.call('set', tokens_key, new_tokens, 'PX', ttl)
+    redis.call('set', timestamp_key, now, 'PX', ttl)
+    return tostring(new_tokens)
     """
 
     def __init__(
@@ -52,10 +109,12 @@ class DistributedTokenBucket:
             rate: float = 10.0,  # 每秒补充的令牌数
             capacity: int = 100,  # 桶的容量
             namespace: str = 'default',  # 用于区分不同的限流器
-            local_cache_time: float = 0.1  # 本地缓存时间，秒
+            local_cache_time: float = 0.1,  # 本地租约有效期，秒
+            lease: bool = False,  # 是否开启本地租约模式
+            max_lease: Optional[int] = None  # 单次租借令牌数上限, 默认为容量的1/10
     ):
         # Redis连接
-        self.redis_client = redis.Redis(
+        self.redis_client = connection_registry.redis(
             host=redis_host,
             port=redis_port,
             db=redis_db,
@@ -66,25 +125,48 @@ class DistributedTokenBucket:
         self.capacity = capacity
         self.namespace = namespace
         self.local_cache_time = local_cache_time
-
-        # 用于本地缓存的变量
-        self._local_tokens = capacity
-        self._last_update_time = time.time()
+        # 桶从空到满所需的时间(毫秒), 作为键的过期时间
+        self.ttl = int(math.ceil(capacity / rate * 1000)) + 1000
+
+        # 租约模式: 从Redis批量借出令牌在本地消费, 到期归还未用完的部分,
+        # 全局已扣减的令牌数始终不少于各进程实际消费的令牌数, 不会超发.
+        # 租约到期后即使没有新的请求, 也由后台线程归还剩余令牌; 进程退出时未归还的令牌由桶的补充速率补回
+        self.lease = lease
+        self.max_lease = max(1, max_lease or capacity // 10)
+        self._lease_tokens = 0
+        self._lease_expire_time = 0.0
+        self._lease_start_time = 0.0
+        self._lease_consumed = 0
+        # 本进程令牌消耗速率的指数加权平均, 用于估算下一次租借的数量
+        self._consume_rate = 0.0
         self._lock = threading.Lock()
+        self._lease_granted = threading.Event()
+        self._reclaimer = None
 
         # 预编译Lua脚本
         self._acquire_token_script = self.redis_client.register_script(
             self.ACQUIRE_TOKEN_SCRIPT
         )
+        self._lease_token_script = self.redis_client.register_script(
+            self.LEASE_TOKEN_SCRIPT
+        )
+        self._return_token_script = self.redis_client.register_script(
+            self.RETURN_TOKEN_SCRIPT
+        )
 
         # 初始化Redis中的令牌桶
         self._init_bucket()
 
+    def _get_bucket_keys(self, key: Optional[Union[str, int]] = None) -> list:
+        """生成令牌桶的键, key 为用户ID/IP等标识时每个标识独立一个桶"""
+        bucket_key = f"{self.namespace}:{self.ALGORITHM}"
+        if key is not None:
+            bucket_key = f"{bucket_key}:{key}"
+        return [bucket_key, f"{bucket_key}:tokens", f"{bucket_key}:timestamp"]
+
     def _init_bucket(self):
         """初始化Redis中的令牌桶"""
-        bucket_key = f"{self.namespace}:token_bucket"
-        tokens_key = f"{bucket_key}:tokens"
-        timestamp_key = f"{bucket_key}:timestamp"
+        bucket_key, tokens_key, timestamp_key = self._get_bucket_keys()
 
         # 使用Redis的事务确保原子性初始化
         with self.redis_client.pipeline() as pipe:
@@ -94,100 +176,517 @@ class DistributedTokenBucket:
                 # 如果键不存在，则初始化
                 if not self.redis_client.exists(tokens_key):
                     pipe.multi()
-                    pipe.set(tokens_key, self.capacity)
-                    pipe.set(timestamp_key, time.time())
+                    pipe.set(tokens_key, self.capacity, px=self.ttl)
+                    pipe.set(timestamp_key, time.time(), px=self.ttl)
                     pipe.execute()
 
             except Exception as e:
                 logger.error(f"初始化令牌桶失败: {str(e)}")
                 raise
 
-    def acquire(self, tokens: int = 1, timeout: float = 0) -> bool:
+    def acquire(self, tokens: int = 1, timeout: float = 0, key: Optional[Union[str, int]] = None) -> bool:
         """
         尝试获取指定数量的令牌
 
         Args:
             tokens: 需要的令牌数量
             timeout: 等待超时时间，0表示不等待
+            key: 桶的标识(如用户ID、IP), 为None时使用命名空间下的全局桶;
+                 按标识划分的桶在Redis中按需创建并自动过期, 本地不保存任何状态
 
         Returns:
             bool: 是否成功获取令牌
         """
-        start_time = time.time()
+        deadline = time.monotonic() + timeout
 
         while True:
-            # 先尝试从本地缓存获取
-            if self._try_acquire_local(tokens):
+            acquired, wait = self.try_acquire(tokens, key)
+            if acquired:
                 return True
 
-            # 本地获取失败，尝试从Redis获取
-            if self._try_acquire_redis(tokens):
+            # 按脚本算出的等待时间精确休眠一次, 超时前无法获得令牌时直接返回
+            if wait < 0 or wait > deadline - time.monotonic():
+                return False
+            time.sleep(wait)
+
+    async def acquire_async(self, tokens: int = 1, timeout: float = 0, key: Optional[Union[str, int]] = None) -> bool:
+        """acquire 的协程版本, 等待期间不阻塞事件循环"""
+        deadline = time.monotonic() + timeout
+
+        while True:
+            acquired, wait = await asyncio.to_thread(self.try_acquire, tokens, key)
+            if acquired:
                 return True
 
-            # 如果设置了超时且未超时，继续尝试
-            if timeout > 0 and (time.time() - start_time) < timeout:
-                time.sleep(0.01)  # 短暂休眠避免死循环
-                continue
+            if wait < 0 or wait > deadline - time.monotonic():
+                return False
+            await asyncio.sleep(wait)
 
-            return False
+    def try_acquire(self, tokens: int = 1, key: Optional[Union[str, int]] = None) -> Tuple[bool, float]:
+        """
+        尝试获取一次令牌, 不等待
 
-    def _try_acquire_local(self, tokens: int) -> bool:
-        """尝试从本地缓存获取令牌"""
+        Returns:
+            Tuple[bool, float]: (是否获取成功, 失败时距离令牌足够还需等待的秒数, -1表示无法满足)
+        """
+        # 租约模式下从本地租约获取, 按标识划分的桶不做本地租约
+        if key is None and self.lease:
+            if self._try_acquire_lease(tokens):
+                return True, 0.0
+            return False, tokens / self.rate
+
+        return self._try_acquire_redis(tokens, key)
+
+    def _try_acquire_lease(self, tokens: int) -> bool:
+        """从本地租约获取令牌, 租约不足或到期时向Redis续借"""
         with self._lock:
             now = time.time()
-            # 检查是否需要刷新本地缓存
-            if now - self._last_update_time >= self.local_cache_time:
-                return False
-
-            if self._local_tokens >= tokens:
-                self._local_tokens -= tokens
+            if now < self._lease_expire_time and self._lease_tokens >= tokens:
+                self._lease_tokens -= tokens
+                self._lease_consumed += tokens
                 return True
 
-            return False
+            unused, batch = self._take_lease(tokens, now)
 
-    def _try_acquire_redis(self, tokens: int) -> bool:
-        """从Redis获取令牌"""
-        bucket_key = f"{self.namespace}:token_bucket"
-        tokens_key = f"{bucket_key}:tokens"
-        timestamp_key = f"{bucket_key}:timestamp"
+        # Redis 往返期间不持有锁, 避免阻塞其他线程的本地租约获取与归还
+        return self._renew_lease(tokens, now, unused, batch)
+
+    def _take_lease(self, tokens: int, now: float) -> Tuple[int, int]:
+        """
+        取出未用完的租约并估算下一次租借的数量, 调用方需持有锁
 
+        Returns:
+            Tuple[int, int]: (需归还的令牌数, 本次租借的令牌数)
+        """
+        # 更新消耗速率估计
+        elapsed = now - self._lease_start_time
+        if self._lease_start_time and elapsed > 0:
+            observed_rate = self._lease_consumed / elapsed
+            self._consume_rate = 0.5 * self._consume_rate + 0.5 * observed_rate
+
+        unused = self._lease_tokens
+        self._lease_tokens = 0
+        self._lease_consumed = 0
+        self._lease_start_time = now
+
+        batch = int(math.ceil(self._consume_rate * self.local_cache_time))
+        batch = min(max(batch, tokens), max(self.max_lease, tokens))
+        return unused, batch
+
+    def _renew_lease(self, tokens: int, now: float, unused: int, batch: int) -> bool:
+        """归还取出的租约并重新租借, 调用方不持有锁, 仅在写回租约时加锁"""
         try:
-            result = self._acquire_token_script(
-                keys=[bucket_key, tokens_key, timestamp_key],
-                args=[
-                    self.rate,
-                    self.capacity,
-                    time.time(),
-                    tokens
-                ]
+            if unused > 0:
+                self._eval_return(unused)
+            granted = self._eval_lease(batch, tokens)
+        except Exception as e:
+            logger.error(f"Redis操作失败: {str(e)}")
+            return False
+
+        if granted < tokens:
+            return False
+
+        # 其他线程可能同时续借, 借到的令牌累加到本地租约
+        with self._lock:
+            self._lease_tokens += granted - tokens
+            self._lease_consumed += tokens
+            self._lease_expire_time = max(self._lease_expire_time, now + self.local_cache_time)
+            if self._lease_tokens > 0:
+                self._ensure_reclaimer()
+                self._lease_granted.set()
+        return True
+
+    def _ensure_reclaimer(self) -> None:
+        """启动归还过期租约的后台线程, 调用方需持有锁"""
+        if self._reclaimer is None or not self._reclaimer.is_alive():
+            self._reclaimer = threading.Thread(
+                target=self._reclaim_expired_leases,
+                name=f'token-bucket-lease-{self.namespace}',
+                daemon=True
             )
+            self._reclaimer.start()
 
-            # 更新本地缓存
-            if result == 1:
+    def _reclaim_expired_leases(self) -> None:
+        """等待租约到期, 到期时仍未被续借的剩余令牌归还Redis"""
+        while True:
+            self._lease_granted.wait()
+            self._lease_granted.clear()
+            while True:
                 with self._lock:
-                    self._local_tokens = float(
-                        self.redis_client.get(tokens_key) or self.capacity
-                    )
-                    self._last_update_time = time.time()
-                return True
+                    if self._lease_tokens <= 0:
+                        break
+                    wait = self._lease_expire_time - time.time()
+                    if wait <= 0:
+                        unused = self._lease_tokens
+                        self._lease_tokens = 0
+                        self._lease_expire_time = 0.0
+                if wait <= 0:
+                    self._return_unused(unused)
+                    break
+                # 租约在等待期间可能被续借, 醒来后按新的到期时间重新判断
+                time.sleep(wait)
+
+    def refund_lease(self, tokens: int) -> None:
+        """将已从租约中扣减的令牌退回本地租约"""
+        with self._lock:
+            self._lease_tokens += tokens
+            self._lease_consumed -= tokens
 
-            return False
+    def release_lease(self) -> None:
+        """立即归还本地租约中未使用的令牌"""
+        with self._lock:
+            unused = self._lease_tokens
+            self._lease_tokens = 0
+            self._lease_expire_time = 0.0
+        if unused > 0:
+            self._return_unused(unused)
+
+    def _return_unused(self, unused: int) -> None:
+        """将已从本地租约取出的令牌归还Redis, 调用方不持有锁"""
+        try:
+            self._eval_return(unused)
+        except Exception as e:
+            logger.error(f"Redis操作失败: {str(e)}")
+
+    def _eval_acquire(self, tokens: int, key: Optional[Union[str, int]] = None) -> Tuple[int, str, str]:
+        """执行获取令牌的脚本, 返回 (是否获取成功, 剩余令牌数, 需等待的秒数)"""
+        return self._acquire_token_script(
+            keys=self._get_bucket_keys(key),
+            args=[self.rate, self.capacity, time.time(), tokens, self.ttl]
+        )
+
+    def _eval_lease(self, batch: int, min_batch: int) -> int:
+        """执行租借令牌的脚本, 返回借出的令牌数"""
+        _, tokens_key, timestamp_key = self._get_bucket_keys()
+        return self._lease_token_script(
+            keys=[tokens_key, timestamp_key],
+            args=[self.rate, self.capacity, time.time(), batch, min_batch, self.ttl]
+        )
+
+    def _eval_return(self, unused: int) -> None:
+        """执行归还令牌的脚本"""
+        _, tokens_key, timestamp_key = self._get_bucket_keys()
+        self._return_token_script(
+            keys=[tokens_key, timestamp_key],
+            args=[self.rate, self.capacity, time.time(), unused, self.ttl]
+        )
+
+    def _try_acquire_redis(self, tokens: int, key: Optional[Union[str, int]] = None) -> Tuple[bool, float]:
+        """从Redis获取令牌"""
+        try:
+            acquired, remaining, wait = self._eval_acquire(tokens, key)
+            return acquired == 1, float(wait)
 
         except Exception as e:
             logger.error(f"Redis操作失败: {str(e)}")
-            return False
+            return False, -1.0
 
-    def get_token_count(self) -> float:
+    def get_token_count(self, key: Optional[Union[str, int]] = None) -> float:
         """获取当前可用的令牌数"""
-        tokens_key = f"{self.namespace}:token_bucket:tokens"
+        tokens_key = self._get_bucket_keys(key)[1]
         try:
             return float(self.redis_client.get(tokens_key) or self.capacity)
         except Exception as e:
             logger.error(f"获取令牌数量失败: {str(e)}")
             return 0.0
 
+# 公共Lua片段: 读取Redis服务器时间
+SERVER_TIME_SCRIPT = """
+    redis.replicate_commands()
+    local server_time = redis.call('time')
+    local now = tonumber(server_time[1]) + tonumber(server_time[2]) / 1000000
+    """
+
+# 单层级获取令牌: check(key, rate, capacity, now, requested, ttl)
+# 返回 (是否通过, 剩余额度, 提交函数, 拒绝时需等待的秒数, 请求量超过容量时为-1)
+SINGLE_ACQUIRE_SCRIPT = """
+    local allowed, remaining, commit, wait = check(KEYS[1], tonumber(ARGV[1]), tonumber(ARGV[2]), now, tonumber(ARGV[3]), tonumber(ARGV[4]))
+    if allowed then
+        commit()
+        return {1, tostring(remaining), '0'}
+    end
+    return {0, tostring(remaining), tostring(wait)}
+    """
+
+# 只读查询当前可用额度
+PEEK_SCRIPT = """
+    local allowed, remaining = check(KEYS[1], tonumber(ARGV[1]), tonumber(ARGV[2]), now, 0, 0)
+    return tostring(remaining)
+    """
+
+
+def _build_engine_script(lua_check: str, algorithm: str, driver: str) -> str:
+    """拼接限流算法的Lua函数与驱动脚本"""
+    return SERVER_TIME_SCRIPT + lua_check + f"""
+    local check = check_{algorithm}
+    """ + driver
+
+
+class ServerClockTokenBucket(DistributedTokenBucket):
+    """
+    使用Redis服务器时钟的分布式令牌桶
+
+    脚本内通过 TIME 获取当前时间, 令牌数与上次补充时间保存在同一个带过期时间的哈希中,
+    各节点之间的时钟偏差不会导致令牌补充跳变或停滞
+    """
+
+    ALGORITHM = 'token_bucket'
+
+    # Lua函数: 令牌桶校验, 单层级与多层级脚本共用
+    LUA_CHECK = """
+    local function check_token_bucket(key, rate, capacity, now, requested, ttl)
+        local bucket = redis.call('hmget', key, 'tokens', 'timestamp')
+        local tokens = tonumber(bucket[1] or capacity)
+        local last_time = tonumber(bucket[2] or now)
+
+        local delta = math.max(0, now - last_time)
+        local available = math.min(capacity, tokens + (delta * rate))
+        if available < requested then
+            if requested > capacity then
+                return false, available, nil, -1
+            end
+            return false, available, nil, (requested - available) / rate
+        end
+
+        return true, available - requested, function()
+            redis.call('hset', key, 'tokens', available - requested, 'timestamp', now)
+            redis.call('pexpire', key, ttl)
+        end
+    end
+    """
+
+    # Lua脚本: 原子性获取令牌
+    ACQUIRE_TOKEN_SCRIPT = _build_engine_script(LUA_CHECK, ALGORITHM, SINGLE_ACQUIRE_SCRIPT)
+    PEEK_TOKEN_SCRIPT = _build_engine_script(LUA_CHECK, ALGORITHM, PEEK_SCRIPT)
+
+    # 公共Lua片段: 读取服务器时间, 计算补充后的可用令牌数
+    REFILL_SCRIPT = SERVER_TIME_SCRIPT + """
+    local bucket_key = KEYS[1]
+    local rate = tonumber(ARGV[1])
+    local capacity = tonumber(ARGV[2])
+
+    local bucket = redis.call('hmget', bucket_key, 'tokens', 'timestamp')
+    local tokens = tonumber(bucket[1] or capacity)
+    local last_time = tonumber(bucket[2] or now)
+
+    local delta = math.max(0, now - last_time)
+    local available = math.min(capacity, tokens + (delta * rate))
+    """
+
+    # Lua脚本: 租借一批令牌
+    LEASE_TOKEN_SCRIPT = REFILL_SCRIPT + """
+    local batch = tonumber(ARGV[3])
+    local min_batch = tonumber(ARGV[4])
+    local ttl = tonumber(ARGV[5])
+
+    if available < min_batch then
+        return 0
+    end
+
+    local granted = math.min(math.floor(available), batch)
+    redis.call('hset', bucket_key, 'tokens', available - granted, 'timestamp', now)
+    redis.call('pexpire', bucket_key, ttl)
+    return granted
+    """
+
+    # Lua脚本: 归还租约中未使用的令牌
+    RETURN_TOKEN_SCRIPT = REFILL_SCRIPT + """
+    local unused = tonumber(ARGV[3])
+    local ttl = tonumber(ARGV[4])
+
+    available = math.min(capacity, available + unused)
+    redis.call('hset', bucket_key, 'tokens', available, 'timestamp', now)
+    redis.call('pexpire', bucket_key, ttl)
+    return tostring(available)
+    """
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self._peek_token_script = self.redis_client.register_script(
+            self.PEEK_TOKEN_SCRIPT
+        )
+
+    def _init_bucket(self):
+        """桶在首次访问时由脚本创建, 无需预先初始化"""
+        pass
+
+    def _eval_acquire(self, tokens: int, key: Optional[Union[str, int]] = None) -> Tuple[int, str, str]:
+        return self._acquire_token_script(
+            keys=[self._get_bucket_keys(key)[0]],
+            args=[self.rate, self.capacity, tokens, self.ttl]
+        )
+
+    def _eval_lease(self, batch: int, min_batch: int) -> int:
+        return self._lease_token_script(
+            keys=[self._get_bucket_keys()[0]],
+            args=[self.rate, self.capacity, batch, min_batch, self.ttl]
+        )
+
+    def _eval_return(self, unused: int) -> None:
+        self._return_token_script(
+            keys=[self._get_bucket_keys()[0]],
+            args=[self.rate, self.capacity, unused, self.ttl]
+        )
+
+    def get_token_count(self, key: Optional[Union[str, int]] = None) -> float:
+        """获取当前可用的令牌数"""
+        try:
+            return float(self._peek_token_script(
+                keys=[self._get_bucket_keys(key)[0]],
+                args=[self.rate, self.capacity]
+            ))
+        except Exception as e:
+            logger.error(f"获取令牌数量失败: {str(e)}")
+            return 0.0
+
+class GCRALimiter(ServerClockTokenBucket):
+    """
+    GCRA(通用信元速率算法)限流器
+
+    每个键只保存一个理论到达时间(TAT), 允许 capacity 个请求的突发, 长期速率为 rate;
+    与令牌桶等价但状态只有一个时间戳, 适合按用户划分的大量键。不支持租约模式
+    """
+
+    ALGORITHM = 'gcra'
+
+    LUA_CHECK = """
+    local function check_gcra(key, rate, capacity, now, requested, ttl)
+        local interval = 1 / rate
+        local burst = capacity * interval
+        local tat = math.max(tonumber(redis.call('get', key) or now), now)
+
+        local new_tat = tat + requested * interval
+        local remaining = (burst - (new_tat - now)) / interval
+        if remaining < 0 then
+            if requested > capacity then
+                return false, (burst - (tat - now)) / interval, nil, -1
+            end
+            return false, (burst - (tat - now)) / interval, nil, new_tat - burst - now
+        end
+
+        return true, remaining, function()
+            redis.call('set', key, new_tat, 'PX', ttl)
+        end
+    end
+    """
+
+    ACQUIRE_TOKEN_SCRIPT = _build_engine_script(LUA_CHECK, ALGORITHM, SINGLE_ACQUIRE_SCRIPT)
+    PEEK_TOKEN_SCRIPT = _build_engine_script(LUA_CHECK, ALGORITHM, PEEK_SCRIPT)
+
+    def __init__(self, *args, **kwargs):
+        kwargs['lease'] = False
+        super().__init__(*args, **kwargs)
+
+
+class SlidingWindowLimiter(ServerClockTokenBucket):
+    """
+    滑动窗口计数限流器
+
+    窗口长度为 capacity / rate 秒, 任意窗口内最多 capacity 个请求;
+    以上一个固定窗口的计数按重叠比例加权估算滑动窗口内的请求数, 每个键只保存三个计数。不支持租约模式
+    """
+
+    ALGORITHM = 'sliding_window'
+
+    LUA_CHECK = """
+    local function check_sliding_window(key, rate, capacity, now, requested, ttl)
+        local window = capacity / rate
+        local current_window = math.floor(now / window)
+        local state = redis.call('hmget', key, 'window', 'current', 'previous')
+        local stored_window = tonumber(state[1] or current_window)
+        local current = tonumber(state[2] or 0)
+        local previous = tonumber(state[3] or 0)
+
+        -- 窗口滚动
+        if stored_window == current_window - 1 then
+            previous = current
+            current = 0
+        elseif stored_window ~= current_window then
+            previous = 0
+            current = 0
+        end
+
+        local weight = 1 - (now / window - current_window)
+        local used = previous * weight + current
+        if used + requested > capacity then
+            if requested > capacity then
+                return false, capacity - used, nil, -1
+            end
+            -- 上一窗口的权重随时间线性下降, 当前窗口计数足够时可算出精确等待时间,
+            -- 否则至少等到下一个窗口开始
+            local wait = (current_window + 1) * window - now
+            if previous > 0 and current + requested <= capacity then
+                wait = math.min(wait, (used + requested - capacity) * window / previous)
+            end
+            return false, capacity - used, nil, wait
+        end
+
+        return true, capacity - used - requested, function()
+            redis.call('hset', key, 'window', current_window, 'current', current + requested, 'previous', previous)
+            redis.call('pexpire', key, ttl)
+        end
+    end
+    """
+
+    ACQUIRE_TOKEN_SCRIPT = _build_engine_script(LUA_CHECK, ALGORITHM, SINGLE_ACQUIRE_SCRIPT)
+    PEEK_TOKEN_SCRIPT = _build_engine_script(LUA_CHECK, ALGORITHM, PEEK_SCRIPT)
+
+    def __init__(self, *args, **kwargs):
+        kwargs['lease'] = False
+        super().__init__(*args, **kwargs)
+        # 键需要保留到下一个窗口结束
+        self.ttl = int(math.ceil(2 * self.capacity / self.rate * 1000)) + 1000
+
+
+# 可在 conf.yaml 的 limiters 中通过 algorithm 选择的限流算法
+LIMITER_ENGINES = {
+    ServerClockTokenBucket.ALGORITHM: ServerClockTokenBucket,
+    GCRALimiter.ALGORITHM: GCRALimiter,
+    SlidingWindowLimiter.ALGORITHM: SlidingWindowLimiter,
+}
+
+
 class MultiLevelRateLimiter:
-    """多级限流器"""
+    """多级限流器, 各层级可使用不同的限流算法, 均以Redis服务器时钟计时"""
+
+    # Lua脚本: 一次性校验所有层级, 全部通过才统一提交
+    MULTI_ACQUIRE_SCRIPT = SERVER_TIME_SCRIPT + ''.join(
+        engine.LUA_CHECK for engine in LIMITER_ENGINES.values()
+    ) + """
+    local engines = {
+        token_bucket = check_token_bucket,
+        gcra = check_gcra,
+        sliding_window = check_sliding_window
+    }
+    local requested = tonumber(ARGV[1])
+    local commits = {}
+    local min_remaining = nil
+
+    -- 第一遍: 校验每个层级, 任一层级拒绝即返回且不修改任何状态
+    for i = 1, #KEYS do
+        local check = engines[ARGV[i * 4 - 2]]
+        local rate = tonumber(ARGV[i * 4 - 1])
+        local capacity = tonumber(ARGV[i * 4])
+        local ttl = tonumber(ARGV[i * 4 + 1])
+
+        local allowed, remaining, commit, wait = check(KEYS[i], rate, capacity, now, requested, ttl)
+        if not allowed then
+            return {i, tostring(remaining), tostring(wait)}
+        end
+
+        commits[i] = commit
+        if min_remaining == nil or remaining < min_remaining then
+            min_remaining = remaining
+        end
+    end
+
+    -- 第二遍: 所有层级均通过, 统一提交
+    for i = 1, #KEYS do
+        commits[i]()
+    end
+
+    return {0, tostring(min_remaining or 0), '0'}
+    """
 
     def __init__(
             self,
@@ -202,44 +701,155 @@ class MultiLevelRateLimiter:
             'redis_db': redis_db
         }
 
+        self.redis_client = connection_registry.redis(
+            host=redis_host,
+            port=redis_port,
+            db=redis_db,
+            decode_responses=True
+        )
+        self._multi_acquire_script = self.redis_client.register_script(
+            self.MULTI_ACQUIRE_SCRIPT
+        )
+
     def add_limiter(
             self,
             rate: float,
             capacity: int,
-            namespace: str
+            namespace: str,
+            key: Optional[str] = None,
+            lease: bool = False,
+            algorithm: str = ServerClockTokenBucket.ALGORITHM
     ) -> None:
-        """添加一个限流层级"""
-        limiter = DistributedTokenBucket(
+        """
+        添加一个限流层级
+
+        Args:
+            key: 按哪种标识划分令牌桶(如 'user'、'ip'), 为None时该层级共享一个全局桶
+            lease: 是否对全局桶开启本地租约模式, 仅令牌桶算法支持
+            algorithm: 限流算法, 见 LIMITER_ENGINES
+        """
+        if algorithm not in LIMITER_ENGINES:
+            raise ValueError(f"未知的限流算法: {algorithm}")
+
+        limiter = LIMITER_ENGINES[algorithm](
             rate=rate,
             capacity=capacity,
             namespace=namespace,
+            lease=lease and key is None,
             **self.redis_params
         )
-        self.limiters.append(limiter)
+        self.limiters.append((limiter, key))
+
+    def try_acquire(
+            self,
+            tokens: int = 1,
+            identity: Optional[Dict[str, Union[str, int]]] = None
+    ) -> Tuple[bool, Optional[str], float, float]:
+        """
+        一次Redis调用完成所有层级的校验与扣减, 任一层级拒绝时所有层级均不扣减
+
+        Args:
+            identity: 请求方标识, 如 {'user': 1, 'ip': '127.0.0.1'};
+                      按标识划分的层级在缺少对应标识时跳过
+
+        Returns:
+            Tuple[bool, Optional[str], float, float]:
+                (是否通过, 拒绝的层级命名空间,
+                 通过时为各层级剩余令牌的最小值/拒绝时为该层级的可用令牌数,
+                 拒绝时建议的重试等待秒数, -1表示无法满足)
+        """
+        identity = identity or {}
+        leased = []
+        levels = []
+        keys = []
+        args = [tokens]
+
+        for limiter, key in self.limiters:
+            # 租约模式的层级在本地扣减, 后续层级拒绝时退回
+            if limiter.lease:
+                if not limiter._try_acquire_lease(tokens):
+                    self._refund_leases(leased, tokens)
+                    return False, limiter.namespace, 0.0, tokens / limiter.rate
+                leased.append(limiter)
+                continue
+
+            bucket_key = None
+            if key is not None:
+                bucket_key = identity.get(key)
+                if bucket_key is None:
+                    continue
+
+            levels.append(limiter)
+            keys.append(limiter._get_bucket_keys(bucket_key)[0])
+            args.extend([limiter.ALGORITHM, limiter.rate, limiter.capacity, limiter.ttl])
+
+        if not levels:
+            return True, None, 0.0, 0.0
+
+        try:
+            rejected_level, remaining, wait = self._multi_acquire_script(keys=keys, args=args)
+        except Exception as e:
+            logger.error(f"Redis操作失败: {str(e)}")
+            self._refund_leases(leased, tokens)
+            return False, None, 0.0, -1.0
 
-    def acquire(self, tokens: int = 1, timeout: float = 0) -> bool:
+        if rejected_level == 0:
+            return True, None, float(remaining), 0.0
+        self._refund_leases(leased, tokens)
+        return False, levels[rejected_level - 1].namespace, float(remaining), float(wait)
+
+    @staticmethod
+    def _refund_leases(limiters: list, tokens: int) -> None:
+        for limiter in limiters:
+            limiter.refund_lease(tokens)
+
+    def acquire(
+            self,
+            tokens: int = 1,
+            timeout: float = 0,
+            identity: Optional[Dict[str, Union[str, int]]] = None
+    ) -> bool:
         """
         尝试通过所有限流层级
-        只有所有层级都通过才算成功
+        只有所有层级都通过才算成功, 被拒绝时按返回的等待时间休眠后重试, 直到超时
         """
-        start_time = time.time()
+        deadline = time.monotonic() + timeout
 
-        for limiter in self.limiters:
-            remaining_timeout = max(
-                0,
-                timeout - (time.time() - start_time)
-            ) if timeout > 0 else 0
+        while True:
+            allowed, _, _, wait = self.try_acquire(tokens, identity)
+            if allowed:
+                return True
 
-            if not limiter.acquire(tokens, remaining_timeout):
+            if wait < 0 or wait > deadline - time.monotonic():
                 return False
+            time.sleep(wait)
 
-        return True
+    async def acquire_async(
+            self,
+            tokens: int = 1,
+            timeout: float = 0,
+            identity: Optional[Dict[str, Union[str, int]]] = None
+    ) -> bool:
+        """acquire 的协程版本, 等待期间不阻塞事件循环"""
+        deadline = time.monotonic() + timeout
+
+        while True:
+            allowed, _, _, wait = await asyncio.to_thread(self.try_acquire, tokens, identity)
+            if allowed:
+                return True
+
+            if wait < 0 or wait > deadline - time.monotonic():
+                return False
+            await asyncio.sleep(wait)
 
 multi_limiter = MultiLevelRateLimiter()
 
 for limiter in conf.limiters:
     multi_limiter.add_limiter(
         rate=limiter.rate,
-        capacity=limiter.capacity,
-        namespace=limiter.namespace
+        capacity=limiter.cap,
+        namespace=limiter.namespace,
+        key=limiter.key,
+        lease=limiter.lease,
+        algorithm=limiter.algorithm
     )
\ No newline at end of file
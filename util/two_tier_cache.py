@@ -0,0 +1,199 @@
+import json
+import logging
+import os
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Callable, Optional, Tuple
+
+from util.connection_registry import connection_registry
+
+logger = logging.getLogger(__name__)
+
+
+class TwoTierCache:
+    """
+    两级读穿缓存: 进程内 LRU + Redis
+
+    读取顺序为 本地 -> Redis -> loader, 值需可 JSON 序列化;
+    写操作调用 invalidate 删除 Redis 中的键并通过 pub/sub 通知所有节点丢弃本地副本,
+    本地 TTL 较短, 作为丢失失效消息时的兜底.
+    键数量不固定的一类缓存(如分页结果)可归入同一分组, 按分组整体失效.
+    每次失效递增命名空间的代数, 回填时代数已变化说明加载期间发生了失效, 放弃回填以免写入旧数据
+    """
+
+    # Lua脚本: 代数未变化时回填缓存并记录分组成员
+    STORE_SCRIPT = """
+    local generation_key = KEYS[1]
+    local redis_key = KEYS[2]
+    local group_key = KEYS[3]
+    local generation = ARGV[1]
+    local value = ARGV[2]
+    local ttl = tonumber(ARGV[3])
+
+    if (redis.call('get', generation_key) or '0') ~= generation then
+        return 0
+    end
+    redis.call('set', redis_key, value, 'EX', ttl)
+    if group_key then
+        redis.call('sadd', group_key, redis_key)
+        redis.call('expire', group_key, ttl)
+    end
+    return 1
+    """
+
+    def __init__(
+            self,
+            namespace: str,
+            local_ttl: float = 5.0,  # 本地缓存有效期, 秒
+            redis_ttl: int = 60,  # Redis 缓存有效期, 秒
+            max_size: int = 1024  # 本地缓存最大条目数
+    ):
+        self.namespace = namespace
+        self.local_ttl = local_ttl
+        self.redis_ttl = redis_ttl
+        self.max_size = max_size
+        self.channel = f'{namespace}:invalidate'
+        self.generation_key = f'{namespace}:generation'
+        self.redis_client = connection_registry.redis(decode_responses=True)
+        self._store_script = self.redis_client.register_script(self.STORE_SCRIPT)
+
+        self._local = OrderedDict()
+        self._lock = threading.Lock()
+        self._listener_pid = None
+
+    def _get_redis_key(self, key: str) -> str:
+        return f'{self.namespace}:{key}'
+
+    def _get_group_key(self, group: str) -> str:
+        return f'{self.namespace}:group:{group}'
+
+    def _get_local(self, key: str) -> Any:
+        with self._lock:
+            entry = self._local.get(key)
+            if entry is None:
+                return None
+            expire_at, _, value = entry
+            if expire_at < time.monotonic():
+                del self._local[key]
+                return None
+            self._local.move_to_end(key)
+            return value
+
+    def _set_local(self, key: str, value: Any, group: Optional[str] = None):
+        with self._lock:
+            self._local[key] = (time.monotonic() + self.local_ttl, group, value)
+            self._local.move_to_end(key)
+            while len(self._local) > self.max_size:
+                self._local.popitem(last=False)
+
+    def _drop_local(self, keys=(), groups=()):
+        with self._lock:
+            for key in keys:
+                self._local.pop(key, None)
+            if groups:
+                for key in [key for key, entry in self._local.items() if entry[1] in groups]:
+                    del self._local[key]
+
+    def _ensure_listener(self):
+        # 订阅线程不会随 fork 复制到子进程, 按 pid 判断是否需要启动
+        if self._listener_pid == os.getpid():
+            return
+        with self._lock:
+            if self._listener_pid == os.getpid():
+                return
+            self._local.clear()
+            pubsub = self.redis_client.pubsub(ignore_subscribe_messages=True)
+            pubsub.subscribe(**{self.channel: self._on_invalidate})
+            pubsub.run_in_thread(sleep_time=1.0, daemon=True, exception_handler=self._on_listener_error)
+            self._listener_pid = os.getpid()
+
+    def _on_invalidate(self, message):
+        data = json.loads(message['data'])
+        self._drop_local(data['keys'], data['groups'])
+
+    def _on_listener_error(self, e, pubsub, thread):
+        # 连接断开期间可能错过失效消息, 清空本地缓存后由 pubsub 自动重连
+        logger.error(f"缓存失效订阅异常: {e}")
+        with self._lock:
+            self._local.clear()
+
+    def lookup(self, key: str, group: Optional[str] = None) -> Tuple[Any, Optional[str]]:
+        """
+        只读取缓存, 不加载
+
+        Returns:
+            Tuple[Any, Optional[str]]: (缓存值, 读取时的代数), 未命中时缓存值为None, 代数用于随后的 store;
+            命中本地缓存或 Redis 不可用时代数为None
+        """
+        self._ensure_listener()
+
+        value = self._get_local(key)
+        if value is not None:
+            return value, None
+
+        redis_key = self._get_redis_key(key)
+        try:
+            with self.redis_client.pipeline(transaction=False) as pipe:
+                pipe.get(redis_key)
+                pipe.get(self.generation_key)
+                cached, generation = pipe.execute()
+        except Exception as e:
+            logger.error(f"读取缓存 {redis_key} 失败: {e}")
+            return None, None
+        if cached is not None:
+            value = json.loads(cached)
+            self._set_local(key, value, group)
+            return value, None
+        return None, generation or '0'
+
+    def store(self, key: str, value: Any, generation: Optional[str], group: Optional[str] = None) -> bool:
+        """回填缓存, lookup 之后发生过失效(代数变化)时放弃回填"""
+        if generation is None:
+            return False
+        redis_key = self._get_redis_key(key)
+        keys = [self.generation_key, redis_key]
+        if group is not None:
+            # 记录分组成员, 分组失效时据此删除
+            keys.append(self._get_group_key(group))
+        try:
+            stored = self._store_script(keys=keys, args=[generation, json.dumps(value), self.redis_ttl])
+        except Exception as e:
+            logger.error(f"写入缓存 {redis_key} 失败: {e}")
+            return False
+        if stored:
+            self._set_local(key, value, group)
+        return bool(stored)
+
+    def get(self, key: str, loader: Callable[[], Any], group: Optional[str] = None) -> Any:
+        """读取缓存, 未命中时调用 loader 加载并回填; loader 返回 None 时不缓存"""
+        value, generation = self.lookup(key, group)
+        if value is not None:
+            return value
+
+        value = loader()
+        if value is not None:
+            self.store(key, value, generation, group)
+        return value
+
+    def invalidate(self, *keys: str, groups=()) -> bool:
+        """删除缓存(及整个分组)并通知所有节点丢弃本地副本"""
+        keys, groups = list(keys), list(groups)
+        self._drop_local(keys, groups)
+        try:
+            redis_keys = [self._get_redis_key(key) for key in keys]
+            for group in groups:
+                group_key = self._get_group_key(group)
+                redis_keys.extend(self.redis_client.smembers(group_key))
+                redis_keys.append(group_key)
+            with self.redis_client.pipeline() as pipe:
+                if redis_keys:
+                    pipe.delete(*redis_keys)
+                # 使加载中的回填失效
+                pipe.incr(self.generation_key)
+                pipe.publish(self.channel, json.dumps({'keys': keys, 'groups': groups}))
+                pipe.execute()
+            return True
+        except Exception as e:
+            logger.error(f"缓存失效失败: {e}")
+            return False